@@ -1,13 +1,36 @@
+import os
+import time
 import streamlit as st
-from azure_connector import fetch_data
-from sidebar_filters import render_sidebar_filters
-from azure_connector import fetch_data
-import plotly.express as px
+from azure_connector import get_connection_pool, get_query_cache
+from data_loader import IncrementalLoader, fetch_filtered_data
+from detail_table import MemoryPager, SqlPager, render_detail_table
+from timeline_panel import RollupStore, fetch_rollups, render_timeline_panel
+from central_table import CrossTabCube, fetch_cube, render_central_table
+from data_export import iter_sql_chunks, iter_view_chunks, render_export
+from filter_index import FilterIndex
+from snapshot_cache import SnapshotStore
+from shared_store import SharedStore
+from perf_trace import PERF_TRACE_ENABLED, finish_trace, span, start_trace
+from kpis import KpiEngine, compute_kpis, fetch_kpis
+from patient_search import SearchIndexStore, fetch_search_index, render_patient_search
+from sidebar_filters import (
+    get_filter_options, render_filter_widgets, render_filtered_metric, render_sidebar_filters
+)
 import pandas as pd
 
+# Con TMZ_FILTER_PUSHDOWN=1 los filtros se evalúan en la base de datos y solo
+# se traen las filas seleccionadas (para tablas grandes).
+FILTER_PUSHDOWN = os.environ.get("TMZ_FILTER_PUSHDOWN") == "1"
+
 # --- 1. CONFIGURACIÓN ---
 st.set_page_config(layout="wide", page_title="Dashboard Clínico TMZ")
 
+# Trazas de rendimiento del rerun: TMZ_PERF_TRACE=1 o ?perf=1 en la URL
+perf_trace = start_trace(
+    enabled=PERF_TRACE_ENABLED or st.query_params.get("perf") == "1",
+    modo="pushdown" if FILTER_PUSHDOWN else "memoria",
+)
+
 st.markdown(
     """
     <style>
@@ -25,109 +48,216 @@ st.markdown(
 
 # --- 2. CARGA DE DATOS CON LEFT JOIN ---
 
-@st.cache_data(ttl=600)
+@st.cache_resource
+def get_incremental_loader():
+    """
+    Un cargador incremental por proceso, compartido por todas las sesiones, con su hilo de refresco.
+    Con TMZ_SHARED_DIR los procesos comparten el dataset: uno consulta la base y los demás lo mapean.
+    """
+    loader = IncrementalLoader(snapshot_store=SnapshotStore(), shared_store=SharedStore())
+    loader.start_refresher()
+    return loader
+
+
 def load_data():
-    """Carga los datos usando LEFT JOIN para incluir todos los pacientes."""
-    # LEFT JOIN: Mantiene TODAS las filas de Pacientes_tmz (tabla izquierda).
-    query = """
-    SELECT 
-        P.CEDULA, 
-        P.NOMBRE,
-        P.NOMBRE_MEDICO,
-        F.GENERO,
-        F.EDAD,
-        F.RANGO_DE_EDAD,
-        P.FECHA_DE_RECIBIDO,
-        F.FECHA_TOMA_MUESTRA,
-        P.ESTADO,
-        P.MES_DE_TOMA,
-        --F.MES,
-        F.DEPARTAMENTO, F.CIUDAD,
-        F.EPS,
-        F.RESULTADOS_A_CORTE_14_OCTUBRE_JOHN,
-        F.MUESTRA_ENVIADA_A_ESPAÑA,
-        p.OBSERVACIONES
-    FROM 
-        tmz_data.Pacientes_tmz P  -- Tabla izquierda (Todos los pacientes)
-    LEFT JOIN 
-        tmz_data.FasePaciente F ON P.CEDULA = F.PACIENTE_CEDULA;
     """
-    df_merged = fetch_data(query)
-    fecha_columna = 'FECHA_TOMA_MUESTRA'
-
-    if fecha_columna in df_merged.columns:
-        # 1. Convertir a numérico (manejar 'None' o 'NaN' como errores)
-        df_merged[fecha_columna] = pd.to_numeric(
-            df_merged[fecha_columna], 
-            errors='coerce'  # Convierte los valores no numéricos (como 'None') a NaN
-        )
-        
-        # 2. Aplicar la conversión de fecha serial de Excel
-        # La unidad es 'Días' ('D') y el origen es el 1 de enero de 1900.
-        df_merged[fecha_columna] = pd.to_datetime(
-            df_merged[fecha_columna], 
-            unit='D', 
-            origin='1899-12-30', # Excel usa el 30 de diciembre de 1899 como día 0
-            errors='coerce'
-        )
+    Carga los datos usando LEFT JOIN para incluir todos los pacientes (refresco incremental
+    en segundo plano cada 600 s: la sesión nunca espera un refresco).
+    Retorna (df, version): la versión identifica el frame para los índices precalculados.
+    """
+    try:
+        return get_incremental_loader().get_versioned()
+    except Exception as e:
+        st.error(f"Error al cargar los datos. Detalle: {e}")
+        return pd.DataFrame(), 0
 
-    COLUMNA_MES_PROGRAMACION = 'MES_DE_TOMA'
-    NUEVO_NOMBRE_MES = 'MES_PROGRAMACION'
-    
-    # Diccionario para mapear número a nombre del mes en español y mayúsculas
-    mes_map = {
-        1: 'ENERO', 2: 'FEBRERO', 3: 'MARZO', 4: 'ABRIL', 
-        5: 'MAYO', 6: 'JUNIO', 7: 'JULIO', 8: 'AGOSTO', 
-        9: 'SEPTIEMBRE', 10: 'OCTUBRE', 11: 'NOVIEMBRE', 12: 'DICIEMBRE'
-    }
 
-    if COLUMNA_MES_PROGRAMACION in df_merged.columns:
-        # Asegurarse de que sea tipo int para el mapeo, convirtiendo errores a NaN (luego a 'Sin Dato')
-        df_merged[COLUMNA_MES_PROGRAMACION] = pd.to_numeric(
-            df_merged[COLUMNA_MES_PROGRAMACION], errors='coerce'
-        ).astype('Int64') # Int64 maneja NaN con enteros
-        
-        # Aplicar el mapeo
-        df_merged[COLUMNA_MES_PROGRAMACION] = df_merged[COLUMNA_MES_PROGRAMACION].map(mes_map)
-        
-        # Renombrar la columna
-        df_merged.rename(columns={COLUMNA_MES_PROGRAMACION: NUEVO_NOMBRE_MES}, inplace=True)
-        
-        # Rellenar valores nulos (que pueden ser del LEFT JOIN o errores de conversión)
-        df_merged[NUEVO_NOMBRE_MES] = df_merged[NUEVO_NOMBRE_MES].fillna('SIN DATO')
+@st.cache_resource(max_entries=2)
+def get_filter_index(_df_data, version):
+    """Bitmaps de filtros construidos una sola vez por versión de datos (compartidos entre sesiones)."""
+    return FilterIndex(_df_data, version)
 
 
-    # Manejo de Nulos después del LEFT JOIN (los pacientes sin fase tendrán NULL aquí)
-    if 'FASE_ACTUAL' in df_merged.columns:
-         df_merged['FASE_ACTUAL'] = df_merged['FASE_ACTUAL'].fillna('Sin Fase Registrada')
-    
-    if 'FECHA_FASE' in df_merged.columns:
-         # Conversión a fecha (usando errors='coerce' para manejar nulos/errores)
-         df_merged['FECHA_FASE'] = pd.to_datetime(df_merged['FECHA_FASE'], errors='coerce')
+@st.cache_resource(max_entries=2)
+def get_kpi_engine(_df_data, version):
+    """Motor de indicadores de esa versión de datos, con su LRU de resultados por filtro."""
+    return KpiEngine(_df_data, version)
 
-    return df_merged
 
+@st.cache_resource(max_entries=8)
+def get_detail_pager(_view, version, spec):
+    """Orden de páginas de la tabla de detalle para una versión de datos y una selección."""
+    return MemoryPager(_view)
 
 
+@st.cache_resource(max_entries=2)
+def get_crosstab_cube(_df_data, version):
+    """Cubo de la tabla cruzada de esa versión de datos (compartido entre sesiones)."""
+    return CrossTabCube.from_frame(_df_data, version)
 
-# --- LLAMAR A LA FUNCIÓN DE CARGA ---
-df_data = load_data()
-df_data.rename(columns={"RESULTADOS_A_CORTE_14_OCTUBRE_JOHN": "RESULTADOS_TMZ"}, inplace=True)
-df_data.rename(columns={"MUESTRA_ENVIADA_A_ESPAÑA": "ENVIADA_A_LABORATORIO"}, inplace=True)
 
-columna_booleana = 'ENVIADA_A_LABORATORIO'
+@st.cache_resource(max_entries=4)
+def get_selection_cube(_view, version, spec):
+    """Cubo sobre las filas seleccionadas, cuando el rango de fechas recorta los datos."""
+    return CrossTabCube.from_frame(_view.to_frame(), version)
 
-if columna_booleana in df_data.columns:
-        
-    # 1. Convertir la columna al tipo booleano de Pandas (maneja nulos como False)
-    # Esto convierte TRUE/1 a True, y FALSE/0/None/NaN a False
-    df_data[columna_booleana] = df_data[columna_booleana].astype(bool)
-
-    # 2. Aplicar el mapeo limpio con el método .map()
-    df_data[columna_booleana] = df_data[columna_booleana].map({
-        True: "SÍ",  # Solo si es True estricto
-        False: "NO"  # Todo lo demás (False, None, 0, NaN)
-        })
+
+@st.cache_resource(ttl=600, max_entries=8)
+def load_cube(spec):
+    """Cubo de la selección agrupado en la base (modo con filtros en la base)."""
+    pool = get_connection_pool()
+    if pool is None:
+        return None
+    try:
+        return fetch_cube(spec, pool.dialect)
+    except Exception as e:
+        st.error(f"Error al cargar la tabla cruzada. Detalle: {e}")
+        return None
+
+
+@st.cache_resource
+def get_rollup_store():
+    """Rollups de la línea de tiempo del proceso (se actualizan con los deltas del cargador)."""
+    return RollupStore()
+
+
+@st.cache_data(ttl=600)
+def load_rollups():
+    """Rollups de la línea de tiempo calculados en la base (modo con filtros en la base)."""
+    pool = get_connection_pool()
+    if pool is None:
+        return None
+    try:
+        return fetch_rollups(pool.dialect)
+    except Exception as e:
+        st.error(f"Error al cargar la línea de tiempo. Detalle: {e}")
+        return None
+
+
+@st.cache_resource
+def get_search_store():
+    """Índice de búsqueda de pacientes del proceso (se actualiza con los deltas del cargador)."""
+    return SearchIndexStore()
+
+
+@st.cache_resource(ttl=600)
+def load_search_index():
+    """Índice de búsqueda con las columnas leídas de la base (modo con filtros en la base)."""
+    try:
+        return fetch_search_index()
+    except Exception as e:
+        st.error(f"Error al construir el índice de búsqueda. Detalle: {e}")
+        return None
+
+
+@st.cache_data(ttl=600)
+def count_filtered(spec):
+    """(filas, pacientes) de la selección contados en la base de datos, sin traer las filas."""
+    pool = get_connection_pool()
+    if pool is None:
+        return None
+    try:
+        return SqlPager(spec, pool.dialect).count()
+    except Exception as e:
+        st.error(f"Error al contar los datos filtrados. Detalle: {e}")
+        return None
+
+
+@st.cache_data(ttl=600)
+def load_filtered_data(spec):
+    """Solo las filas que cumplen el FilterSpec, filtradas en la base de datos (respaldo de los KPIs)."""
+    pool = get_connection_pool()
+    if pool is None:
+        return pd.DataFrame()
+    try:
+        return fetch_filtered_data(spec, pool.dialect)
+    except Exception as e:
+        st.error(f"Error al cargar los datos filtrados. Detalle: {e}")
+        return pd.DataFrame()
+
+
+def render_data_status(loader):
+    """Frescura y tamaño del snapshot en disco, y errores del último refresco."""
+    info = loader.snapshot_store.info() if loader.snapshot_store else None
+    if info:
+        minutos = (time.time() - info['created_at']) / 60
+        st.sidebar.caption(
+            f"📦 Snapshot: {info['rows']:,} filas · {info['bytes'] / 1e6:.1f} MB · hace {minutos:.0f} min"
+        )
+    if loader.last_mode:
+        st.sidebar.caption(f"Última carga: {loader.last_mode}")
+    dataset = loader.current
+    if len(dataset):
+        st.sidebar.caption(
+            f"🧊 Dataset compartido: versión {dataset.version} · {len(dataset):,} filas · {dataset.memory_mb:.1f} MB"
+        )
+    compartido = loader.shared_status()
+    if compartido:
+        detalle = "consulta la base y publica" if compartido['role'] == 'líder' \
+            else f"mapea el archivo del proceso {compartido['leader_pid'] or '—'}"
+        tamano = f" · {compartido['bytes'] / 1e6:.1f} MB" if compartido['bytes'] else ""
+        st.sidebar.caption(f"🔗 Almacén compartido: {compartido['role']} ({detalle}){tamano}")
+    if loader.memory_report:
+        st.sidebar.caption(
+            f"💾 Memoria: {loader.memory_report['antes_mb']:.1f} MB → {loader.memory_report['despues_mb']:.1f} MB"
+        )
+    render_refresh_status(loader.refresh_status())
+
+
+def _hace(segundos):
+    return f"{segundos / 60:.0f} min" if segundos >= 60 else f"{segundos:.0f} s"
+
+
+def render_refresh_status(estado):
+    """Intervalo, último y próximo refresco en segundo plano, y el último error."""
+    partes = [f"🔁 Refresco cada {_hace(estado['interval'])}"]
+    if estado['last_refresh']:
+        ultimo = f"último hace {_hace(time.time() - estado['last_refresh'])}"
+        if estado['last_seconds'] is not None:
+            ultimo += f" ({estado['last_seconds']:.1f} s)"
+        partes.append(ultimo)
+    if estado['refreshing']:
+        partes.append("⏳ actualizando (se muestra la versión anterior)")
+    elif estado['next_in'] is not None:
+        partes.append(f"próximo en {_hace(estado['next_in'])}")
+    st.sidebar.caption(" · ".join(partes))
+
+    if estado['last_error']:
+        cuando = f" (hace {_hace(time.time() - estado['last_error_at'])}, {estado['failures']} fallo(s) seguidos)" \
+            if estado['last_error_at'] else ""
+        st.sidebar.warning(estado['last_error'] + cuando)
+
+
+def render_perf_panel(resumen):
+    """Panel de depuración: etapas del rerun con latencia, filas y variación de memoria."""
+    if resumen is None:
+        return
+    with st.sidebar.expander(f"⏱️ Rendimiento ({resumen['seconds'] * 1000:.0f} ms)"):
+        st.dataframe(
+            pd.DataFrame([
+                {
+                    'etapa': '\u00a0\u00a0' * s['depth'] + s['name'],
+                    'ms': None if s['seconds'] is None else round(s['seconds'] * 1000, 1),
+                    'filas': s['rows'],
+                    'Δ MB': s['mem_delta_mb'],
+                }
+                for s in resumen['spans']
+            ]),
+            hide_index=True,
+            use_container_width=True,
+        )
+        cache = get_query_cache().stats()
+        acierto = f"{cache['hit_rate']:.0%}" if cache['hit_rate'] is not None else "—"
+        st.caption(
+            f"Caché de consultas: {cache['entries']} entradas · {cache['bytes'] / 1e6:.1f} de "
+            f"{cache['max_bytes'] / 1e6:.0f} MB · aciertos {cache['hits']} / fallos {cache['misses']} ({acierto}) · "
+            f"descartes {cache['evictions']} · invalidaciones {cache['invalidations']}"
+        )
+
+
+# --- RESINCRONIZACIÓN COMPLETA A PEDIDO ---
+if st.sidebar.button("🔄 Resincronizar datos"):
+    get_incremental_loader().refresh(force_full=True)
 # -----------------------------------------------------------------
 # 3. INTERFAZ Y VISUALIZACIONES
 # -----------------------------------------------------------------
@@ -140,56 +270,71 @@ st.caption("Pacientes - tamizaje")
 col_g1, col_g2, col_g3, col_g4 = st.columns(4)
 
 
-df_filtered = render_sidebar_filters(df_data)
+# --- LLAMAR A LA FUNCIÓN DE CARGA ---
+if FILTER_PUSHDOWN:
+    # Filtro en la base: opciones por SELECT DISTINCT, conteos por COUNT y la tabla por páginas
+    with span('filtros.widgets'):
+        spec = render_filter_widgets(get_filter_options())
+    with span('count_filtered'):
+        counts = count_filtered(spec)
+    render_filtered_metric(counts[1] if counts else 0)
+    pool = get_connection_pool()
+    pager = SqlPager(spec, pool.dialect) if counts and pool is not None else None
+    pager_signature = spec
+    export = (lambda: iter_sql_chunks(spec, pool), counts[0]) if pager is not None else None
+    with span('timeline.rollups'):
+        rollups = load_rollups()
+    with span('tabla_cruzada.cubo'):
+        cube = load_cube(spec)
+    with span('busqueda.indice'):
+        search_index = load_search_index()
+    view = None
+    kpi_engine = None
+else:
+    # El frame es compartido entre sesiones: no se modifica en el lugar.
+    with span('load_data') as s:
+        df_data, version = load_data()
+        s.set_rows(len(df_data))
+    with span('sidebar_filters'):
+        view, spec = render_sidebar_filters(df_data, get_filter_index(df_data, version))
+    with span('kpis.motor'):
+        kpi_engine = get_kpi_engine(df_data, version)
+    with span('timeline.rollups'):
+        rollups = get_rollup_store().get(df_data, version, get_incremental_loader().last_delta)
+    with span('tabla_cruzada.cubo'):
+        cube = get_crosstab_cube(df_data, version)
+        if not cube.covers(spec):
+            cube = get_selection_cube(view, version, spec)
+    with span('busqueda.indice'):
+        search_index = get_search_store().get(df_data, version, get_incremental_loader().last_delta)
+    pager = get_detail_pager(view, version, spec)
+    pager_signature = (version, spec)
+    export = (lambda: iter_view_chunks(view), len(view))
+    counts = None
+    render_data_status(get_incremental_loader())
 
 #  >>>>>> KPIs <<<<<<
 # --- EN app.py (Reemplaza la función def render_kpis(df):) ---
 
-def render_kpis(df):
-    
-    # 1. Crear un DataFrame de pacientes ÚNICOS dentro del set filtrado
-    df_unicos = df.drop_duplicates(subset=['CEDULA'])
+def render_kpis(view, spec, kpi_engine=None):
     
     # ======== Cálculos de Indicadores por Paciente Único ========
-    total_pacientes_unicos = df_unicos["CEDULA"].nunique()
-
-    # 2. Tamizaje Realizado
-    realizado_tamizaje = df_unicos[df_unicos["ESTADO"] == "REALIZADO"].shape[0]
-
-    # 3. Pacientes con Resultados
-    # Asume que un resultado existe si la columna no es nula y no está vacía
-    if "RESULTADOS_TMZ" in df_unicos.columns:
-        
-        # 1. Definir la condición de EXCLUSIÓN total:
-        
-        # a) Es nulo o None
-        is_null = df_unicos["RESULTADOS_TMZ"].isna()
-        
-        # b) Es una cadena vacía (después de convertir a string para manejar posibles tipos)
-        is_empty = (df_unicos["RESULTADOS_TMZ"].astype(str) == '')
-        
-        # c) Contiene "Pendiente de reporte" (solo en los que tienen algún valor string)
-        is_pending = df_unicos["RESULTADOS_TMZ"].astype(str).str.contains("Pendiente de reporte", case=False, na=False)
-        
-        # 2. Combinar las condiciones de exclusión: (Nulo O Vacío O Pendiente)
-        is_excluded = is_null | is_empty | is_pending
-        
-        # 3. Contar los que NO cumplen la condición de exclusión (usando el operador de inversión ~)
-        con_resultados = df_unicos[~is_excluded].shape[0]
-        
-    else:
-        con_resultados = 0
-        
-    # 4. Enviados a Laboratorio (usa el valor 'SÍ' que mapeamos)
-    if "ENVIADA_A_LABORATORIO" in df_unicos.columns:
-        enviados_lab = df_unicos[df_unicos["ENVIADA_A_LABORATORIO"] == "SÍ"].shape[0]
+    # 1. Con el frame en memoria: motor vectorizado, memorizado por versión + filtros.
+    # 2. Con filtros en la base: COUNT DISTINCT con la selección como parámetros;
+    #    si la consulta falla, se calculan en pandas sobre el set filtrado.
+    if kpi_engine is not None:
+        kpis = kpi_engine.kpis(spec, view.rows)
     else:
-        enviados_lab = 0
-        
-    # 5. Desglose por Género
-    genero_counts = df_unicos["GENERO"].value_counts()
-    genero_f = genero_counts.get('F', 0)
-    genero_m = genero_counts.get('M', 0)
+        kpis = fetch_kpis(spec)
+        if kpis is None:
+            kpis = compute_kpis(view.to_frame() if view is not None else load_filtered_data(spec))
+
+    total_pacientes_unicos = kpis['total_pacientes']
+    realizado_tamizaje = kpis['realizado_tamizaje']
+    con_resultados = kpis['con_resultados']
+    enviados_lab = kpis['enviados_lab']
+    genero_f = kpis['genero_f']
+    genero_m = kpis['genero_m']
     
     # ======== Mostrar KPIs con Streamlit (4 columnas) ========
     st.markdown("### 📊 Indicadores Generales (Pacientes Únicos)")
@@ -223,15 +368,38 @@ def render_kpis(df):
     #    st.metric("📅 Programados", programados)
 
 # Llamada a la función (¡CRÍTICO!)
-# Nota: La función debe ser llamada después de definirla y después de df_filtered.
+# Nota: La función debe ser llamada después de definirla y después de view.
 
-render_kpis(df_data)
+with span('render_kpis'):
+    render_kpis(view, spec, kpi_engine)
+
+if rollups is not None:
+    with span('timeline.graficos'):
+        render_timeline_panel(rollups, spec)
+
+if cube is not None:
+    with span('tabla_cruzada'):
+        render_central_table(cube, spec)
+
+if search_index is not None:
+    with span('busqueda'):
+        render_patient_search(search_index)
 
 st.header("📑 Datos de Detalle Filtrados")
 
-# La tabla ocupa el 100% del ancho principal del contenedor.
-st.dataframe(
-    df_filtered, 
-    use_container_width=True 
-)
+# Descarga por bloques de la selección completa (se genera al pulsar el botón)
+if export is not None:
+    render_export(*export)
+
+# Solo se envía al navegador la página actual (paginación por clave sobre CEDULA).
+with span('tabla_detalle') as s:
+    if pager is None:
+        st.info("No hay datos para mostrar.")
+    else:
+        try:
+            s.set_rows(len(render_detail_table(pager, pager_signature, counts)))
+        except Exception as e:
+            st.error(f"Error al cargar la tabla de detalle. Detalle: {e}")
+
+render_perf_panel(finish_trace(perf_trace))
     
\ No newline at end of file
@@ -1,27 +1,87 @@
 # azure_connector.py
 
-import pyodbc
+import os
+
 import streamlit as st
 import pandas as pd
 
+from db_backend import create_driver, create_pool
+from perf_trace import span
+from query_cache import QueryCache
+from typed_schema import read_schema, register_schema
+
+# Variables de entorno que sobreescriben la configuración de st.secrets
+ENV_OVERRIDES = {
+    'TMZ_DB_BACKEND': 'BACKEND',
+    'TMZ_SQLITE_PATH': 'SQLITE_PATH',
+    'TMZ_POOL_SIZE': 'POOL_SIZE',
+    'TMZ_QUERY_CACHE_MB': 'QUERY_CACHE_MB',
+}
+
+# Caché de fetch_data: presupuesto de memoria por proceso y vigencia de cada resultado
+DEFAULT_QUERY_CACHE_MB = 64
+QUERY_CACHE_TTL = 600
+
+# Marca que deja el ETL al terminar (summary_tables.rebuild_summaries): si cambia,
+# otro proceso cargó datos nuevos y los resultados guardados ya no valen.
+ETL_STAMP_QUERY = "SELECT * FROM tmz_data.Resumen_Estado;"
+STAMP_CHECK_SECONDS = 60
+
+
+def get_backend_settings():
+    """
+    Reúne la configuración de la base de datos:
+    - [azure_sql]: credenciales de Azure SQL (DRIVER, SERVER, DATABASE, USERNAME, PASSWORD).
+    - [database]:  BACKEND ('azure_sql' o 'sqlite'), SQLITE_PATH, POOL_SIZE, MAX_IDLE_SECONDS,
+                   QUERY_CACHE_MB.
+    Las variables TMZ_DB_BACKEND, TMZ_SQLITE_PATH, TMZ_POOL_SIZE y TMZ_QUERY_CACHE_MB tienen prioridad.
+    """
+    settings = {}
+    for section in ('azure_sql', 'database'):
+        try:
+            settings.update(st.secrets[section])
+        except Exception:
+            # Sin secrets.toml o sin la sección: se usan los valores por defecto / entorno
+            pass
+
+    for env_var, key in ENV_OVERRIDES.items():
+        if os.environ.get(env_var):
+            settings[key] = os.environ[env_var]
+    return settings
+
 
 @st.cache_resource
+def get_connection_pool():
+    """
+    Crea y cachea (uno por proceso) el pool de conexiones compartido por todas las sesiones.
+    Retorna el ConnectionPool o None en caso de error de configuración.
+    """
+    try:
+        pool = create_pool(get_backend_settings())
+    except KeyError as e:
+        st.error(f"Error de configuración: Falta la clave '{e}' en `.streamlit/secrets.toml` bajo `[azure_sql]`.")
+        return None
+    except Exception as e:
+        st.error(f"Error al configurar la base de datos. Detalle: {e}")
+        return None
+
+    # Tipos de las columnas (esquema tipado u original) para las expresiones SQL de fechas
+    try:
+        with pool.connection() as conn:
+            register_schema(read_schema(conn))
+    except Exception:
+        register_schema({})  # sin catálogo legible se asume el esquema original
+    return pool
+
+
 def get_azure_sql_connection():
     """
-    Establece y cachea la conexión a Azure SQL Database usando st.secrets.
-    Retorna el objeto de conexión pyodbc o None en caso de error.
+    Abre una conexión nueva (no compartida) con el backend configurado, para scripts
+    que gestionan su propia conexión. Retorna el objeto de conexión o None en caso de error.
+    La app debe usar get_connection_pool() en su lugar.
     """
     try:
-        # st.secrets['azure_sql'] lee las credenciales del archivo .streamlit/secrets.toml
-        conn_str = (
-            f"DRIVER={st.secrets['azure_sql']['DRIVER']};"
-            f"SERVER={st.secrets['azure_sql']['SERVER']};"
-            f"DATABASE={st.secrets['azure_sql']['DATABASE']};"
-            f"UID={st.secrets['azure_sql']['USERNAME']};"
-            f"PWD={st.secrets['azure_sql']['PASSWORD']};"
-        )
-        conn = pyodbc.connect(conn_str)
-        return conn
+        return create_driver(get_backend_settings()).connect()
     except KeyError as e:
         st.error(f"Error de configuración: Falta la clave '{e}' en `.streamlit/secrets.toml` bajo `[azure_sql]`.")
         return None
@@ -31,18 +91,46 @@ def get_azure_sql_connection():
 
 
 
-@st.cache_data(ttl=600)  # Los datos se almacenan en caché por 600 segundos
+def run_query(query, params=None):
+    """
+    Ejecuta una consulta con una conexión del pool, sin caché.
+    A diferencia de fetch_data, propaga las excepciones al llamador.
+    """
+    pool = get_connection_pool()
+    if pool is None:
+        raise RuntimeError("No hay conexión configurada con la base de datos.")
+    with span('run_query') as s, pool.connection() as conn:
+        df = pd.read_sql(query, conn, params=params)
+        s.set_rows(len(df))
+        return df
+
+
+@st.cache_resource
+def get_query_cache():
+    """Caché de resultados de fetch_data (una por proceso, compartida por todas las sesiones)."""
+    megas = float(get_backend_settings().get('QUERY_CACHE_MB', DEFAULT_QUERY_CACHE_MB))
+    return QueryCache(int(megas * 1e6), ttl=QUERY_CACHE_TTL)
+
+
+def _etl_stamp():
+    return tuple(run_query(ETL_STAMP_QUERY).astype(str).itertuples(index=False))
+
+
+def invalidate_query_cache(tables=None):
+    """Descarta los resultados guardados (todos o los que leen `tables`); para llamar tras una carga."""
+    return get_query_cache().invalidate(tables)
 
-def fetch_data(query):
+
+def fetch_data(query, params=None):
     """
-    Ejecuta una consulta SQL y retorna los resultados como un DataFrame de Pandas.
+    Ejecuta una consulta SQL con una conexión del pool y retorna los resultados como un DataFrame de Pandas.
+    `params` (tupla opcional) se enlaza a los marcadores '?' de la consulta.
+    Los resultados se guardan en la caché de consultas (ver query_cache); los errores no.
     """
-    conn = get_azure_sql_connection()
-    if conn:
-        try:
-            df = pd.read_sql(query, conn)
-            return df
-        except Exception as e:
-            st.error(f"Error al ejecutar la consulta SQL. Revisa la sintaxis de la query. Detalle: {e}")
-            return pd.DataFrame()
-    return pd.DataFrame()
\ No newline at end of file
+    cache = get_query_cache()
+    cache.check_stamp(_etl_stamp, STAMP_CHECK_SECONDS)
+    try:
+        return cache.get_or_run(query, params, run_query)
+    except Exception as e:
+        st.error(f"Error al ejecutar la consulta SQL. Revisa la sintaxis de la query. Detalle: {e}")
+        return pd.DataFrame()
@@ -0,0 +1,11 @@
+"""
+Benchmarks del pipeline del dashboard con datos sintéticos.
+
+- benchmarks.synthetic: generador de Pacientes_tmz / FasePaciente con el esquema real.
+- benchmarks.run:       suite que cronometra cada etapa contra una base SQLite local
+                        y guarda los resultados en JSON para comparar entre commits.
+
+Uso (desde la raíz del repositorio):
+    python -m benchmarks.run --rows 10000 100000
+    python -m benchmarks.run --rows 100000 --compare benchmarks/results/<anterior>.json
+"""
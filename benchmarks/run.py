@@ -0,0 +1,237 @@
+"""
+Suite de benchmarks del pipeline del dashboard contra SQLite local.
+
+Para cada tamaño (--rows = filas de FasePaciente) se genera el dataset sintético,
+se carga en una base SQLite temporal y se cronometra cada etapa:
+
+    generar, etl_insert                          (ETL)
+    consulta_join, post_process, tipado_compacto (load_data)
+    opciones_filtros, indice_filtros,
+    filtros_mascara, filtros_indice              (render_sidebar_filters)
+    kpis_motor, kpis_memoria, kpis_sql           (render_kpis)
+
+Las etapas por filtro (filtros_*, kpis_memoria, kpis_sql) son la mediana por
+selección de `--repeat` corridas sobre SELECCIONES. Los resultados se guardan en
+JSON (commit, versiones, tiempos) y `--compare` los contrasta con una corrida anterior.
+
+Uso (desde la raíz del repositorio):
+    python -m benchmarks.run --rows 10000 100000 1000000
+    python -m benchmarks.run --rows 100000 --compare benchmarks/results/<anterior>.json
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.synthetic import DEFAULT_CHUNK_SIZE, generate_tables, patient_count
+from bulk_insert import bulk_insert_dataframe
+from data_loader import FULL_QUERY, post_process
+from dataset_schema import apply_compact_dtypes
+from filter_index import FilterIndex, FilteredView
+from filter_spec import FilterSpec
+from kpis import KpiEngine, build_kpi_query, kpis_from_result
+from local_db import create_tables_from_frames, get_sqlite_connection
+from process_excel import table_templates
+from sidebar_filters import filter_options_from_frame
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+
+# Una regresión es una etapa que tarda más que este factor respecto de la referencia
+REGRESSION_FACTOR = 1.2
+# ... y además suma al menos estos segundos (las etapas de milisegundos son puro ruido)
+REGRESSION_MIN_SECONDS = 0.01
+
+SELECCIONES = {
+    'sin filtros': FilterSpec(),
+    'estado': FilterSpec(estado='REALIZADO'),
+    'rangos': FilterSpec(rangos=('De 60 a 69 años', 'De 70 a 79 años', 'Sin Dato')),
+    'fechas': FilterSpec(fecha_desde=datetime.date(2025, 3, 1), fecha_hasta=datetime.date(2025, 6, 30)),
+    'combinado': FilterSpec(estado='REALIZADO', rangos=('De 80 a 89 años',),
+                            fecha_desde=datetime.date(2025, 2, 1), fecha_hasta=datetime.date(2025, 9, 30)),
+}
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+def _max_rss_mb():
+    # ru_maxrss está en KB en Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _mediana(funcion, repeat):
+    tiempos = []
+    for _ in range(repeat):
+        inicio = time.perf_counter()
+        funcion()
+        tiempos.append(time.perf_counter() - inicio)
+    return statistics.median(tiempos)
+
+
+def _por_seleccion(funcion, repeat):
+    """Mediana de `funcion(spec)` para cada selección; se reporta la suma de las medianas."""
+    return sum(_mediana(lambda: funcion(spec), repeat) for spec in SELECCIONES.values())
+
+
+def run_size(n_fases, workdir, repeat=5, seed=0, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Cronometra todas las etapas para un tamaño. Retorna un dict serializable a JSON."""
+    stages = {}
+    db_path = os.path.join(workdir, f'bench_{n_fases}.db')
+    if os.path.exists(db_path):
+        os.remove(db_path)
+
+    conn = get_sqlite_connection(db_path)
+    create_tables_from_frames(conn, table_templates(), drop_existing=True)
+
+    # --- ETL: generación e inserción por bloques ---
+    stages['generar'] = stages['etl_insert'] = 0.0
+    bloques = generate_tables(n_fases, seed=seed, chunk_size=chunk_size)
+    while True:
+        inicio = time.perf_counter()
+        siguiente = next(bloques, None)
+        stages['generar'] += time.perf_counter() - inicio
+        if siguiente is None:
+            break
+        table_name, chunk = siguiente
+        inicio = time.perf_counter()
+        bulk_insert_dataframe(chunk, f'tmz_data.{table_name}', conn, batch_size=5000, verbose=False)
+        stages['etl_insert'] += time.perf_counter() - inicio
+
+    # --- load_data: consulta, post-proceso y tipado ---
+    inicio = time.perf_counter()
+    df_raw = pd.read_sql(FULL_QUERY, conn)
+    stages['consulta_join'] = time.perf_counter() - inicio
+
+    inicio = time.perf_counter()
+    df = post_process(df_raw)
+    stages['post_process'] = time.perf_counter() - inicio
+    del df_raw
+
+    inicio = time.perf_counter()
+    df, memoria = apply_compact_dtypes(df)
+    stages['tipado_compacto'] = time.perf_counter() - inicio
+
+    # --- render_sidebar_filters ---
+    stages['opciones_filtros'] = _mediana(lambda: filter_options_from_frame(df), 1)
+
+    inicio = time.perf_counter()
+    index = FilterIndex(df)
+    stages['indice_filtros'] = time.perf_counter() - inicio
+
+    stages['filtros_mascara'] = _por_seleccion(lambda spec: spec.apply(df)['CEDULA'].nunique(), repeat)
+    stages['filtros_indice'] = _por_seleccion(
+        lambda spec: FilteredView(df, index.select(spec)).nunique('CEDULA'), repeat
+    )
+
+    # --- render_kpis ---
+    inicio = time.perf_counter()
+    engine = KpiEngine(df)
+    stages['kpis_motor'] = time.perf_counter() - inicio
+
+    stages['kpis_memoria'] = _por_seleccion(lambda spec: engine.compute(index.select(spec)), repeat)
+
+    def kpis_sql(spec):
+        sql, params = build_kpi_query(spec, 'sqlite')
+        return kpis_from_result(pd.read_sql(sql, conn, params=params))
+    stages['kpis_sql'] = _por_seleccion(kpis_sql, max(1, repeat // 2))
+
+    conn.close()
+    os.remove(db_path)
+
+    return {
+        'rows': n_fases,
+        'pacientes': patient_count(n_fases),
+        'filas_join': len(df),
+        'memoria_mb': memoria,
+        'max_rss_mb': _max_rss_mb(),
+        'stages': {name: round(seconds, 6) for name, seconds in stages.items()},
+    }
+
+
+def compare(anterior, actual):
+    """Imprime la razón actual/anterior por etapa para los tamaños presentes en ambas corridas."""
+    previos = {r['rows']: r for r in anterior['results']}
+    regresiones = 0
+    print(f"\n== COMPARACIÓN: {anterior.get('commit')} -> {actual.get('commit')} ==")
+    for resultado in actual['results']:
+        previo = previos.get(resultado['rows'])
+        if previo is None:
+            continue
+        print(f"\n{resultado['rows']:,} filas")
+        for stage, segundos in resultado['stages'].items():
+            antes = previo['stages'].get(stage)
+            if not antes:
+                continue
+            razon = segundos / antes
+            regresion = razon > REGRESSION_FACTOR and segundos - antes > REGRESSION_MIN_SECONDS
+            marca = '❌' if regresion else '✔'
+            regresiones += regresion
+            print(f"  {marca} {stage:<18} {antes:>9.3f}s -> {segundos:>9.3f}s  ({razon:.2f}x)")
+    return regresiones
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks del pipeline con datos sintéticos (SQLite local).")
+    parser.add_argument('--rows', type=int, nargs='+', default=[10_000, 100_000],
+                        help="Filas de FasePaciente por tamaño (p. ej. 10000 100000 1000000 10000000).")
+    parser.add_argument('--repeat', type=int, default=5, help="Repeticiones de las etapas por selección.")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument('--output', help="Archivo JSON de resultados (por defecto en benchmarks/results/).")
+    parser.add_argument('--compare', metavar='JSON', help="Corrida anterior con la que comparar.")
+    args = parser.parse_args()
+
+    commit = _git_commit()
+    informe = {
+        'commit': commit,
+        'created_at': datetime.datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'numpy': np.__version__,
+        'repeat': args.repeat,
+        'seed': args.seed,
+        'results': [],
+    }
+
+    workdir = tempfile.mkdtemp(prefix='tmz_bench_')
+    for n_fases in args.rows:
+        print(f"\n== {n_fases:,} filas de FasePaciente ==")
+        resultado = run_size(n_fases, workdir, args.repeat, args.seed, args.chunk_size)
+        informe['results'].append(resultado)
+        for stage, segundos in resultado['stages'].items():
+            print(f"  {stage:<18} {segundos:>10.3f}s")
+        print(f"  {'memoria':<18} {resultado['memoria_mb']['antes_mb']:.1f} MB -> "
+              f"{resultado['memoria_mb']['despues_mb']:.1f} MB (pico del proceso {resultado['max_rss_mb']:.0f} MB)")
+
+    output = args.output
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, f"bench_{datetime.datetime.now():%Y%m%dT%H%M%S}_{commit or 'sin-commit'}.json")
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(informe, f, indent=2, ensure_ascii=False)
+    print(f"\n✔ Resultados guardados en {output}")
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            regresiones = compare(json.load(f), informe)
+        print(f"\n{'✔ Sin regresiones' if not regresiones else f'❌ {regresiones} etapas más lentas'}")
+        sys.exit(1 if regresiones else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,146 @@
+"""
+Generador de datos sintéticos con el esquema de Pacientes_tmz y FasePaciente.
+
+Reproduce lo que importa para el rendimiento del dashboard:
+- las columnas reales (tomadas de los Excel de archivos_excel),
+- FECHA_TOMA_MUESTRA como número serial de Excel (texto, a veces con fracción),
+- varios registros de fase por paciente y pacientes sin ninguna fase,
+- texto sucio en RESULTADOS_A_CORTE_14_OCTUBRE_JOHN y MUESTRA_ENVIADA_A_ESPAÑA
+  (mayúsculas/minúsculas, espacios, variantes de "Pendiente de reporte", vacíos).
+
+Los datos se producen por bloques para poder generar millones de filas sin
+tenerlas todas en memoria. Con la misma semilla el resultado es idéntico.
+"""
+
+import numpy as np
+import pandas as pd
+
+from process_excel import table_templates
+
+DEFAULT_CHUNK_SIZE = 100_000
+
+# Fases por paciente ~1.3: el 90 % de los pacientes tiene al menos una fase
+FASES_POR_PACIENTE = 1.3
+PACIENTES_CON_FASE = 0.9
+
+SERIAL_2025_01_01 = 45658   # Excel: días desde 1899-12-30
+
+NOMBRES = ['MARIA', 'JOSE', 'LUIS', 'ANA', 'CARLOS', 'ROSA', 'JORGE', 'BLANCA', 'PEDRO', 'LUZ']
+APELLIDOS = ['GOMEZ', 'RODRIGUEZ', 'MARTINEZ', 'LOPEZ', 'GARCIA', 'PEREZ', 'SANCHEZ', 'RAMIREZ']
+NOMBRES_COMPLETOS = [f'{n} {a} {b}' for n in NOMBRES for a in APELLIDOS for b in APELLIDOS]
+
+MEDICOS = ['DR. ALVAREZ', 'DRA. CASTRO', 'DR. MORENO', 'DRA. ROJAS', 'DR. VARGAS']
+
+
+def _choice(rng, valores, pesos, n):
+    pesos = np.asarray(pesos, dtype=float)
+    return rng.choice(np.array(valores, dtype=object), size=n, p=pesos / pesos.sum())
+
+
+ESTADOS = (['REALIZADO', 'PENDIENTE', 'PROGRAMADO', 'NO CONTESTA', ''], [80, 10, 5, 4, 1])
+GENEROS = (['F', 'M', '', 'SI'], [66, 32, 1.5, 0.5])
+RANGOS = (
+    ['De 18 a 29 años', 'De 30 a 39 años', 'De 40 a 49 años', 'De 50 a 59 años', 'De 60 a 69 años',
+     'De 70 a 79 años', 'De 80 a 89 años', 'Mayor de 90 años', ''],
+    [1, 2, 4, 11, 23, 33, 21, 5, 2],
+)
+RESULTADOS = (
+    ['Variante no detectada', 'M/S', 'Pendiente de reporte', 'PENDIENTE DE REPORTE ', 'pendiente de reporte (reenviar)',
+     'M/Z', 'Rechazada', 'S/S', 'M/M malton', '', ' '],
+    [84, 8, 2.5, 0.5, 0.5, 1, 0.5, 0.2, 0.1, 2.5, 0.2],
+)
+ENVIADAS = (['True', 'False', '', ' ', 'TRUE', 'si'], [76, 5, 17, 0.5, 1, 0.5])
+DEPARTAMENTOS = (
+    ['CUNDINAMARCA', 'CAUCA', 'RISARALDA', 'VALLE DEL CAUCA', 'QUINDIO', 'NARIÑO', 'ANTIOQUIA', 'ATLANTICO'],
+    [77, 4, 3, 3, 2, 2, 2, 2],
+)
+CIUDADES = (['BOGOTA', 'POPAYAN', 'PEREIRA', 'CALI', 'ARMENIA', 'PASTO', 'MEDELLIN', 'BARRANQUILLA'],
+            [77, 4, 3, 3, 2, 2, 2, 2])
+EPS = (['CAPITAL SALUD', 'NUEVA EPS', 'SALUD TOTAL', 'SANITAS', 'FAMISANAR', 'SURA', 'COOSALUD'],
+       [60, 17, 5, 4, 3, 2, 2])
+OBSERVACIONES = (
+    ['04/08/2025 CONFIRMADO 08/08/2025', 'SE REALIZA 3 INTENTOS POR LINEA Y NO CONTESTA', 'REPROGRAMADO', ''],
+    [50, 10, 10, 30],
+)
+
+
+def patient_count(n_fases):
+    return max(1, int(n_fases / FASES_POR_PACIENTE))
+
+
+def _cedulas(indices):
+    # Cédulas únicas de 8-10 dígitos, estables para un mismo índice de paciente
+    return (np.asarray(indices, dtype=np.int64) * 7919 + 10_000_000).astype(str).astype(object)
+
+
+def _frame(columnas, valores, n):
+    """DataFrame con las columnas reales; las que no se simulan van vacías."""
+    vacio = np.full(n, '', dtype=object)
+    return pd.DataFrame({col: valores.get(col, vacio) for col in columnas}, dtype=str)
+
+
+def _pacientes_chunk(rng, inicio, fin, columnas):
+    n = fin - inicio
+    dias = rng.integers(0, 330, size=n)
+    fechas = np.datetime64('2025-01-01') + dias.astype('timedelta64[D]')
+    mes = (fechas.astype('datetime64[M]').astype(int) % 12 + 1).astype(str).astype(object)
+    mes[rng.random(n) < 0.03] = ''
+
+    valores = {
+        'NOMBRE': _choice(rng, NOMBRES_COMPLETOS, np.ones(len(NOMBRES_COMPLETOS)), n),
+        'CEDULA': _cedulas(np.arange(inicio, fin)),
+        'ESTADO': _choice(rng, *ESTADOS, n),
+        'MES_DE_TOMA': mes,
+        'FECHA_DE_RECIBIDO': (np.datetime_as_string(fechas, unit='D').astype(object) + ' 00:00:00'),
+        'NOMBRE_MEDICO': _choice(rng, MEDICOS, np.ones(len(MEDICOS)), n),
+        'OBSERVACIONES': _choice(rng, *OBSERVACIONES, n),
+    }
+    return _frame(columnas, valores, n)
+
+
+def _fases_chunk(rng, inicio, fin, n_pacientes, columnas):
+    n = fin - inicio
+    filas = np.arange(inicio, fin)
+    # Las primeras filas dan una fase a cada paciente con fase; el resto se reparte al azar
+    con_fase = int(n_pacientes * PACIENTES_CON_FASE)
+    paciente = np.where(filas < con_fase, filas, rng.integers(0, max(con_fase, 1), size=n))
+
+    serial = (SERIAL_2025_01_01 + rng.integers(0, 330, size=n)).astype(object).astype(str)
+    con_hora = rng.random(n) < 0.01
+    serial[con_hora] = serial[con_hora] + '.5'
+    serial[rng.random(n) < 0.02] = ''
+
+    valores = {
+        'RESULTADO_PROGENIKA': (filas + 41_230_913_100_000).astype(str).astype(object),
+        'NOMBRES_Y_APELLIDOS': _choice(rng, NOMBRES_COMPLETOS, np.ones(len(NOMBRES_COMPLETOS)), n),
+        'PACIENTE_CEDULA': _cedulas(paciente),
+        'GENERO': _choice(rng, *GENEROS, n),
+        'EDAD': rng.integers(18, 100, size=n).astype(str).astype(object),
+        'RANGO_DE_EDAD': _choice(rng, *RANGOS, n),
+        'DEPARTAMENTO': _choice(rng, *DEPARTAMENTOS, n),
+        'CIUDAD': _choice(rng, *CIUDADES, n),
+        'EPS': _choice(rng, *EPS, n),
+        'FECHA_TOMA_MUESTRA': serial,
+        'RESULTADOS_A_CORTE_14_OCTUBRE_JOHN': _choice(rng, *RESULTADOS, n),
+        'MUESTRA_ENVIADA_A_ESPAÑA': _choice(rng, *ENVIADAS, n),
+    }
+    return _frame(columnas, valores, n)
+
+
+def generate_tables(n_fases, seed=0, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Produce (nombre_tabla, bloque) para `n_fases` filas de FasePaciente y sus
+    pacientes (~n_fases / 1.3), primero todos los pacientes (orden de la FK).
+    """
+    templates = table_templates()
+    n_pacientes = patient_count(n_fases)
+
+    for i, inicio in enumerate(range(0, n_pacientes, chunk_size)):
+        rng = np.random.default_rng([seed, 0, i])
+        fin = min(inicio + chunk_size, n_pacientes)
+        yield 'Pacientes_tmz', _pacientes_chunk(rng, inicio, fin, list(templates['Pacientes_tmz'].columns))
+
+    for i, inicio in enumerate(range(0, n_fases, chunk_size)):
+        rng = np.random.default_rng([seed, 1, i])
+        fin = min(inicio + chunk_size, n_fases)
+        yield 'FasePaciente', _fases_chunk(rng, inicio, fin, n_pacientes, list(templates['FasePaciente'].columns))
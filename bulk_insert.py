@@ -0,0 +1,117 @@
+# bulk_insert.py
+"""
+Motor de inserción masiva por lotes.
+
+Reemplaza el bucle fila a fila (`df.iterrows()` + `cursor.execute`) por envíos
+en lotes configurables:
+- 'executemany': un `executemany` por lote; en pyodbc activa `fast_executemany`
+  para que el lote viaje en un solo round-trip.
+- 'multirow':    una sentencia INSERT ... VALUES (...), (...), ... por grupo de filas,
+  para drivers sin `fast_executemany`.
+- 'rowwise':     el método anterior (una sentencia por fila), solo para comparar.
+
+Se hace commit por cada lote y se reporta el rendimiento en filas/s.
+"""
+
+import time
+
+DEFAULT_BATCH_SIZE = 1000
+
+# Límites de parámetros por sentencia: SQL Server admite 2100 y 1000 filas por VALUES;
+# SQLite compilado por defecto admite 999 variables en versiones antiguas.
+MAX_PARAMS = {'pyodbc': 2099, 'sqlite3': 999}
+MAX_ROWS_PER_VALUES = 1000
+
+METHODS = ('auto', 'executemany', 'multirow', 'rowwise')
+
+
+def _driver_name(conn):
+    """Identifica el módulo DB-API de la conexión ('pyodbc', 'sqlite3', ...)."""
+    return type(conn).__module__.split('.')[0]
+
+
+def _dataframe_rows(df):
+    """Convierte el DataFrame en tuplas nativas de Python (NaN -> None)."""
+    df_obj = df.astype(object).where(df.notna(), None)
+    return list(df_obj.itertuples(index=False, name=None))
+
+
+def _resolve_method(cursor, method):
+    if method not in METHODS:
+        raise ValueError(f"Método de inserción desconocido: '{method}'. Opciones: {METHODS}")
+    if method != 'auto':
+        return method
+    # fast_executemany solo existe en cursores pyodbc
+    return 'executemany' if hasattr(cursor, 'fast_executemany') else 'multirow'
+
+
+def _insert_batch(cursor, sql_one_row, table_name, quoted_columns, n_cols, rows, method, max_params):
+    """Envía un lote de filas con el método indicado."""
+    if method == 'executemany':
+        cursor.executemany(sql_one_row, rows)
+
+    elif method == 'rowwise':
+        for row in rows:
+            cursor.execute(sql_one_row, row)
+
+    else:  # multirow
+        rows_per_stmt = max(1, min(MAX_ROWS_PER_VALUES, max_params // n_cols))
+        row_placeholder = "(" + ", ".join(["?"] * n_cols) + ")"
+
+        for start in range(0, len(rows), rows_per_stmt):
+            chunk = rows[start:start + rows_per_stmt]
+            values = ", ".join([row_placeholder] * len(chunk))
+            params = [value for row in chunk for value in row]
+            cursor.execute(f"INSERT INTO {table_name} ({quoted_columns}) VALUES {values}", params)
+
+
+def bulk_insert_dataframe(df, table_name, conn, batch_size=DEFAULT_BATCH_SIZE, method='auto', verbose=True):
+    """
+    Inserta un DataFrame en `table_name` en lotes de `batch_size` filas,
+    haciendo commit por lote. Retorna un dict con las estadísticas de la carga.
+    """
+    stats = {'table': table_name, 'rows': 0, 'batches': 0, 'seconds': 0.0, 'rows_per_sec': 0.0}
+    if df.empty:
+        stats['method'] = method
+        return stats
+
+    cursor = conn.cursor()
+    method = _resolve_method(cursor, method)
+    stats['method'] = method
+
+    if method == 'executemany' and hasattr(cursor, 'fast_executemany'):
+        cursor.fast_executemany = True
+
+    quoted = ", ".join([f"[{col}]" for col in df.columns])
+    placeholders = ", ".join(["?"] * len(df.columns))
+    sql_one_row = f"INSERT INTO {table_name} ({quoted}) VALUES ({placeholders})"
+    max_params = MAX_PARAMS.get(_driver_name(conn), MAX_PARAMS['sqlite3'])
+
+    rows = _dataframe_rows(df)
+    start_time = time.perf_counter()
+
+    try:
+        for start in range(0, len(rows), batch_size):
+            batch = rows[start:start + batch_size]
+            _insert_batch(cursor, sql_one_row, table_name, quoted, len(df.columns), batch, method, max_params)
+            conn.commit()
+
+            stats['rows'] += len(batch)
+            stats['batches'] += 1
+    except Exception:
+        conn.rollback()
+        if verbose:
+            print(f"❌ Error en el lote {stats['batches'] + 1} de {table_name} "
+                  f"({stats['rows']} filas ya confirmadas).")
+        raise
+    finally:
+        cursor.close()
+
+    stats['seconds'] = time.perf_counter() - start_time
+    stats['rows_per_sec'] = stats['rows'] / stats['seconds'] if stats['seconds'] > 0 else float('inf')
+
+    if verbose:
+        print(f"✔ {table_name}: {stats['rows']} filas en {stats['seconds']:.2f}s "
+              f"({stats['rows_per_sec']:,.0f} filas/s, {stats['batches']} lotes de {batch_size}, método '{method}')")
+
+    return stats
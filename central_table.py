@@ -0,0 +1,312 @@
+# central_table.py
+"""
+Tabla cruzada (pivot) sobre las dimensiones categóricas del dataset:
+DEPARTAMENTO, CIUDAD, ESTADO, MES_PROGRAMACION, EPS y RANGO_DE_EDAD.
+
+Se materializa una vez por versión de datos un cubo a la granularidad más fina
+(una celda por combinación de dimensiones presente) con dos medidas:
+- Registros: filas del LEFT JOIN; aditiva, cualquier agrupación suma celdas.
+- Pacientes: pacientes distintos. Los pacientes cuyas filas caen en una sola
+  celda (la gran mayoría) se suman como cuentas por celda; solo para los que
+  tienen fases en celdas distintas se guardan los pares (celda, paciente) y se
+  deduplican al agrupar. Así los totales y subtotales son exactos.
+
+Cada consulta (dimensiones de filas/columnas, estado y rangos de la barra
+lateral, valores fijados al desglosar) agrega las celdas del cubo, no las filas,
+y se memoriza por versión en un LRU. Si el rango de fechas del filtro no cubre
+todas las fechas, el cubo se construye sobre la selección de filas.
+"""
+
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from azure_connector import run_query
+from data_loader import post_process
+from dataset_schema import SIN_DATO_RANGO, apply_compact_dtypes
+from typed_schema import date_sql
+
+# columna -> etiqueta en la interfaz
+DIMENSIONS = {
+    'DEPARTAMENTO': 'Departamento',
+    'CIUDAD': 'Ciudad',
+    'ESTADO': 'Estado',
+    'MES_PROGRAMACION': 'Mes de programación',
+    'EPS': 'EPS',
+    'RANGO_DE_EDAD': 'Rango de edad',
+}
+
+# Dimensión sugerida al desglosar un valor de la dimensión de filas
+DRILL_DOWN = {
+    'DEPARTAMENTO': 'CIUDAD',
+    'CIUDAD': 'EPS',
+    'ESTADO': 'MES_PROGRAMACION',
+    'MES_PROGRAMACION': 'ESTADO',
+    'EPS': 'DEPARTAMENTO',
+    'RANGO_DE_EDAD': 'ESTADO',
+}
+
+MEASURES = {'PACIENTES': 'Pacientes', 'REGISTROS': 'Registros'}
+TOTAL = 'Total'
+CUBE_CACHE_SIZE = 64
+
+# Dimensión interna: la fila tiene FECHA_DE_RECIBIDO válida (el filtro de fechas las excluye)
+CON_FECHA = '_CON_FECHA'
+
+# Pacientes × celdas en la base (modo con filtros en la base de datos)
+CUBE_QUERY = """
+    SELECT
+        P.CEDULA, F.DEPARTAMENTO, F.CIUDAD, P.ESTADO, P.MES_DE_TOMA, F.EPS, F.RANGO_DE_EDAD,
+        CASE WHEN {fecha} IS NULL THEN 0 ELSE 1 END AS {con_fecha},
+        COUNT(*) AS REGISTROS
+    FROM tmz_data.Pacientes_tmz P
+    LEFT JOIN tmz_data.FasePaciente F ON P.CEDULA = F.PACIENTE_CEDULA
+    {where}
+    GROUP BY
+        P.CEDULA, F.DEPARTAMENTO, F.CIUDAD, P.ESTADO, P.MES_DE_TOMA, F.EPS, F.RANGO_DE_EDAD,
+        CASE WHEN {fecha} IS NULL THEN 0 ELSE 1 END;
+"""
+
+
+def _encode(serie):
+    """Códigos y etiquetas de una dimensión (orden de categorías si es categórica; nulos = 'Sin Dato')."""
+    codes, labels = pd.factorize(serie, sort=True, use_na_sentinel=True)
+    labels = [str(v) for v in labels]
+    if (codes < 0).any():
+        if SIN_DATO_RANGO not in labels:
+            labels.append(SIN_DATO_RANGO)
+        codes = np.where(codes < 0, labels.index(SIN_DATO_RANGO), codes)
+    return codes.astype(np.int64), labels
+
+
+class CrossTabCube:
+    """Cubo de una versión de datos: celdas por combinación de dimensiones y sus medidas."""
+
+    def __init__(self, grouped, version=None, fecha_range=None, cache_size=CUBE_CACHE_SIZE):
+        """
+        `grouped`: una fila por (CEDULA, dimensiones, CON_FECHA) con la columna REGISTROS.
+        Usar from_frame() o fetch_cube() para construirlo.
+        """
+        self.version = version
+        self.fecha_range = fecha_range     # (mín, máx) de FECHA_DE_RECIBIDO en los datos
+        self.cache_size = cache_size
+        self.hits = 0
+        self.misses = 0
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+        columnas = list(DIMENSIONS) + [CON_FECHA]
+        self.labels = {}
+        codigos = []
+        for dim in columnas:
+            codes, labels = _encode(grouped[dim])
+            self.labels[dim] = labels
+            codigos.append(codes)
+
+        # Código de celda: base mixta sobre las cardinalidades de las dimensiones
+        clave = np.zeros(len(grouped), dtype=np.int64)
+        for codes, dim in zip(codigos, columnas):
+            clave = clave * len(self.labels[dim]) + codes
+        celda, claves = pd.factorize(clave, sort=True)
+        primera = np.unique(celda, return_index=True)[1]
+        self.cells = pd.DataFrame({dim: codes[primera] for dim, codes in zip(columnas, codigos)})
+        n_cells = len(claves)
+
+        registros = grouped['REGISTROS'].to_numpy(dtype=np.int64)
+        self.registros = np.bincount(celda, weights=registros, minlength=n_cells).astype(np.int64)
+
+        # Pacientes: únicos por (celda, paciente); los de una sola celda se suman por celda
+        paciente, _ = pd.factorize(grouped['CEDULA'], use_na_sentinel=True)
+        con_cedula = paciente >= 0
+        n_pacientes = paciente.max() + 1 if con_cedula.any() else 0
+        pares = np.unique(celda[con_cedula].astype(np.int64) * max(n_pacientes, 1) + paciente[con_cedula])
+        par_celda, par_paciente = pares // max(n_pacientes, 1), pares % max(n_pacientes, 1)
+        celdas_por_paciente = np.bincount(par_paciente, minlength=n_pacientes)
+        multiple = celdas_por_paciente[par_paciente] > 1
+
+        self.pacientes_simples = np.bincount(par_celda[~multiple], minlength=n_cells).astype(np.int64)
+        self.multi_celda = par_celda[multiple]
+        self.multi_paciente = par_paciente[multiple]
+        self.n_pacientes = n_pacientes
+
+    @classmethod
+    def from_frame(cls, df, version=None):
+        """Cubo desde el frame procesado (o una selección de sus filas)."""
+        fechas = pd.to_datetime(df['FECHA_DE_RECIBIDO'].astype(object), errors='coerce') \
+            if 'FECHA_DE_RECIBIDO' in df.columns else pd.Series(pd.NaT, index=df.index)
+        base = pd.DataFrame({
+            dim: (df[dim] if dim in df.columns else pd.Series(None, index=df.index, dtype=object))
+            for dim in DIMENSIONS
+        })
+        base['CEDULA'] = df['CEDULA'].astype(object) if 'CEDULA' in df.columns else None
+        base[CON_FECHA] = fechas.notna().to_numpy()
+        grouped = base.groupby(['CEDULA', *DIMENSIONS, CON_FECHA], dropna=False, observed=True) \
+            .size().rename('REGISTROS').reset_index()
+        validas = fechas.dropna()
+        fecha_range = (validas.min().date(), validas.max().date()) if not validas.empty else None
+        return cls(grouped, version, fecha_range)
+
+    def covers(self, spec):
+        """True si el rango de fechas del filtro incluye todas las fechas de los datos."""
+        if not spec.has_date_range or self.fecha_range is None:
+            return True
+        return spec.fecha_desde <= self.fecha_range[0] and spec.fecha_hasta >= self.fecha_range[1]
+
+    def _cell_mask(self, spec, fixed):
+        mask = np.ones(len(self.cells), dtype=bool)
+        if spec is not None:
+            if spec.estado:
+                mask &= self._in('ESTADO', [spec.estado])
+            if spec.rangos:
+                mask &= self._in('RANGO_DE_EDAD', spec.rangos)
+            if spec.has_date_range:
+                # Como el índice de filtros: las filas sin fecha válida quedan fuera
+                mask &= self._in(CON_FECHA, ['True'])
+        for dim, valor in (fixed or {}).items():
+            mask &= self._in(dim, [valor])
+        return mask
+
+    def _in(self, dim, valores):
+        codigos = [self.labels[dim].index(v) for v in valores if v in self.labels[dim]]
+        return self.cells[dim].isin(codigos).to_numpy()
+
+    def query(self, dims=(), spec=None, fixed=None):
+        """
+        Medidas agrupadas por `dims` para las celdas del estado/rangos de `spec`
+        y los valores de `fixed` ({dimensión: valor}, al desglosar).
+        Retorna un DataFrame con las dimensiones (etiquetas), PACIENTES y REGISTROS.
+        """
+        dims = tuple(dims)
+        key = (dims, None if spec is None else (spec.estado, spec.rangos, spec.has_date_range),
+               tuple(sorted((fixed or {}).items())))
+        with self._lock:
+            if key in self._cache:
+                self.hits += 1
+                self._cache.move_to_end(key)
+                return self._cache[key]
+            self.misses += 1
+
+        resultado = self._rollup(dims, self._cell_mask(spec, fixed))
+        with self._lock:
+            self._cache[key] = resultado
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return resultado
+
+    def _rollup(self, dims, mask):
+        celdas = np.flatnonzero(mask)
+        if dims:
+            grupo, grupos = pd.factorize(
+                pd.MultiIndex.from_frame(self.cells.iloc[celdas][list(dims)]) if len(dims) > 1
+                else self.cells[dims[0]].to_numpy()[celdas],
+                sort=True,
+            )
+        else:
+            grupo, grupos = np.zeros(len(celdas), dtype=np.int64), [()]
+        n_grupos = len(grupos)
+
+        registros = np.bincount(grupo, weights=self.registros[celdas], minlength=n_grupos)
+        pacientes = np.bincount(grupo, weights=self.pacientes_simples[celdas], minlength=n_grupos)
+
+        # Pacientes en varias celdas: se cuentan una vez por grupo
+        grupo_de_celda = np.full(len(self.cells), -1, dtype=np.int64)
+        grupo_de_celda[celdas] = grupo
+        g = grupo_de_celda[self.multi_celda]
+        sel = g >= 0
+        if sel.any():
+            unicos = np.unique(g[sel] * max(self.n_pacientes, 1) + self.multi_paciente[sel])
+            pacientes += np.bincount(unicos // max(self.n_pacientes, 1), minlength=n_grupos)
+
+        resultado = pd.DataFrame({'PACIENTES': pacientes.astype(np.int64), 'REGISTROS': registros.astype(np.int64)})
+        if dims:
+            codigos = np.array([g if isinstance(g, tuple) else (g,) for g in grupos], dtype=np.int64).reshape(n_grupos, len(dims))
+            for i, dim in enumerate(dims):
+                etiquetas = self.labels[dim]
+                resultado.insert(i, dim, pd.Categorical.from_codes(codigos[:, i], categories=etiquetas))
+            resultado = resultado[resultado['REGISTROS'] > 0].reset_index(drop=True)
+        return resultado
+
+    def pivot(self, rows, columns=None, measure='PACIENTES', spec=None, fixed=None):
+        """Tabla cruzada con totales por fila, por columna y general (todos exactos)."""
+        if columns is None or columns == rows:
+            tabla = self.query((rows,), spec, fixed).set_index(rows)[[measure]]
+            tabla.columns = [MEASURES[measure]]
+            total = self.query((), spec, fixed)[measure]
+            tabla.index = tabla.index.astype(str)
+            tabla.loc[TOTAL] = int(total.iloc[0]) if len(total) else 0
+            return tabla
+
+        celdas = self.query((rows, columns), spec, fixed)
+        tabla = celdas.pivot_table(index=rows, columns=columns, values=measure,
+                                   aggfunc='sum', fill_value=0, observed=True)
+        tabla.index = tabla.index.astype(str)
+        tabla.columns = tabla.columns.astype(str)
+
+        por_fila = self.query((rows,), spec, fixed).set_index(rows)[measure]
+        por_columna = self.query((columns,), spec, fixed).set_index(columns)[measure]
+        total = self.query((), spec, fixed)[measure]
+        por_fila.index = por_fila.index.astype(str)
+        por_columna.index = por_columna.index.astype(str)
+
+        tabla[TOTAL] = por_fila.reindex(tabla.index).fillna(0).astype(np.int64)
+        tabla.loc[TOTAL] = por_columna.reindex(tabla.columns).fillna(0).astype(np.int64)
+        tabla.loc[TOTAL, TOTAL] = int(total.iloc[0]) if len(total) else 0
+        return tabla.astype(np.int64)
+
+
+def fetch_cube(spec, dialect):
+    """Cubo de la selección agrupado en la base (modo con filtros en la base de datos)."""
+    where, params = spec.to_sql(dialect)
+    fecha = date_sql('P.FECHA_DE_RECIBIDO', dialect)
+    grouped = run_query(CUBE_QUERY.format(fecha=fecha, con_fecha=CON_FECHA, where=where), tuple(params) or None)
+    # MES_DE_TOMA -> MES_PROGRAMACION como en load_data; meses escritos distinto se vuelven a agrupar
+    grouped, _ = apply_compact_dtypes(post_process(grouped))
+    grouped[CON_FECHA] = grouped[CON_FECHA].astype(int) == 1
+    grouped = grouped.groupby(['CEDULA', *DIMENSIONS, CON_FECHA], dropna=False, observed=True)['REGISTROS'] \
+        .sum().reset_index()
+    return CrossTabCube(grouped)
+
+
+# ==========================================================
+#   INTERFAZ: PIVOT, DESGLOSE Y TOTALES
+# ==========================================================
+def render_central_table(cube, spec, key='tabla_central'):
+    """Tabla cruzada con selección de dimensiones, medida y desglose de un valor."""
+    st.markdown("### 🧮 Tabla Cruzada")
+    dims = list(DIMENSIONS)
+    col_filas, col_columnas, col_medida = st.columns([2, 2, 1])
+    with col_filas:
+        filas = st.selectbox("Filas", dims, format_func=DIMENSIONS.get, key=f"{key}_filas")
+    with col_columnas:
+        opciones = [None] + [d for d in dims if d != filas]
+        columnas = st.selectbox("Columnas", opciones, index=opciones.index('ESTADO') if 'ESTADO' in opciones else 0,
+                                format_func=lambda d: '(ninguna)' if d is None else DIMENSIONS[d],
+                                key=f"{key}_columnas")
+    with col_medida:
+        medida = st.radio("Medida", list(MEASURES), format_func=MEASURES.get, key=f"{key}_medida")
+
+    st.dataframe(cube.pivot(filas, columnas, medida, spec), use_container_width=True)
+
+    # --- Desglose: un valor de la dimensión de filas por otra dimensión ---
+    valores = cube.query((filas,), spec)[filas].astype(str).tolist()
+    col_valor, col_por = st.columns(2)
+    with col_valor:
+        valor = st.selectbox(f"Desglosar {DIMENSIONS[filas].lower()}", [None] + valores,
+                             format_func=lambda v: '(ninguno)' if v is None else v, key=f"{key}_valor")
+    if valor is None:
+        return
+    with col_por:
+        otras = [d for d in dims if d != filas]
+        sugerida = DRILL_DOWN.get(filas)
+        por = st.selectbox("por", otras, index=otras.index(sugerida) if sugerida in otras else 0,
+                           format_func=DIMENSIONS.get, key=f"{key}_por")
+
+    st.caption(f"{DIMENSIONS[filas]}: {valor}")
+    st.dataframe(
+        cube.pivot(por, columnas if columnas != por else None, medida, spec, fixed={filas: valor}),
+        use_container_width=True,
+    )
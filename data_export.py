@@ -0,0 +1,180 @@
+# data_export.py
+"""
+Exportación de la selección filtrada ("Datos de Detalle Filtrados") a CSV,
+Parquet o Excel (XLSX).
+
+Copiar desde el st.dataframe falla con selecciones grandes. Aquí las filas se
+recorren por bloques de EXPORT_CHUNK_ROWS con un generador y cada bloque se
+escribe al archivo antes de pedir el siguiente, sin una copia completa del
+frame filtrado:
+- en memoria: bloques de la FilteredView (solo se copian las filas del bloque);
+- con filtros en la base: la consulta del FilterSpec leída con fetchmany.
+
+El archivo se arma en un SpooledTemporaryFile (pasa a disco si supera
+SPOOL_MAX_BYTES) y solo cuando se pulsa el botón de descarga (datos diferidos
+de st.download_button), no en cada rerun; Streamlit recibe sus bytes.
+"""
+
+import io
+import tempfile
+from datetime import datetime
+
+import pandas as pd
+import streamlit as st
+from openpyxl import Workbook
+
+from data_loader import SELECT_JOIN, post_process
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pyarrow es opcional: sin él no se ofrece Parquet
+    pa = None
+
+EXPORT_CHUNK_ROWS = 5000
+SPOOL_MAX_BYTES = 32 * 1024 * 1024
+# Filas de datos por hoja de Excel (1.048.576 menos el encabezado)
+XLSX_MAX_ROWS = 1_048_575
+
+# etiqueta -> (extensión, tipo MIME)
+FORMATS = {
+    'CSV': ('csv', 'text/csv'),
+    'Parquet': ('parquet', 'application/vnd.apache.parquet'),
+    'Excel (XLSX)': ('xlsx', 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'),
+}
+
+
+# ==========================================================
+#   BLOQUES DE FILAS
+# ==========================================================
+def iter_view_chunks(view, chunk_size=EXPORT_CHUNK_ROWS):
+    """Bloques de la selección en memoria (FilteredView), en el orden del frame."""
+    for inicio in range(0, len(view), chunk_size):
+        fin = inicio + chunk_size
+        yield view.df.iloc[inicio:fin] if view.rows is None else view.df.iloc[view.rows[inicio:fin]]
+
+
+def iter_sql_chunks(spec, pool, chunk_size=EXPORT_CHUNK_ROWS):
+    """
+    Bloques de las filas que cumplen el FilterSpec, leídos de la base sin traer el
+    resultado completo. La conexión del pool se reserva mientras se consume el generador.
+    """
+    where, params = spec.to_sql(pool.dialect)
+    with pool.connection() as conn:
+        for chunk in pd.read_sql(SELECT_JOIN + where + ";", conn, params=tuple(params) or None,
+                                 chunksize=chunk_size):
+            yield post_process(chunk)
+
+
+def _stable_types(chunk):
+    """
+    Tipos iguales en todos los bloques: categorías como texto (cada bloque de la base
+    trae sus propias categorías) y números enteros como Int64 (un NULL no los vuelve float).
+    """
+    for col in chunk.columns:
+        serie = chunk[col]
+        if isinstance(serie.dtype, pd.CategoricalDtype):
+            chunk[col] = serie.astype(object).where(serie.notna(), None)
+        elif pd.api.types.is_float_dtype(serie) and (serie.dropna() % 1 == 0).all():
+            chunk[col] = serie.astype('Int64')
+    return chunk
+
+
+# ==========================================================
+#   ESCRITORES (un bloque a la vez)
+# ==========================================================
+def write_csv(chunks, out):
+    # utf-8-sig: Excel abre el CSV con las tildes correctas
+    texto = io.TextIOWrapper(out, encoding='utf-8-sig', newline='')
+    primero = True
+    for chunk in chunks:
+        _stable_types(chunk).to_csv(texto, header=primero, index=False, date_format='%Y-%m-%d')
+        primero = False
+    texto.flush()
+    texto.detach()  # `out` sigue abierto para la descarga
+
+
+def write_parquet(chunks, out):
+    writer = None
+    try:
+        for chunk in chunks:
+            if writer is None:
+                schema = pa.Schema.from_pandas(_stable_types(chunk), preserve_index=False)
+                # Una columna sin datos en el primer bloque se exporta como texto
+                schema = pa.schema([
+                    field.with_type(pa.string()) if pa.types.is_null(field.type) else field for field in schema
+                ])
+                writer = pq.ParquetWriter(out, schema)
+            else:
+                _stable_types(chunk)
+            writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False))
+    finally:
+        if writer is not None:
+            writer.close()
+
+
+def write_xlsx(chunks, out):
+    # write_only: openpyxl escribe las filas al archivo temporal sin mantener las celdas en memoria
+    wb = Workbook(write_only=True)
+    hoja, filas = None, 0
+    for chunk in chunks:
+        _stable_types(chunk)
+        valores = chunk.astype(object).where(chunk.notna(), None)
+        for fila in valores.itertuples(index=False, name=None):
+            if hoja is None or filas == XLSX_MAX_ROWS:
+                hoja = wb.create_sheet(f"Datos {len(wb.worksheets) + 1}" if hoja else "Datos")
+                hoja.append(list(chunk.columns))
+                filas = 0
+            hoja.append(fila)
+            filas += 1
+    if hoja is None:
+        wb.create_sheet("Datos")
+    wb.save(out)
+
+
+WRITERS = {'csv': write_csv, 'parquet': write_parquet, 'xlsx': write_xlsx}
+
+
+def export_file(chunks, extension):
+    """
+    Escribe los bloques en el formato de `extension` y retorna el archivo como bytes
+    (st.download_button no acepta un SpooledTemporaryFile).
+    """
+    with tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_BYTES) as out:
+        WRITERS[extension](chunks, out)
+        out.seek(0)
+        return out.read()
+
+
+def deferred_export(make_chunks, extension):
+    """Datos diferidos de st.download_button: el archivo se arma al pulsar el botón."""
+    return lambda: export_file(make_chunks(), extension)
+
+
+def available_formats():
+    return [etiqueta for etiqueta, (extension, _) in FORMATS.items() if extension != 'parquet' or pa is not None]
+
+
+# ==========================================================
+#   INTERFAZ
+# ==========================================================
+def render_export(make_chunks, filas, key='exportar'):
+    """
+    Selector de formato y botón de descarga de la selección (`filas` filas).
+    `make_chunks()` crea el generador de bloques; se llama al pulsar el botón,
+    fuera del rerun, así que no debe usar st.* (el pool se pasa ya resuelto).
+    """
+    col_formato, col_boton = st.columns([2, 1])
+    with col_formato:
+        formato = st.selectbox("Formato de exportación", available_formats(), key=f"{key}_formato")
+    extension, mime = FORMATS[formato]
+    with col_boton:
+        st.download_button(
+            f"⬇️ Descargar {filas:,} filas",
+            data=deferred_export(make_chunks, extension),
+            file_name=f"tmz_filtrado_{datetime.now():%Y%m%d_%H%M}.{extension}",
+            mime=mime,
+            on_click='ignore',
+            disabled=filas == 0,
+            key=f"{key}_boton",
+        )
@@ -0,0 +1,550 @@
+# data_loader.py
+"""
+Carga del dataset del dashboard (Pacientes_tmz LEFT JOIN FasePaciente) con refresco incremental.
+
+La primera carga trae la consulta completa. Las siguientes solo piden los pacientes
+cuyas filas (en Pacientes_tmz o en FasePaciente) cambiaron desde la última marca de
+agua (columna ROWVERSION `VERSION_FILA`) y reemplazan esos pacientes en el frame
+cacheado. Se hace una resincronización completa solo a pedido o si cambia el esquema.
+Si las tablas no tienen la columna de marca de agua, cada refresco es una carga completa.
+
+Los refrescos no bloquean a las sesiones (stale-while-revalidate): un hilo recarga
+el dataset REFRESH_AHEAD_SECONDS antes de que venza y publica la versión nueva de
+una sola vez; mientras tanto, y si el refresco falla, se sigue sirviendo la anterior.
+Solo la primera carga del proceso (sin snapshot en disco) espera a la base.
+
+Con varios procesos y un almacén compartido (shared_store, TMZ_SHARED_DIR) solo
+el proceso líder consulta la base; los demás mapean la versión que publica.
+
+Para activarlo en tablas ya creadas:
+    ALTER TABLE tmz_data.Pacientes_tmz ADD VERSION_FILA ROWVERSION;
+    ALTER TABLE tmz_data.FasePaciente ADD VERSION_FILA ROWVERSION;
+"""
+
+import threading
+import time
+
+import pandas as pd
+
+from azure_connector import run_query
+from dataset_schema import MESES, SIN_DATO_MES, apply_compact_dtypes
+from perf_trace import span
+from shared_dataset import SharedDataset
+from shared_store import SHARED_POLL_SECONDS, SHARED_WAIT_SECONDS
+from typed_schema import INT_COLUMNS, parse_dates
+
+WATERMARK_COLUMN = 'VERSION_FILA'
+REFRESH_SECONDS = 600
+# El hilo de refresco recarga este margen antes de que venzan los datos
+REFRESH_AHEAD_SECONDS = 60
+# Espera tras un refresco fallido (se duplica con cada fallo seguido, hasta refresh_seconds)
+RETRY_SECONDS = 30
+
+# LEFT JOIN: Mantiene TODAS las filas de Pacientes_tmz (tabla izquierda).
+SELECT_JOIN = """
+    SELECT
+        P.CEDULA,
+        P.NOMBRE,
+        P.NOMBRE_MEDICO,
+        F.GENERO,
+        F.EDAD,
+        F.RANGO_DE_EDAD,
+        P.FECHA_DE_RECIBIDO,
+        F.FECHA_TOMA_MUESTRA,
+        P.ESTADO,
+        P.MES_DE_TOMA,
+        --F.MES,
+        F.DEPARTAMENTO, F.CIUDAD,
+        F.EPS,
+        F.RESULTADOS_A_CORTE_14_OCTUBRE_JOHN,
+        F.MUESTRA_ENVIADA_A_ESPAÑA,
+        p.OBSERVACIONES
+    FROM
+        tmz_data.Pacientes_tmz P  -- Tabla izquierda (Todos los pacientes)
+    LEFT JOIN
+        tmz_data.FasePaciente F ON P.CEDULA = F.PACIENTE_CEDULA
+"""
+
+FULL_QUERY = SELECT_JOIN + ";"
+
+# Pacientes con cambios en cualquiera de las dos tablas desde las marcas de agua dadas
+DELTA_QUERY = SELECT_JOIN + f"""
+    WHERE P.CEDULA IN (
+        SELECT CEDULA FROM tmz_data.Pacientes_tmz WHERE {WATERMARK_COLUMN} > ?
+        UNION
+        SELECT PACIENTE_CEDULA FROM tmz_data.FasePaciente WHERE {WATERMARK_COLUMN} > ?
+    );
+"""
+
+# Los borrados no dejan marca de agua. Una fase borrada renueva el VERSION_FILA de su paciente
+# (trigger de local_db / generate_sql_script, o touch_parents de excel_sync); para lo demás
+# (pacientes borrados, bases sin el trigger) la sonda cuenta también las filas del JOIN, las
+# del frame: si tras aplicar el delta el frame no tiene ese número de filas, se recarga todo.
+WATERMARK_QUERY = f"""
+    SELECT
+        (SELECT MAX({WATERMARK_COLUMN}) FROM tmz_data.Pacientes_tmz) AS WM_PACIENTES,
+        (SELECT MAX({WATERMARK_COLUMN}) FROM tmz_data.FasePaciente) AS WM_FASES,
+        (SELECT COUNT(*) FROM tmz_data.Pacientes_tmz P
+            LEFT JOIN tmz_data.FasePaciente F ON P.CEDULA = F.PACIENTE_CEDULA) AS FILAS;
+"""
+
+# Textos que cuentan como "verdadero" en MUESTRA_ENVIADA_A_ESPAÑA (columna NVARCHAR)
+VALORES_VERDADEROS = ('TRUE', '1', 'SI', 'SÍ')
+
+# Un resultado que contiene este texto todavía no está reportado
+TEXTO_PENDIENTE = 'pendiente de reporte'
+
+# Diccionario para mapear número a nombre del mes en español y mayúsculas
+MES_MAP = dict(enumerate(MESES, start=1))
+
+
+def post_process(df_merged):
+    """Conversión de fechas seriales de Excel, mes de programación y columnas derivadas."""
+    fecha_columna = 'FECHA_TOMA_MUESTRA'
+
+    if fecha_columna in df_merged.columns:
+        # Serial de Excel en texto (esquema original) o DATE (esquema tipado);
+        # los seriales cuentan días desde el 30 de diciembre de 1899 y lo no convertible queda NaT
+        df_merged[fecha_columna] = parse_dates(df_merged[fecha_columna])
+
+    # Esquema tipado: los enteros (EDAD) llegan como float64 si hay NULL del LEFT JOIN;
+    # Int64 los conserva enteros (78, no 78.0). En el esquema original siguen como texto.
+    for columna in INT_COLUMNS:
+        if columna in df_merged.columns and pd.api.types.is_float_dtype(df_merged[columna]):
+            df_merged[columna] = df_merged[columna].astype('Int64')
+
+    COLUMNA_MES_PROGRAMACION = 'MES_DE_TOMA'
+    NUEVO_NOMBRE_MES = 'MES_PROGRAMACION'
+
+    if COLUMNA_MES_PROGRAMACION in df_merged.columns:
+        # Asegurarse de que sea tipo int para el mapeo, convirtiendo errores a NaN (luego a 'Sin Dato')
+        df_merged[COLUMNA_MES_PROGRAMACION] = pd.to_numeric(
+            df_merged[COLUMNA_MES_PROGRAMACION], errors='coerce'
+        ).astype('Int64') # Int64 maneja NaN con enteros
+
+        # Aplicar el mapeo
+        df_merged[COLUMNA_MES_PROGRAMACION] = df_merged[COLUMNA_MES_PROGRAMACION].map(MES_MAP)
+
+        # Renombrar la columna
+        df_merged = df_merged.rename(columns={COLUMNA_MES_PROGRAMACION: NUEVO_NOMBRE_MES})
+
+        # Rellenar valores nulos (que pueden ser del LEFT JOIN o errores de conversión)
+        df_merged[NUEVO_NOMBRE_MES] = df_merged[NUEVO_NOMBRE_MES].fillna(SIN_DATO_MES)
+
+
+    # Manejo de Nulos después del LEFT JOIN (los pacientes sin fase tendrán NULL aquí)
+    if 'FASE_ACTUAL' in df_merged.columns:
+         df_merged['FASE_ACTUAL'] = df_merged['FASE_ACTUAL'].fillna('Sin Fase Registrada')
+
+    if 'FECHA_FASE' in df_merged.columns:
+         # Conversión a fecha (usando errors='coerce' para manejar nulos/errores)
+         df_merged['FECHA_FASE'] = pd.to_datetime(df_merged['FECHA_FASE'], errors='coerce')
+
+    df_merged = df_merged.rename(columns={
+        "RESULTADOS_A_CORTE_14_OCTUBRE_JOHN": "RESULTADOS_TMZ",
+        "MUESTRA_ENVIADA_A_ESPAÑA": "ENVIADA_A_LABORATORIO",
+    })
+
+    columna_booleana = 'ENVIADA_A_LABORATORIO'
+
+    if columna_booleana in df_merged.columns:
+
+        # 1. Interpretar el texto como booleano: TRUE/1/SI a True, y FALSE/0/None/NaN a False
+        # (astype(bool) sobre strings marcaba 'False' como True por no ser cadena vacía)
+        es_enviada = (
+            df_merged[columna_booleana].astype(str).str.strip().str.upper().isin(VALORES_VERDADEROS)
+        )
+
+        # 2. Aplicar el mapeo limpio con el método .map()
+        df_merged[columna_booleana] = es_enviada.map({
+            True: "SÍ",  # Solo si es True estricto
+            False: "NO"  # Todo lo demás (False, None, 0, NaN)
+            })
+
+    return df_merged
+
+
+def fetch_filtered_data(spec, dialect):
+    """
+    Trae solo las filas que cumplen el FilterSpec (WHERE parametrizado en la base),
+    ya procesadas. Para tablas grandes evita cargar el frame completo.
+    """
+    where, params = spec.to_sql(dialect)
+    df_filtered, _ = apply_compact_dtypes(post_process(run_query(SELECT_JOIN + where + ";", tuple(params))))
+    return df_filtered
+
+
+class IncrementalLoader:
+    """
+    Mantiene el frame procesado y la marca de agua entre recargas.
+    Una instancia por proceso (ver app.get_incremental_loader), protegida con un lock.
+    Cada versión se publica como un SharedDataset; los lectores reciben vistas de solo lectura.
+    """
+
+    def __init__(self, refresh_seconds=REFRESH_SECONDS, snapshot_store=None, shared_store=None):
+        self.refresh_seconds = refresh_seconds
+        self.snapshot_store = snapshot_store   # SnapshotStore opcional (arranque en frío desde disco)
+        self.shared_store = shared_store       # SharedStore opcional (un solo proceso consulta la base)
+        self.shared_name = None                # Versión del almacén compartido que usa este proceso
+        self.frame = None
+        self.raw_columns = None
+        self.watermark = None          # (WM_PACIENTES, WM_FASES, FILAS) o None si no hay soporte
+        self.version = 0               # Se incrementa en cada cambio del frame
+        self.last_refresh = 0.0
+        self.last_mode = None          # 'completa', 'incremental', 'sin cambios', 'snapshot' o 'compartida'
+        self.last_error = None
+        self.last_error_at = None
+        self.failures = 0              # Refrescos en segundo plano fallidos seguidos
+        self.refreshing = False        # Hay un refresco en segundo plano en curso
+        self.last_refresh_seconds = None
+        self.memory_report = None      # Memoria antes/después del tipado compacto
+        self.last_delta = None         # Filas reemplazadas en la última recarga incremental (ver _delta_reload)
+        self.current = SharedDataset(None, 0)   # Versión publicada para lectores sin lock
+        self._lock = threading.Lock()
+        self._state_lock = threading.Lock()
+        self._refresher = None
+        self._stop = threading.Event()
+
+    def _bump_version(self):
+        self.version += 1
+        # Una sola asignación: nunca se ve un frame nuevo con la versión anterior
+        self.current = SharedDataset(self.frame, self.version)
+
+    # ------------------------------------------------------
+    #   Almacén compartido entre procesos
+    # ------------------------------------------------------
+    def _shared(self):
+        return self.shared_store is not None and self.shared_store.enabled
+
+    def _follows(self):
+        """¿Otro proceso es el líder? (si el líder murió, este intenta tomar su lugar)."""
+        return self._shared() and not self.shared_store.try_lead()
+
+    def _publish_shared(self):
+        """Líder: publica el frame para los demás procesos y pasa a usar la copia mapeada."""
+        delta = self.last_delta
+        changed = delta['added']['CEDULA'].unique() if delta and delta['to_version'] == self.version else None
+        try:
+            manifest = self.shared_store.publish(self.frame, self.version, self.watermark, self.raw_columns,
+                                                 changed=changed, previous=self.shared_name)
+            df, _ = self.shared_store.read(manifest['name'])
+        except Exception as e:
+            self.last_error = f"No se pudo publicar el dataset compartido: {e}"
+            return
+        # Misma versión y mismos datos: las sesiones pasan a leer las páginas compartidas
+        self.frame = df
+        self.shared_name = manifest['name']
+        self.current = SharedDataset(self.frame, self.version)
+
+    def _follow_shared(self):
+        """
+        Mapea la versión vigente del almacén si no es la que ya se usa.
+        Retorna True si este proceso tiene una versión del almacén (nueva o la misma).
+        """
+        name = self.shared_store.current_name()
+        if name is None:
+            return False
+        if name == self.shared_name:
+            self.last_mode = 'sin cambios'
+            return True
+        df, manifest = self.shared_store.read(name)
+        if df is None:
+            return False
+
+        # Las versiones de este proceso nunca se repiten (los índices se cachean por versión)
+        version = manifest['version'] if manifest['version'] > self.version else self.version + 1
+        delta = manifest['delta']
+        if delta is not None and self.frame is not None and delta['from'] == self.shared_name:
+            # El mismo delta que armó el líder, a partir de las cédulas reemplazadas
+            self.last_delta = {
+                'from_version': self.version,
+                'to_version': version,
+                'removed': self.frame[self.frame['CEDULA'].isin(delta['cedulas'])],
+                'added': df[df['CEDULA'].isin(delta['cedulas'])],
+            }
+        else:
+            self.last_delta = None
+
+        self.frame = df
+        self.raw_columns = manifest['raw_columns']
+        self.watermark = manifest['watermark']
+        self.shared_name = manifest['name']
+        self.version = version
+        self.current = SharedDataset(self.frame, self.version)
+        self.last_mode = 'compartida'
+        self.last_refresh = manifest['created_at']
+        return True
+
+    def _wait_for_shared(self):
+        """
+        Primera carga con almacén compartido: mapea la versión vigente. Un seguidor
+        espera a que el líder publique la primera (hasta SHARED_WAIT_SECONDS); si no
+        llega, o si este proceso es el líder y no hay ninguna, retorna False.
+        """
+        limite = time.time() + SHARED_WAIT_SECONDS
+        try:
+            self.shared_store.try_lead()
+            while not self._follow_shared():
+                if self.shared_store.try_lead() or time.time() >= limite:
+                    return False
+                time.sleep(1)
+        except Exception as e:
+            self.last_error = f"No se pudo leer el dataset compartido: {e}"
+            return False
+        return True
+
+    def shared_status(self):
+        """Rol del proceso y versión del almacén compartido (None si no hay almacén)."""
+        if not self._shared():
+            return None
+        manifest = self.shared_store.info(self.shared_name) if self.shared_name else None
+        return {
+            'role': 'líder' if self.shared_store.is_leader else 'seguidor',
+            'name': self.shared_name,
+            'bytes': manifest['bytes'] if manifest else None,
+            'leader_pid': manifest['pid'] if manifest else None,
+        }
+
+    # ------------------------------------------------------
+    #   Carga desde la base
+    # ------------------------------------------------------
+    def _read_watermark(self):
+        """Retorna la marca de agua actual o None si las tablas no la soportan (o están vacías)."""
+        try:
+            row = run_query(WATERMARK_QUERY).iloc[0]
+        except Exception:
+            return None
+
+        watermark = []
+        for value in (row['WM_PACIENTES'], row['WM_FASES'], row['FILAS']):
+            if pd.isna(value):
+                # Tabla vacía: sin marca de agua no se puede pedir un delta
+                return None
+            # Tipos nativos para poder enlazarlos como parámetros (numpy.int64 -> int)
+            watermark.append(value.item() if hasattr(value, 'item') else value)
+        return tuple(watermark)
+
+    def _full_reload(self):
+        watermark = self._read_watermark()
+        df_raw = run_query(FULL_QUERY)
+
+        self.raw_columns = list(df_raw.columns)
+        with span('load_data.post_process', rows=len(df_raw)):
+            df = post_process(df_raw)
+        with span('load_data.tipado', rows=len(df)):
+            self.frame, self.memory_report = apply_compact_dtypes(df)
+        self.watermark = watermark
+        self.last_delta = None
+        self._bump_version()
+        self.last_mode = 'completa'
+
+    def _delta_reload(self):
+        new_watermark = self._read_watermark()
+        if new_watermark is None or len(new_watermark) != len(self.watermark):
+            # La columna de marca de agua desapareció (esquema distinto) o la marca viene de
+            # un snapshot con otro formato
+            return self._full_reload()
+        if new_watermark == self.watermark:
+            self.last_mode = 'sin cambios'
+            return
+
+        wm_pacientes, wm_fases, _ = self.watermark
+        df_delta = run_query(DELTA_QUERY, (wm_pacientes, wm_fases))
+
+        if list(df_delta.columns) != self.raw_columns:
+            # Deriva de esquema: el merge no es seguro, se recarga todo
+            return self._full_reload()
+
+        with span('load_data.post_process', rows=len(df_delta)):
+            df_delta = post_process(df_delta)
+        changed = df_delta['CEDULA'].unique()
+
+        # Se reemplazan todas las filas de los pacientes modificados (paciente + sus fases)
+        keep = self.frame[~self.frame['CEDULA'].isin(changed)]
+        if len(keep) + len(df_delta) != new_watermark[2]:
+            # Hubo pacientes o fases borrados que el delta no trae
+            return self._full_reload()
+
+        # Para los agregados que se actualizan por diferencia (p. ej. rollups de la línea de tiempo)
+        self.last_delta = {
+            'from_version': self.version,
+            'to_version': self.version + 1,
+            'removed': self.frame[self.frame['CEDULA'].isin(changed)],
+            'added': df_delta,
+        }
+
+        # Tras el concat las categorías pueden no coincidir: se vuelve a tipar con la unión
+        with span('load_data.merge', rows=len(keep) + len(df_delta)):
+            self.frame, self.memory_report = apply_compact_dtypes(pd.concat([keep, df_delta], ignore_index=True))
+        self.watermark = new_watermark
+        self._bump_version()
+        self.last_mode = 'incremental'
+
+    def _load_snapshot(self):
+        """Carga el último snapshot en disco; retorna True si había uno legible."""
+        try:
+            df, manifest = self.snapshot_store.read()
+        except Exception as e:
+            self.last_error = f"No se pudo leer el snapshot: {e}"
+            return False
+        if df is None:
+            return False
+
+        self.frame, self.memory_report = apply_compact_dtypes(df)
+        self.raw_columns = manifest.get('raw_columns')
+        self.last_delta = None
+        self.watermark = manifest.get('watermark')
+        self._bump_version()
+        self.last_mode = 'snapshot'
+        # Se considera fresco para no bloquear a las sesiones: la base se consulta en segundo plano
+        self.last_refresh = time.time()
+        if self._shared() and self.shared_store.is_leader:
+            self._publish_shared()
+        return True
+
+    def _save_snapshot(self):
+        try:
+            self.snapshot_store.write(self.frame, self.watermark, self.version, self.raw_columns)
+        except Exception as e:
+            self.last_error = f"No se pudo guardar el snapshot: {e}"
+
+    def refresh(self, force_full=False):
+        """Actualiza el frame: completo si se pide o si no hay marca de agua; si no, incremental."""
+        with self._lock:
+            if self._follows():
+                if force_full:
+                    self.shared_store.request_refresh()
+                # Seguidor: el líder consulta la base y este proceso mapea lo que publica
+                if self._follow_shared():
+                    self.last_error = None
+                    return self.current.frame
+                # Sin ninguna versión publicada todavía, carga los datos por su cuenta
+            elif self._shared():
+                # Un líder recién elegido parte de la última versión publicada (delta y numeración continúan)
+                if self.frame is not None:
+                    self._follow_shared()
+                force_full = self.shared_store.take_refresh_request() or force_full
+
+            if force_full or self.frame is None or self.watermark is None:
+                self._full_reload()
+            else:
+                self._delta_reload()
+            self.last_refresh = time.time()
+            self.last_error = None
+
+            if self._shared() and self.shared_store.is_leader and self.last_mode != 'sin cambios':
+                self._publish_shared()
+            if self.snapshot_store is not None and self.last_mode != 'sin cambios':
+                self._save_snapshot()
+            return self.current.frame
+
+    def _refresh_quietly(self):
+        """Refresco en segundo plano: uno a la vez; un error se registra y se conserva la versión publicada."""
+        with self._state_lock:
+            if self.refreshing:
+                return
+            self.refreshing = True
+
+        inicio = time.time()
+        try:
+            self.refresh()
+            self.failures = 0
+        except Exception as e:
+            self.failures += 1
+            self.last_error = f"Error en el refresco en segundo plano: {e}"
+            self.last_error_at = time.time()
+        finally:
+            self.last_refresh_seconds = time.time() - inicio
+            self.refreshing = False
+
+    def refresh_in_background(self):
+        if not self.refreshing:
+            threading.Thread(target=self._refresh_quietly, name="tmz-refresh", daemon=True).start()
+
+    def next_refresh_in(self):
+        """Segundos hasta el próximo refresco del hilo (antes del vencimiento o tras un fallo)."""
+        if self.failures:
+            espera = min(RETRY_SECONDS * 2 ** (self.failures - 1), self.refresh_seconds)
+            return max(0.0, self.last_error_at + espera - time.time())
+        margen = min(REFRESH_AHEAD_SECONDS, self.refresh_seconds / 2)
+        return max(0.0, self.last_refresh + self.refresh_seconds - margen - time.time())
+
+    def _shared_pending(self):
+        """Con almacén compartido el seguidor revisa en cada vuelta; el líder, si se pidió resincronizar."""
+        if not self._shared():
+            return False
+        return not self.shared_store.is_leader or self.shared_store.refresh_requested()
+
+    def _refresher_loop(self):
+        while True:
+            espera = self.next_refresh_in()
+            if self._shared():
+                espera = min(espera, SHARED_POLL_SECONDS)
+            if self._stop.wait(max(1.0, espera)):
+                break
+            # La primera carga la hace la sesión que llega primero (get_dataset)
+            if self.frame is not None and (self.next_refresh_in() <= 0 or self._shared_pending()):
+                self._refresh_quietly()
+
+    def start_refresher(self):
+        """Inicia (una sola vez) el hilo que recarga el dataset antes de que venza."""
+        with self._state_lock:
+            if self._refresher is not None and self._refresher.is_alive():
+                return
+            self._stop.clear()
+            self._refresher = threading.Thread(target=self._refresher_loop, name="tmz-refresher", daemon=True)
+            self._refresher.start()
+
+    def stop_refresher(self):
+        self._stop.set()
+
+    def refresh_status(self):
+        """Estado del refresco para la interfaz (intervalo, último, próximo, errores)."""
+        return {
+            'interval': self.refresh_seconds,
+            'last_refresh': self.last_refresh or None,
+            'last_seconds': self.last_refresh_seconds,
+            'next_in': self.next_refresh_in() if self._refresher is not None and self._refresher.is_alive() else None,
+            'refreshing': self.refreshing,
+            'failures': self.failures,
+            'last_error': self.last_error,
+            'last_error_at': self.last_error_at,
+        }
+
+    def get_dataset(self):
+        """
+        Retorna el SharedDataset publicado. Solo espera a la base en la primera carga;
+        si los datos vencieron, se sirven igual y se refrescan en segundo plano.
+        """
+        if self.frame is None and self._shared():
+            with self._lock:
+                loaded = self.frame is None and self._wait_for_shared()
+            if loaded:
+                if self.shared_store.is_leader:
+                    # El líder retoma la última versión publicada y se pone al día con la base
+                    self.refresh_in_background()
+                return self.current
+
+        if self.frame is None and self.snapshot_store is not None:
+            with self._lock:
+                loaded = self.frame is None and self._load_snapshot()
+            if loaded:
+                # Arranque en frío: se sirve el snapshot y la base se consulta en segundo plano
+                self.refresh_in_background()
+                return self.current
+
+        if self.frame is None:
+            self.refresh()
+        elif time.time() - self.last_refresh > self.refresh_seconds and self.next_refresh_in() <= 0:
+            # Vencidos, pero tras un fallo se respeta la espera creciente de next_refresh_in()
+            self.refresh_in_background()
+        return self.current
+
+    def get(self):
+        """Vista de solo lectura del frame publicado (ver SharedDataset.frame)."""
+        return self.get_dataset().frame
+
+    def get_versioned(self):
+        """Como get(), pero retorna (frame, version) consistentes entre sí (para índices por versión)."""
+        dataset = self.get_dataset()
+        return dataset.frame, dataset.version
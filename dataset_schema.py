@@ -0,0 +1,98 @@
+# dataset_schema.py
+"""
+Tipado compacto del dataset del dashboard.
+
+Las columnas de baja cardinalidad llegan de la base como strings de Python
+(dtype object/str), lo que infla la memoria y hace lentos los ==, isin y
+value_counts de los filtros y KPIs. Este esquema las convierte una sola vez
+a categorías de pandas, con orden estable para meses y rangos de edad. El
+resto del texto queda en arrays de Arrow (sin un objeto de Python por celda e
+inmutables, lo que permite compartir el frame entre sesiones sin copiarlo).
+"""
+
+import re
+
+import numpy as np
+import pandas as pd
+
+MESES = [
+    'ENERO', 'FEBRERO', 'MARZO', 'ABRIL', 'MAYO', 'JUNIO',
+    'JULIO', 'AGOSTO', 'SEPTIEMBRE', 'OCTUBRE', 'NOVIEMBRE', 'DICIEMBRE',
+]
+SIN_DATO_MES = 'SIN DATO'
+SIN_DATO_RANGO = 'Sin Dato'
+
+
+def _orden_rangos(valores):
+    """Ordena 'De 18 a 29 años' ... 'Mayor de 90 años' por la primera edad; 'Sin Dato' al final."""
+    def clave(rango):
+        edad = re.search(r'\d+', rango)
+        return (rango == SIN_DATO_RANGO, int(edad.group()) if edad else float('inf'), rango)
+    return sorted(set(valores) | {SIN_DATO_RANGO}, key=clave)
+
+
+def _orden_meses(valores):
+    extras = sorted(set(valores) - set(MESES) - {SIN_DATO_MES})
+    return MESES + extras + [SIN_DATO_MES]
+
+
+# Texto respaldado por Arrow con NaN como nulo (el dtype 'str' de pandas 3); None sin pyarrow
+try:
+    TEXT_DTYPE = pd.StringDtype('pyarrow', na_value=np.nan)
+except TypeError:  # pandas < 2.3
+    TEXT_DTYPE = pd.StringDtype('pyarrow_numpy')
+except ImportError:  # pyarrow es opcional: el texto queda como objetos de Python
+    TEXT_DTYPE = None
+
+# columna -> orden de categorías (None = alfabético, sin orden semántico)
+CATEGORY_SCHEMA = {
+    'ESTADO': None,
+    'GENERO': None,
+    'DEPARTAMENTO': None,
+    'CIUDAD': None,
+    'EPS': None,
+    'RANGO_DE_EDAD': _orden_rangos,
+    'MES_PROGRAMACION': _orden_meses,
+    'ENVIADA_A_LABORATORIO': lambda valores: ['NO', 'SÍ'],
+}
+
+
+def memory_mb(df):
+    return df.memory_usage(deep=True).sum() / 1e6
+
+
+def _is_text(serie):
+    """Columna de texto (las columnas object con fechas o números de la base se dejan como están)."""
+    if isinstance(serie.dtype, pd.StringDtype):
+        return True
+    return serie.dtype == object and pd.api.types.infer_dtype(serie, skipna=True) in ('string', 'empty')
+
+
+def apply_compact_dtypes(df):
+    """
+    Convierte las columnas del esquema a categorías y el resto del texto a
+    TEXT_DTYPE. Es idempotente: un frame ya tipado (o uno con categorías
+    mezcladas tras un concat) se vuelve a tipar con la unión de valores.
+    Retorna (df, reporte) con la memoria antes/después.
+    """
+    antes = memory_mb(df)
+    df = df.copy(deep=False)
+
+    for col, orden in CATEGORY_SCHEMA.items():
+        if col not in df.columns:
+            continue
+        # Los nulos se conservan como NaN (no son una categoría); el resto se normaliza a texto
+        serie = df[col].astype(object)
+        texto = serie.where(serie.isna(), serie.astype(str))
+        valores = texto.dropna().unique().tolist()
+
+        categorias = orden(valores) if orden else sorted(valores)
+        df[col] = pd.Categorical(texto, categories=categorias, ordered=orden is not None)
+
+    if TEXT_DTYPE is not None:
+        for col in df.columns:
+            if col not in CATEGORY_SCHEMA and _is_text(df[col]):
+                df[col] = df[col].astype(TEXT_DTYPE)
+
+    reporte = {'antes_mb': float(antes), 'despues_mb': float(memory_mb(df))}
+    return df, reporte
@@ -0,0 +1,211 @@
+# db_backend.py
+"""
+Backends de base de datos y pool de conexiones thread-safe.
+
+Cada driver sabe abrir y validar conexiones de un motor concreto:
+- AzureSQLDriver: Azure SQL Database vía pyodbc (producción).
+- SQLiteDriver:   base local con el esquema `tmz_data` adjunto (pruebas y trabajo offline).
+
+`ConnectionPool` reparte esas conexiones entre sesiones e hilos: cada hilo toma
+una conexión (checkout), la usa en exclusiva y la devuelve. El pool está acotado,
+valida las conexiones antes de entregarlas y descarta las que llevan demasiado
+tiempo inactivas.
+"""
+
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+DEFAULT_POOL_SIZE = 5
+DEFAULT_MAX_IDLE_SECONDS = 300
+DEFAULT_CHECKOUT_TIMEOUT = 30
+
+
+class PoolTimeoutError(Exception):
+    """No se liberó ninguna conexión del pool dentro del tiempo de espera."""
+
+
+# --- Drivers ---
+
+class AzureSQLDriver:
+    """Conexiones pyodbc a Azure SQL Database."""
+
+    name = 'azure_sql'
+    dialect = 'mssql'
+    # Admite varias conexiones escribiendo a la vez (cargas en paralelo)
+    concurrent_writes = True
+
+    def __init__(self, settings):
+        # KeyError si falta alguna credencial: lo reporta quien construye el driver
+        self.conn_str = (
+            f"DRIVER={settings['DRIVER']};"
+            f"SERVER={settings['SERVER']};"
+            f"DATABASE={settings['DATABASE']};"
+            f"UID={settings['USERNAME']};"
+            f"PWD={settings['PASSWORD']};"
+        )
+
+    def connect(self):
+        # Import diferido: el backend local no necesita pyodbc ni el driver ODBC instalados
+        import pyodbc
+        return pyodbc.connect(self.conn_str)
+
+    def ping(self, conn):
+        cursor = conn.cursor()
+        cursor.execute("SELECT 1")
+        cursor.fetchone()
+        cursor.close()
+
+
+class SQLiteDriver:
+    """Conexiones a la base SQLite local (ver local_db.py)."""
+
+    name = 'sqlite'
+    dialect = 'sqlite'
+    # SQLite admite un solo escritor: las cargas en paralelo se serializan
+    concurrent_writes = False
+
+    def __init__(self, settings):
+        from local_db import DEFAULT_SQLITE_PATH
+        self.path = settings.get('SQLITE_PATH', DEFAULT_SQLITE_PATH)
+
+    def connect(self):
+        from local_db import get_sqlite_connection
+        # El pool garantiza que solo un hilo a la vez usa cada conexión
+        return get_sqlite_connection(self.path, check_same_thread=False)
+
+    def ping(self, conn):
+        conn.execute("SELECT 1").fetchone()
+
+
+DRIVERS = {
+    AzureSQLDriver.name: AzureSQLDriver,
+    SQLiteDriver.name: SQLiteDriver,
+}
+
+
+def create_driver(settings):
+    """Construye el driver indicado por settings['BACKEND'] (por defecto Azure SQL)."""
+    backend = settings.get('BACKEND', AzureSQLDriver.name)
+    if backend not in DRIVERS:
+        raise ValueError(f"Backend desconocido: '{backend}'. Opciones: {list(DRIVERS)}")
+    return DRIVERS[backend](settings)
+
+
+# --- Pool de conexiones ---
+
+class ConnectionPool:
+    """Pool acotado de conexiones con checkout/devolución, health check y expiración por inactividad."""
+
+    def __init__(self, driver, max_size=DEFAULT_POOL_SIZE, max_idle_seconds=DEFAULT_MAX_IDLE_SECONDS,
+                 checkout_timeout=DEFAULT_CHECKOUT_TIMEOUT):
+        self.driver = driver
+        self.max_size = max_size
+        self.max_idle_seconds = max_idle_seconds
+        self.checkout_timeout = checkout_timeout
+
+        self._slots = threading.BoundedSemaphore(max_size)
+        self._lock = threading.Lock()
+        self._idle = deque()  # (conexión, instante de devolución)
+        self._in_use = 0
+
+    @property
+    def dialect(self):
+        return self.driver.dialect
+
+    def _close_quietly(self, conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _evict_expired(self):
+        """Cierra las conexiones inactivas por más de max_idle_seconds (llamar con el lock tomado)."""
+        now = time.monotonic()
+        keep = deque()
+        while self._idle:
+            conn, returned_at = self._idle.popleft()
+            if now - returned_at > self.max_idle_seconds:
+                self._close_quietly(conn)
+            else:
+                keep.append((conn, returned_at))
+        self._idle = keep
+
+    def acquire(self, timeout=None):
+        """Toma una conexión del pool (o abre una nueva) y la reserva para el hilo actual."""
+        timeout = self.checkout_timeout if timeout is None else timeout
+        if not self._slots.acquire(timeout=timeout):
+            raise PoolTimeoutError(f"Sin conexiones libres tras {timeout}s (máximo {self.max_size}).")
+
+        try:
+            while True:
+                with self._lock:
+                    self._evict_expired()
+                    conn = self._idle.pop()[0] if self._idle else None
+
+                if conn is None:
+                    conn = self.driver.connect()
+                    break
+
+                # Health check: una conexión caída se descarta y se prueba la siguiente
+                try:
+                    self.driver.ping(conn)
+                    break
+                except Exception:
+                    self._close_quietly(conn)
+        except Exception:
+            self._slots.release()
+            raise
+
+        with self._lock:
+            self._in_use += 1
+        return conn
+
+    def release(self, conn, discard=False):
+        """Devuelve la conexión al pool; con discard=True se cierra en lugar de reutilizarse."""
+        if not discard:
+            try:
+                # Deja la conexión limpia para el siguiente usuario
+                conn.rollback()
+            except Exception:
+                discard = True
+
+        with self._lock:
+            self._in_use -= 1
+            if discard:
+                self._close_quietly(conn)
+            else:
+                self._idle.append((conn, time.monotonic()))
+        self._slots.release()
+
+    @contextmanager
+    def connection(self, timeout=None):
+        """Uso: `with pool.connection() as conn: ...` (la conexión vuelve al pool al salir)."""
+        conn = self.acquire(timeout)
+        try:
+            yield conn
+        finally:
+            # release() hace rollback; si ni eso funciona, la conexión se descarta
+            self.release(conn)
+
+    def close_all(self):
+        """Cierra las conexiones inactivas (las que están en uso se cierran al devolverse)."""
+        with self._lock:
+            while self._idle:
+                self._close_quietly(self._idle.popleft()[0])
+
+    def stats(self):
+        with self._lock:
+            return {'backend': self.driver.name, 'in_use': self._in_use,
+                    'idle': len(self._idle), 'max_size': self.max_size}
+
+
+def create_pool(settings):
+    """Crea el pool según la configuración (BACKEND, POOL_SIZE, MAX_IDLE_SECONDS y credenciales)."""
+    driver = create_driver(settings)
+    return ConnectionPool(
+        driver,
+        max_size=int(settings.get('POOL_SIZE', DEFAULT_POOL_SIZE)),
+        max_idle_seconds=float(settings.get('MAX_IDLE_SECONDS', DEFAULT_MAX_IDLE_SECONDS)),
+    )
@@ -1,7 +1,10 @@
-import pandas as pd
 import streamlit as st
 import azure_connector
-from azure_connector import get_azure_sql_connection
+from azure_connector import get_backend_settings, get_connection_pool, invalidate_query_cache
+from excel_sync import HashManifest, manifest_target, sync_tables
+from local_db import create_tables_from_frames
+from process_excel import DEFAULT_CHUNK_SIZE, iter_excel_chunks
+from summary_tables import rebuild_summaries
 
 
 
@@ -42,6 +45,11 @@ def clean_and_normalize_dataframe(df, table_name):
     st.info(f"Eliminadas {initial_cols - len(df.columns)} columnas 'UNNAMED' en {table_name}.")
 
     # 3. Renombramientos específicos para el esquema
+    return apply_schema_renames(df, table_name)
+
+
+def apply_schema_renames(df, table_name):
+    """Renombramientos específicos del esquema sobre columnas ya normalizadas."""
     if table_name == 'Pacientes_tmz':
         df = df.rename(columns={
             'FECHA_DE_PROGRAMACION_DE_CITA': 'FECHA_PROG_CITA',
@@ -70,50 +78,66 @@ def clean_and_normalize_dataframe(df, table_name):
 def setup_and_load_data():
     st.title(" ETL: Carga de Datos a Azure SQL (Esquema tmz_data)")
     
-    # Intenta obtener la conexión al motor SQL
-    try:
-        engine = get_azure_sql_connection()
-        st.success("Conexión a Azure SQL establecida.")
-    except Exception as e:
-        st.error(f"Error al conectar a Azure SQL: {e}")
+    # Obtiene el pool de conexiones del backend configurado
+    pool = get_connection_pool()
+    if pool is None:
+        st.error("No se pudo configurar la conexión a la base de datos.")
         return
+    st.success(f"Pool de conexiones listo (backend: {pool.driver.name}).")
 
+    frames, templates = {}, {}
     for table_name, file_name in EXCEL_FILES.items():
         st.subheader(f"Procesando: {table_name}")
         
         try:
-            # 1. Lectura del Excel (todo como string)
-            df = pd.read_excel(file_name, dtype=str)
-            st.write(f"Filas leídas originalmente: {len(df)}")
-
-            # 2. Limpieza y Normalización
-            df_clean = clean_and_normalize_dataframe(df, table_name)
-            
-            # 3. Generación del SQL (Solo si queremos recrear la tabla)
-            # Aunque las tablas ya existen, esta línea se usa para verificación.
-            # create_sql = generate_create_table_sql(df_clean, table_name)
-            # engine.execute(create_sql) 
-            
-            # 4. Carga de Datos con Pandas to_sql
-            st.info(f"Insertando {len(df_clean)} filas en tmz_data.{table_name}...")
-            
-            # !!! EL CAMBIO CRÍTICO: ESPECIFICAR EL ESQUEMA !!!
-            df_clean.to_sql(
-                table_name, 
-                con=engine, 
-                schema='tmz_data',         # <-- Nuevo Esquema
-                if_exists='append',       # o 'replace' si quieres borrar la tabla antes
-                index=False
+            # 1. Lectura del Excel en streaming (bloques de texto con encabezados ya normalizados;
+            #    las celdas vacías quedan como NULL). sync_tables recorre los bloques sin unirlos.
+            def chunks(table_name=table_name, file_name=file_name):
+                for chunk in iter_excel_chunks(file_name, DEFAULT_CHUNK_SIZE, empty_value=None):
+                    yield apply_schema_renames(chunk, table_name)  # 2. Renombramientos del esquema
+
+            templates[table_name] = next(chunks()).iloc[:0]
+            frames[table_name] = chunks
+            st.write(f"Columnas: {list(templates[table_name].columns)}")
+
+        except (FileNotFoundError, StopIteration):
+            st.error(f"ERROR: No se encontró el archivo '{file_name}' o está vacío. Omitiendo tabla {table_name}.")
+        except Exception as e:
+            st.error(f"Error leyendo {file_name}: {e}")
+
+    if not frames:
+        return
+
+    # 3. Carga incremental: solo se envían las filas nuevas, modificadas o borradas
+    #    respecto del manifiesto de hashes de la última carga (en orden de la FK)
+    try:
+        with pool.connection() as conn:
+            if pool.dialect == 'sqlite':
+                # En la base local las tablas se crean si no existen (en Azure ya están creadas)
+                create_tables_from_frames(conn, templates)
+
+            # !!! EL CAMBIO CRÍTICO: ESPECIFICAR EL ESQUEMA (tmz_data, dentro de sync_tables) !!!
+            manifest = HashManifest(manifest_target(get_backend_settings()))
+            resultado = sync_tables(conn, frames, manifest, verbose=False)
+
+            # 4. Resúmenes materializados que lee el dashboard (en una sola transacción)
+            resumenes = rebuild_summaries(conn, pool.dialect)
+
+        # Los resultados de consultas guardados en este proceso ya no corresponden a los datos
+        invalidate_query_cache()
+
+        for table_name, s in resultado.items():
+            st.success(
+                f"tmz_data.{table_name}: {s['rows']} filas leídas; {s['inserts']} nuevas, {s['updates']} actualizadas, "
+                f"{s['deletes']} borradas, {s['replaces']} reemplazadas, {s['unchanged']} sin cambios "
+                f"({s['seconds']:.2f}s). Columnas finales: {list(templates[table_name].columns)}"
             )
-            
-            st.success(f"Carga exitosa en tmz_data.{table_name}. Columnas finales: {list(df_clean.columns)}")
+        st.success("Resúmenes actualizados: " + ", ".join(f"{t} ({n} filas)" for t, n in resumenes.items()))
 
-        except FileNotFoundError:
-            st.error(f"ERROR: No se encontró el archivo '{file_name}'. Omitiendo tabla {table_name}.")
-        except Exception as e:
-            st.error(f"Error durante la carga de {table_name}: {e}")
-            # Muestra las columnas del DF para ayudar a depurar errores de mapeo
-            st.code(f"Columnas del DF que causaron el error: {list(df_clean.columns)}")
+    except Exception as e:
+        st.error(f"Error durante la carga: {e}")
+        # Muestra las columnas de los DF para ayudar a depurar errores de mapeo
+        st.code("\n".join(f"{t}: {list(df.columns)}" for t, df in templates.items()))
 
 # if __name__ == '__main__':
 #     setup_and_load_data()
\ No newline at end of file
@@ -0,0 +1,247 @@
+# detail_table.py
+"""
+Tabla de detalle paginada ("Datos de Detalle Filtrados").
+
+En lugar de enviar al navegador todas las filas filtradas, se pagina por
+pacientes con paginación por clave (keyset): cada página son los siguientes
+`page_size` pacientes en el orden (columna de orden, CEDULA) después del último
+paciente de la página anterior, con todas sus fases. No hay OFFSET: pedir la
+página 100 cuesta lo mismo que la primera.
+
+Dos implementaciones con la misma interfaz:
+- MemoryPager: sobre la selección del índice en memoria (FilteredView); el orden
+  de los pacientes se calcula una vez por columna de orden.
+- SqlPager:    en la base de datos (filtros con pushdown), con el orden y el
+  LIMIT/TOP en la consulta y el total por COUNT, sin traer las filas.
+
+Solo se ordena por columnas de Pacientes_tmz, iguales en todas las filas del
+paciente, para que la clave (valor, CEDULA) sea única por paciente.
+"""
+
+import math
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from azure_connector import run_query
+from data_loader import SELECT_JOIN, post_process
+from dataset_schema import apply_compact_dtypes
+
+# columna de orden -> etiqueta del selector
+SORT_COLUMNS = {
+    'CEDULA': 'Cédula',
+    'NOMBRE': 'Nombre',
+    'ESTADO': 'Estado',
+    'FECHA_DE_RECIBIDO': 'Fecha de recibido',
+    'NOMBRE_MEDICO': 'Médico',
+}
+PAGE_SIZES = (25, 50, 100, 250)
+DEFAULT_PAGE_SIZE = 50
+
+FROM_JOIN = """
+    FROM tmz_data.Pacientes_tmz P
+    LEFT JOIN tmz_data.FasePaciente F ON P.CEDULA = F.PACIENTE_CEDULA
+"""
+
+COUNT_QUERY = "SELECT COUNT(*) AS FILAS, COUNT(DISTINCT P.CEDULA) AS PACIENTES" + FROM_JOIN
+
+
+def _sort_key(serie):
+    """Valor de orden como texto (igual que COALESCE(col, '') en la base)."""
+    serie = serie.astype(object)
+    return serie.where(serie.notna(), '').astype(str)
+
+
+class MemoryPager:
+    """Páginas de una FilteredView (selección del FilterIndex sobre el frame compartido)."""
+
+    def __init__(self, view):
+        self.view = view
+        self._orders = {}
+
+    def count(self):
+        """(filas, pacientes) de la selección, sin materializar el frame filtrado."""
+        return len(self.view), self.view.nunique('CEDULA')
+
+    def _order(self, sort_by):
+        """
+        Pacientes de la selección ordenados por (sort_by, CEDULA) y, para cada uno,
+        sus filas. Retorna (claves, cedulas, inicios, filas): las filas del paciente i
+        del orden son filas[inicios[i]:inicios[i + 1]].
+        """
+        if sort_by not in self._orders:
+            if 'CEDULA' not in self.view.columns:
+                vacio = np.array([], dtype=object)
+                self._orders[sort_by] = (vacio, vacio, np.zeros(1, dtype=np.int64), np.array([], dtype=np.int64))
+                return self._orders[sort_by]
+
+            rows = self.view.rows if self.view.rows is not None else np.arange(len(self.view))
+            codes, cedulas = pd.factorize(self.view.column('CEDULA'), use_na_sentinel=False)
+            cedulas = np.asarray(cedulas, dtype=object).astype(str)
+
+            if sort_by in self.view.columns and sort_by != 'CEDULA':
+                # Columna del paciente: basta con la primera fila de cada uno
+                primera = np.full(len(cedulas), -1, dtype=np.int64)
+                primera[codes[::-1]] = np.arange(len(codes))[::-1]
+                claves = _sort_key(self.view.column(sort_by)).to_numpy()[primera]
+            else:
+                claves = cedulas
+
+            orden = np.lexsort((cedulas, claves))
+            rango = np.empty(len(orden), dtype=np.int64)
+            rango[orden] = np.arange(len(orden))
+
+            # Filas agrupadas por paciente en el orden de página (estable: sus fases en el orden del frame)
+            por_paciente = np.argsort(rango[codes], kind='stable')
+            inicios = np.searchsorted(rango[codes][por_paciente], np.arange(len(orden) + 1))
+            self._orders[sort_by] = (claves[orden], cedulas[orden], inicios, rows[por_paciente])
+        return self._orders[sort_by]
+
+    def page(self, sort_by='CEDULA', descending=False, page_size=DEFAULT_PAGE_SIZE, after=None):
+        """
+        Página de `page_size` pacientes después del cursor `after` = (clave, CEDULA).
+        Retorna (df_pagina, cursor_siguiente); el cursor es None en la última página.
+        """
+        claves, cedulas, inicios, filas = self._order(sort_by)
+        n = len(cedulas)
+        if descending:
+            # Se recorre el orden al revés: la posición i descendente es n - 1 - i ascendente
+            claves, cedulas = claves[::-1], cedulas[::-1]
+
+        inicio = 0
+        if after is not None:
+            inicio = _keyset_position(claves, cedulas, after, descending)
+        fin = min(inicio + page_size, n)
+
+        posiciones = np.arange(inicio, fin)
+        if descending:
+            posiciones = n - 1 - posiciones
+        seleccion = np.concatenate([filas[inicios[i]:inicios[i + 1]] for i in posiciones]) if len(posiciones) else []
+
+        df_pagina = self.view.df.iloc[np.asarray(seleccion, dtype=np.int64)]
+        siguiente = (claves[fin - 1], cedulas[fin - 1]) if fin < n else None
+        return df_pagina, siguiente
+
+
+def _keyset_position(claves, cedulas, after, descending):
+    """Primera posición estrictamente posterior al cursor en el orden (asc. o desc.)."""
+    clave, cedula = after
+    if descending:
+        despues = (claves < clave) | ((claves == clave) & (cedulas < cedula))
+    else:
+        despues = (claves > clave) | ((claves == clave) & (cedulas > cedula))
+    posiciones = np.flatnonzero(despues)
+    return int(posiciones[0]) if len(posiciones) else len(claves)
+
+
+class SqlPager:
+    """Páginas consultadas en la base de datos con el WHERE del FilterSpec."""
+
+    def __init__(self, spec, dialect):
+        self.spec = spec
+        self.dialect = dialect
+        self.where, self.params = spec.to_sql(dialect)
+
+    def count(self):
+        df = run_query(COUNT_QUERY + self.where + ";", tuple(self.params) or None)
+        return int(df['FILAS'].iloc[0]), int(df['PACIENTES'].iloc[0])
+
+    def _page_query(self, sort_by, descending, page_size, after):
+        clave = f"COALESCE(P.{sort_by}, '')"
+        sentido = 'DESC' if descending else 'ASC'
+        condiciones, params = [], []
+
+        if self.where:
+            condiciones.append(
+                "P.CEDULA IN (SELECT P.CEDULA" + FROM_JOIN + self.where + ")"
+            )
+            params.extend(self.params)
+        if after is not None:
+            comparador = '<' if descending else '>'
+            condiciones.append(f"({clave} {comparador} ? OR ({clave} = ? AND P.CEDULA {comparador} ?))")
+            params.extend([after[0], after[0], after[1]])
+
+        where = ("WHERE " + " AND ".join(condiciones)) if condiciones else ""
+        top, limit = (f"TOP ({page_size + 1}) ", "") if self.dialect == 'mssql' else ("", f" LIMIT {page_size + 1}")
+        query = (
+            f"SELECT {top}P.CEDULA, {clave} AS CLAVE FROM tmz_data.Pacientes_tmz P {where} "
+            f"ORDER BY CLAVE {sentido}, P.CEDULA {sentido}{limit};"
+        )
+        return query, params
+
+    def page(self, sort_by='CEDULA', descending=False, page_size=DEFAULT_PAGE_SIZE, after=None):
+        """Como MemoryPager.page(): (df_pagina, cursor_siguiente)."""
+        if sort_by not in SORT_COLUMNS:
+            raise ValueError(f"Columna de orden no permitida: {sort_by}")
+
+        query, params = self._page_query(sort_by, descending, page_size, after)
+        pacientes = run_query(query, tuple(params) or None)
+        # Se pide un paciente de más para saber si hay página siguiente
+        siguiente = None
+        if len(pacientes) > page_size:
+            pacientes = pacientes.iloc[:page_size]
+            siguiente = (str(pacientes['CLAVE'].iloc[-1]), str(pacientes['CEDULA'].iloc[-1]))
+        if pacientes.empty:
+            return pd.DataFrame(), None
+
+        # Filas de esos pacientes que cumplen la selección (un paciente puede tener fases fuera de ella)
+        cedulas = pacientes['CEDULA'].astype(str).tolist()
+        marcadores = ", ".join(["?"] * len(cedulas))
+        where = (self.where + " AND" if self.where else "WHERE") + f" P.CEDULA IN ({marcadores})"
+        df_raw = run_query(SELECT_JOIN + where + ";", tuple(self.params) + tuple(cedulas))
+        df_pagina, _ = apply_compact_dtypes(post_process(df_raw))
+
+        # Mismo orden que la página de pacientes (las fases de cada uno, en el orden de la base)
+        posicion = {cedula: i for i, cedula in enumerate(cedulas)}
+        orden = df_pagina['CEDULA'].astype(str).map(posicion).to_numpy()
+        df_pagina = df_pagina.iloc[np.argsort(orden, kind='stable')].reset_index(drop=True)
+        return df_pagina, siguiente
+
+
+# ==========================================================
+#   INTERFAZ: SELECTORES, NAVEGACIÓN Y TABLA
+# ==========================================================
+def render_detail_table(pager, signature, counts=None, key='detalle'):
+    """
+    Dibuja los selectores (orden, sentido, tamaño de página), la página actual y
+    la navegación. `signature` identifica la selección (versión de datos + filtros):
+    si cambia, se vuelve a la primera página. `counts` = (filas, pacientes) si ya
+    se calcularon; si no, se piden al pager. Retorna el DataFrame de la página.
+    """
+    col_orden, col_sentido, col_tamano = st.columns([2, 1, 1])
+    with col_orden:
+        sort_by = st.selectbox("Ordenar por", list(SORT_COLUMNS), format_func=SORT_COLUMNS.get, key=f"{key}_orden")
+    with col_sentido:
+        descending = st.selectbox("Sentido", ("Ascendente", "Descendente"), key=f"{key}_sentido") == "Descendente"
+    with col_tamano:
+        page_size = st.selectbox("Pacientes por página", PAGE_SIZES,
+                                 index=PAGE_SIZES.index(DEFAULT_PAGE_SIZE), key=f"{key}_tamano")
+
+    # Pila de cursores: cursores[i] es el inicio de la página i (None = la primera)
+    firma = (signature, sort_by, descending, page_size)
+    estado = st.session_state.get(key)
+    if estado is None or estado['firma'] != firma:
+        estado = st.session_state[key] = {'firma': firma, 'cursores': [None]}
+
+    filas, pacientes = counts or pager.count()
+    paginas = max(1, math.ceil(pacientes / page_size))
+
+    df_pagina, siguiente = pager.page(sort_by, descending, page_size, estado['cursores'][-1])
+    st.dataframe(df_pagina, use_container_width=True, hide_index=True)
+
+    col_anterior, col_info, col_siguiente = st.columns([1, 3, 1])
+    with col_anterior:
+        if st.button("◀ Anterior", key=f"{key}_anterior", disabled=len(estado['cursores']) == 1):
+            estado['cursores'].pop()
+            st.rerun()
+    with col_info:
+        st.caption(
+            f"Página {len(estado['cursores'])} de {paginas} · {pacientes:,} pacientes · {filas:,} filas"
+        )
+    with col_siguiente:
+        if st.button("Siguiente ▶", key=f"{key}_siguiente", disabled=siguiente is None):
+            estado['cursores'].append(siguiente)
+            st.rerun()
+
+    return df_pagina
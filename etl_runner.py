@@ -0,0 +1,152 @@
+# etl_runner.py
+"""
+ETL en paralelo: Excel -> tmz_data.
+
+Etapas (cada una se cronometra y se resume al final):
+1. lectura:    los libros se parsean a la vez en un pool de procesos
+               (openpyxl es CPU-bound y el GIL impide hacerlo con hilos).
+2. validación: se descartan las fases cuyo paciente no está en pacientes.xlsx
+               (no se pueden insertar sin violar la FK).
+3. carga:      cada tabla se parte en bloques que se insertan en paralelo, cada
+               uno con su propia conexión del pool. Las tablas respetan el orden
+               de la FK: FasePaciente empieza cuando Pacientes_tmz terminó.
+
+Con SQLite (un solo escritor) la carga usa una conexión; la lectura sigue en paralelo.
+"""
+
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager
+
+from bulk_insert import DEFAULT_BATCH_SIZE, bulk_insert_dataframe
+from process_excel import DEFAULT_CHUNK_SIZE, filter_fases_fk, read_workbook, report_fk_omitted
+from typed_schema import convert_for_schema, read_column_types
+
+# Orden de carga que exige la FK FasePaciente.PACIENTE_CEDULA -> Pacientes_tmz.CEDULA
+LOAD_ORDER = ('Pacientes_tmz', 'FasePaciente')
+
+
+class StageTimer:
+    """Tiempos por etapa del ETL (en el orden en que se ejecutan)."""
+
+    def __init__(self):
+        self.stages = {}
+
+    @contextmanager
+    def stage(self, name):
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] = self.stages.get(name, 0.0) + time.perf_counter() - inicio
+
+    def summary(self):
+        total = sum(self.stages.values())
+        lineas = ["", "=" * 40, f"{'etapa':<24} {'segundos':>10}", "=" * 40]
+        lineas += [f"{name:<24} {seconds:>10.2f}" for name, seconds in self.stages.items()]
+        lineas += ["-" * 40, f"{'total':<24} {total:>10.2f}", "=" * 40]
+        return "\n".join(lineas)
+
+
+def read_workbooks(workers=2, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Parsea pacientes.xlsx y tmz.xlsx a la vez en procesos separados y aplica el
+    filtro de FK. Retorna (df_pacientes, df_fases).
+    """
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=min(workers, len(LOAD_ORDER))) as executor:
+            futures = {name: executor.submit(read_workbook, name, chunk_size) for name in LOAD_ORDER}
+            frames = {name: future.result() for name, future in futures.items()}
+    else:
+        frames = {name: read_workbook(name, chunk_size) for name in LOAD_ORDER}
+
+    df_pacientes, df_fases = frames['Pacientes_tmz'], frames['FasePaciente']
+    if not df_fases.empty:
+        df_fases, omitidas = filter_fases_fk(df_fases, set(df_pacientes['CEDULA']))
+        df_fases = df_fases.reset_index(drop=True)
+        report_fk_omitted(omitidas)
+    return df_pacientes, df_fases
+
+
+def _load_chunk(pool, df, table_name, batch_size, method):
+    with pool.connection() as conn:
+        return bulk_insert_dataframe(df, table_name, conn, batch_size=batch_size, method=method, verbose=False)
+
+
+def load_table_parallel(pool, df, table_name, workers=4, batch_size=DEFAULT_BATCH_SIZE, method='auto'):
+    """
+    Inserta df en `table_name` repartiendo bloques de filas entre `workers` hilos,
+    cada uno con su conexión del pool (commit por lote en cada conexión).
+    Retorna las estadísticas agregadas (como bulk_insert_dataframe).
+    """
+    if not getattr(pool.driver, 'concurrent_writes', True):
+        workers = 1
+    workers = max(1, min(workers, pool.max_size))
+
+    inicio = time.perf_counter()
+    if workers == 1 or len(df) <= batch_size:
+        stats = [_load_chunk(pool, df, table_name, batch_size, method)]
+    else:
+        # Un bloque por hilo de varios lotes: menos checkouts del pool que un lote por tarea
+        filas_por_bloque = max(batch_size, -(-len(df) // workers))
+        bloques = [df.iloc[i:i + filas_por_bloque] for i in range(0, len(df), filas_por_bloque)]
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="tmz-etl") as executor:
+            stats = list(executor.map(
+                lambda bloque: _load_chunk(pool, bloque, table_name, batch_size, method), bloques
+            ))
+
+    segundos = time.perf_counter() - inicio
+    filas = sum(s['rows'] for s in stats)
+    return {
+        'table': table_name,
+        'rows': filas,
+        'batches': sum(s['batches'] for s in stats),
+        'seconds': segundos,
+        'rows_per_sec': filas / segundos if segundos > 0 else float('inf'),
+        'method': stats[0].get('method', method),
+        'workers': workers,
+    }
+
+
+def _convert_frames(conn, frames, dialect):
+    for table_name in LOAD_ORDER:
+        types = read_column_types(conn, table_name)
+        frames[table_name] = convert_for_schema(frames[table_name], types, dialect, table_name)
+
+
+def run_parallel_load(pool, prepare_tables, workers=4, chunk_size=DEFAULT_CHUNK_SIZE,
+                      batch_size=DEFAULT_BATCH_SIZE, method='auto', timer=None):
+    """
+    Lectura en paralelo + carga completa en paralelo respetando la FK.
+    `prepare_tables(conn, frames)` crea o vacía las tablas antes de insertar.
+    """
+    timer = timer or StageTimer()
+
+    with timer.stage('lectura + validación'):
+        df_pacientes, df_fases = read_workbooks(workers, chunk_size)
+    frames = {'Pacientes_tmz': df_pacientes, 'FasePaciente': df_fases}
+
+    with timer.stage('preparar tablas'):
+        with pool.connection() as conn:
+            # Valores con los tipos de las tablas destino (fechas y enteros en el esquema tipado).
+            # Un valor no convertible detiene la carga: en Azure se convierte antes de vaciar
+            # las tablas; en SQLite después, porque se recrean con los tipos de estos datos.
+            if pool.dialect != 'sqlite':
+                _convert_frames(conn, frames, pool.dialect)
+            prepare_tables(conn, frames)
+            if pool.dialect == 'sqlite':
+                _convert_frames(conn, frames, pool.dialect)
+
+    resultados = []
+    for table_name in LOAD_ORDER:
+        if frames[table_name].empty:
+            continue
+        # Barrera por tabla: las fases solo se insertan con todos sus pacientes ya confirmados
+        with timer.stage(f'carga {table_name}'):
+            stats = load_table_parallel(pool, frames[table_name], f"tmz_data.{table_name}",
+                                        workers, batch_size, method)
+        resultados.append(stats)
+        print(f"✔ {stats['table']}: {stats['rows']} filas en {stats['seconds']:.2f}s "
+              f"({stats['rows_per_sec']:,.0f} filas/s, {stats['workers']} conexiones)")
+
+    return resultados
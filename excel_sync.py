@@ -0,0 +1,407 @@
+# excel_sync.py
+"""
+Sincronización incremental Excel -> base de datos por hash de contenido.
+
+En lugar de insertar a ciegas (duplicando filas) o vaciar y recargar las tablas,
+cada fila se resume en un hash de su contenido, agrupado por su clave:
+- Pacientes_tmz: CEDULA
+- FasePaciente:  PACIENTE_CEDULA + FECHA_TOMA_MUESTRA (una fase por toma de muestra)
+
+Los hashes de la última carga se guardan en un manifiesto (uno por base destino y
+tabla). Cada corrida compara el Excel con el manifiesto y envía solo INSERT, UPDATE
+y DELETE de las claves que cambiaron. Una clave repetida (varias filas) se
+reemplaza completa (DELETE + INSERT). Una clave NULL (p. ej. una fase sin
+FECHA_TOMA_MUESTRA) es distinta de '' y se busca con IS NULL.
+
+El manifiesto guarda también la marca de agua (VERSION_FILA) que dejó la carga:
+si la base cambió por otro camino (u otra corrida falló a medias), el manifiesto
+se descarta y se reconstruye leyendo la tabla.
+
+Estructura en disco:
+    <MANIFEST_DIR>/<destino>/
+        Pacientes_tmz.csv.gz   -> clave(s), N (filas por clave), HASH
+        Pacientes_tmz.json     -> columnas, marca de agua, formato, fecha
+"""
+
+import json
+import os
+import re
+import time
+
+import numpy as np
+import pandas as pd
+
+from bulk_insert import DEFAULT_BATCH_SIZE, bulk_insert_dataframe
+from typed_schema import connection_dialect, convert_for_schema, read_column_types
+
+DEFAULT_MANIFEST_DIR = os.environ.get('TMZ_ETL_MANIFEST_DIR', '.etl_manifest')
+SCHEMA = 'tmz_data'
+
+KEY_COLUMNS = {
+    'Pacientes_tmz': ('CEDULA',),
+    'FasePaciente': ('PACIENTE_CEDULA', 'FECHA_TOMA_MUESTRA'),
+}
+
+# Columnas gestionadas por la base (no forman parte del contenido)
+IGNORED_COLUMNS = ('VERSION_FILA',)
+
+# Orden de la FK: los DELETE van de hija a padre y los INSERT de padre a hija
+LOAD_ORDER = ('Pacientes_tmz', 'FasePaciente')
+
+# tabla hija -> (tabla padre, columna en la hija, columna en el padre)
+PARENTS = {'FasePaciente': ('Pacientes_tmz', 'PACIENTE_CEDULA', 'CEDULA')}
+
+WATERMARK_QUERY = "SELECT MAX(VERSION_FILA) FROM {table}"
+
+# Valor de una clave NULL en los resúmenes y en el manifiesto (distinto de '')
+NULL_KEY = '\\N'
+# Versión del formato del manifiesto: uno anterior se descarta y se reconstruye desde la base
+MANIFEST_FORMAT = 2
+
+
+def manifest_target(settings):
+    """Nombre de carpeta del manifiesto para la base destino configurada."""
+    if settings.get('BACKEND') == 'sqlite':
+        destino = 'sqlite_' + os.path.abspath(settings.get('SQLITE_PATH', 'tmz_local.db'))
+    else:
+        destino = f"azure_{settings.get('SERVER', '')}_{settings.get('DATABASE', '')}"
+    return re.sub(r'[^A-Za-z0-9_.-]+', '_', destino).strip('_')
+
+
+# ==========================================================
+#   HASHES Y DIFERENCIAS
+# ==========================================================
+def content_columns(df):
+    return [col for col in df.columns if col not in IGNORED_COLUMNS]
+
+
+def _key_frame(df, keys):
+    """Columnas clave como texto, con NULL_KEY en las claves nulas (un NULL no es '')."""
+    claves = df[keys].astype(object)
+    return claves.where(claves.notna(), NULL_KEY).astype(str)
+
+
+def summarize(df, table_name, columns=None):
+    """
+    Resumen por clave: N (filas con esa clave) y HASH del contenido.
+    El HASH de una clave repetida es la suma (mod 2^64) de los hashes de sus filas,
+    por lo que no depende del orden de las filas.
+    """
+    keys = list(KEY_COLUMNS[table_name])
+    columns = columns or content_columns(df)
+    # En el contenido, nulos y vacíos cuentan igual: la carga desde Excel guarda '' y la de Streamlit NULL
+    contenido = df[columns].astype(object).fillna('').astype(str)
+    hashes = pd.util.hash_pandas_object(contenido, index=False).to_numpy()
+
+    resumen = _key_frame(df, keys)
+    resumen['HASH'] = hashes
+    resumen = resumen.groupby(keys, sort=False).agg(N=('HASH', 'size'), HASH=('HASH', 'sum'))
+    resumen['HASH'] = resumen['HASH'].astype(np.uint64)
+    return resumen
+
+
+def combine_summaries(resumenes):
+    """Un resumen a partir de los resúmenes de cada bloque (una clave puede repetirse entre bloques)."""
+    if len(resumenes) == 1:
+        return resumenes[0]
+    resumen = pd.concat(resumenes)
+    resumen = resumen.groupby(level=list(range(resumen.index.nlevels)), sort=False).agg(
+        N=('N', 'sum'), HASH=('HASH', 'sum'))
+    resumen['HASH'] = resumen['HASH'].astype(np.uint64)
+    return resumen
+
+
+def diff_summaries(old, new):
+    """
+    Compara dos resúmenes (índice = clave). Retorna un dict de índices de clave:
+    inserts, deletes, updates (una fila antes y después) y replaces (claves repetidas).
+    """
+    if old is None or old.empty:
+        return {'inserts': new.index, 'deletes': new.index[:0], 'updates': new.index[:0], 'replaces': new.index[:0]}
+
+    comunes = new.index.intersection(old.index)
+    o, n = old.loc[comunes], new.loc[comunes]
+    cambiadas = comunes[(o['HASH'].to_numpy() != n['HASH'].to_numpy()) | (o['N'].to_numpy() != n['N'].to_numpy())]
+    simples = (old.loc[cambiadas, 'N'].to_numpy() == 1) & (new.loc[cambiadas, 'N'].to_numpy() == 1)
+
+    return {
+        'inserts': new.index.difference(old.index),
+        'deletes': old.index.difference(new.index),
+        'updates': cambiadas[simples],
+        'replaces': cambiadas[~simples],
+    }
+
+
+# ==========================================================
+#   MANIFIESTO EN DISCO
+# ==========================================================
+def _encode(value):
+    """La marca de agua de Azure es ROWVERSION (bytes): se guarda como hex."""
+    if isinstance(value, (bytes, bytearray)):
+        return value.hex()
+    return value.item() if hasattr(value, 'item') else value
+
+
+class HashManifest:
+    """Resúmenes (clave, N, HASH) de la última carga de cada tabla en una base destino."""
+
+    def __init__(self, target, base_dir=DEFAULT_MANIFEST_DIR):
+        self.path = os.path.join(base_dir, target)
+
+    def _files(self, table_name):
+        return (os.path.join(self.path, f'{table_name}.csv.gz'),
+                os.path.join(self.path, f'{table_name}.json'))
+
+    def load(self, table_name):
+        """Retorna (resumen, meta) o (None, None) si no hay manifiesto."""
+        datos, meta_path = self._files(table_name)
+        try:
+            with open(meta_path, encoding='utf-8') as f:
+                meta = json.load(f)
+            resumen = pd.read_csv(datos, dtype=str, keep_default_na=False)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None, None
+
+        resumen['N'] = resumen['N'].astype(int)
+        resumen['HASH'] = resumen['HASH'].astype(np.uint64)
+        return resumen.set_index(list(KEY_COLUMNS[table_name])), meta
+
+    def save(self, table_name, resumen, columns, watermark):
+        """Escribe el manifiesto de forma atómica (archivo temporal + os.replace)."""
+        os.makedirs(self.path, exist_ok=True)
+        datos, meta_path = self._files(table_name)
+
+        resumen.reset_index().to_csv(datos + '.tmp', index=False, compression='gzip')
+        os.replace(datos + '.tmp', datos)
+
+        meta = {'columns': columns, 'watermark': _encode(watermark), 'rows': int(resumen['N'].sum()),
+                'keys': len(resumen), 'format': MANIFEST_FORMAT, 'created_at': time.time()}
+        with open(meta_path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(meta, f)
+        os.replace(meta_path + '.tmp', meta_path)
+
+
+# ==========================================================
+#   APLICACIÓN DE CAMBIOS
+# ==========================================================
+def read_watermark(conn, table_name):
+    """MAX(VERSION_FILA) de la tabla, o None si la tabla no tiene la columna."""
+    cursor = conn.cursor()
+    try:
+        cursor.execute(WATERMARK_QUERY.format(table=f"{SCHEMA}.{table_name}"))
+        return cursor.fetchone()[0]
+    except Exception:
+        conn.rollback()
+        return None
+    finally:
+        cursor.close()
+
+
+def summary_from_db(conn, table_name, columns):
+    """Reconstruye el resumen leyendo la tabla (cuando no hay manifiesto o no es confiable)."""
+    quoted = ", ".join(f"[{col}]" for col in columns)
+    cursor = conn.cursor()
+    try:
+        cursor.execute(f"SELECT {quoted} FROM {SCHEMA}.{table_name}")
+        df = pd.DataFrame.from_records([tuple(row) for row in cursor.fetchall()], columns=columns)
+    finally:
+        cursor.close()
+    return summarize(df, table_name, columns)
+
+
+def _null_safe(values):
+    """Parámetros de _where_keys(): cada valor de clave dos veces (NULL_KEY -> None)."""
+    params = []
+    for value in values:
+        value = None if value is None or value == NULL_KEY else value
+        params += [value, value]
+    return tuple(params)
+
+
+def _key_params(index):
+    """Tuplas de parámetros (una por clave) para los WHERE por clave."""
+    return [_null_safe(key if isinstance(key, tuple) else (key,)) for key in index]
+
+
+def _where_keys(table_name):
+    # `[col] = ?` nunca es verdadero con NULL: la clave nula se compara con IS NULL
+    return " AND ".join(f"([{col}] = ? OR ([{col}] IS NULL AND ? IS NULL))" for col in KEY_COLUMNS[table_name])
+
+
+def _rows_for(df, table_name, index):
+    """Filas de df cuyas claves están en `index`."""
+    keys = list(KEY_COLUMNS[table_name])
+    claves = _key_frame(df, keys)
+    if len(keys) == 1:
+        return df[claves[keys[0]].isin(index)]
+    return df[pd.MultiIndex.from_frame(claves).isin(index)]
+
+
+def _execute_many(conn, sql, params, batch_size):
+    """Ejecuta `sql` por lotes y retorna las filas afectadas (cursor.rowcount)."""
+    if not params:
+        return 0
+    cursor = conn.cursor()
+    if hasattr(cursor, 'fast_executemany'):
+        cursor.fast_executemany = True
+    afectadas = 0
+    try:
+        for start in range(0, len(params), batch_size):
+            lote = params[start:start + batch_size]
+            cursor.executemany(sql, lote)
+            # Un driver que no informa el conteo (-1) cuenta el lote completo
+            afectadas += cursor.rowcount if cursor.rowcount >= 0 else len(lote)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+    return afectadas
+
+
+def delete_keys(conn, table_name, index, batch_size=DEFAULT_BATCH_SIZE):
+    """DELETE de las filas con las claves de `index`. Retorna las filas borradas."""
+    sql = f"DELETE FROM {SCHEMA}.{table_name} WHERE {_where_keys(table_name)}"
+    return _execute_many(conn, sql, _key_params(index), batch_size)
+
+
+def update_rows(conn, table_name, df_rows, columns, batch_size=DEFAULT_BATCH_SIZE):
+    """UPDATE por clave de las columnas no clave (una fila por clave). Retorna las filas actualizadas."""
+    keys = list(KEY_COLUMNS[table_name])
+    valores = [col for col in columns if col not in keys]
+    sets = ", ".join(f"[{col}] = ?" for col in valores)
+    sql = f"UPDATE {SCHEMA}.{table_name} SET {sets} WHERE {_where_keys(table_name)}"
+
+    df_obj = df_rows[valores + keys].astype(object)
+    df_obj = df_obj.where(df_obj.notna(), None)
+    params = [
+        fila[:len(valores)] + _null_safe(fila[len(valores):])
+        for fila in df_obj.itertuples(index=False, name=None)
+    ]
+    return _execute_many(conn, sql, params, batch_size)
+
+
+def touch_parents(conn, table_name, parent_keys, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    UPDATE sin cambios sobre los padres de filas hijas borradas: renueva su
+    VERSION_FILA para que el refresco incremental del dashboard vuelva a leerlos.
+    """
+    parent, _, parent_col = PARENTS[table_name]
+    sql = f"UPDATE {SCHEMA}.{parent} SET [{parent_col}] = [{parent_col}] WHERE [{parent_col}] = ?"
+    _execute_many(conn, sql, [(key,) for key in parent_keys], batch_size)
+
+
+def _iter_source(source):
+    """Bloques de una tabla: un DataFrame completo o una función que produce sus bloques."""
+    if isinstance(source, pd.DataFrame):
+        yield source
+    else:
+        yield from source()
+
+
+def sync_tables(conn, frames, manifest, batch_size=DEFAULT_BATCH_SIZE, rebuild=False, verbose=True):
+    """
+    Sincroniza {nombre_tabla: DataFrame o función que produce sus bloques} con la
+    base enviando solo los cambios. Con bloques el libro nunca está completo en
+    memoria: se recorre una vez para los resúmenes (clave, N, HASH) y otra, solo si
+    hay filas nuevas o modificadas, para enviarlas.
+    Retorna {tabla: {'rows', 'inserts', 'updates', 'deletes', 'replaces', 'unchanged', 'seconds'}}.
+    """
+    dialect = connection_dialect(conn)
+    planes = {}
+
+    # 1. Diferencias contra el manifiesto (o contra la base si no es confiable)
+    for table_name in [t for t in LOAD_ORDER if t in frames]:
+        # Valores del Excel con los tipos de la tabla destino (fechas/enteros en el esquema tipado);
+        # un valor no convertible detiene la sincronización antes de escribir nada
+        types = read_column_types(conn, table_name)
+        columns, resumenes, filas = None, [], 0
+        for chunk in _iter_source(frames[table_name]):
+            chunk = convert_for_schema(chunk, types, dialect, table_name)
+            columns = columns or content_columns(chunk)
+            resumenes.append(summarize(chunk, table_name, columns))
+            filas += len(chunk)
+        if columns is None:
+            if verbose:
+                print(f"[{table_name}]: el libro no tiene datos; la tabla no se sincroniza.")
+            continue
+        nuevo = combine_summaries(resumenes)
+
+        viejo, meta = (None, None) if rebuild else manifest.load(table_name)
+        watermark = read_watermark(conn, table_name)
+        # Sin columna VERSION_FILA (esquema antiguo) ambas marcas son None y se confía en el manifiesto
+        confiable = (
+            meta is not None
+            and meta.get('format') == MANIFEST_FORMAT
+            and meta.get('columns') == columns
+            and meta.get('watermark') == _encode(watermark)
+        )
+        if not confiable:
+            if verbose:
+                print(f"[{table_name}]: manifiesto ausente o desactualizado; se reconstruye desde la base.")
+            viejo = summary_from_db(conn, table_name, columns)
+
+        planes[table_name] = (types, columns, nuevo, diff_summaries(viejo, nuevo))
+
+    tablas = list(planes)
+    stats = {t: {'seconds': 0.0, 'rows': int(planes[t][2]['N'].sum())} for t in tablas}
+
+    # 2. DELETE de hija a padre (las claves repetidas que cambiaron también se borran)
+    for table_name in reversed(tablas):
+        plan = planes[table_name][3]
+        inicio = time.perf_counter()
+        stats[table_name]['deletes'] = delete_keys(conn, table_name, plan['deletes'], batch_size)
+        stats[table_name]['replaces'] = delete_keys(conn, table_name, plan['replaces'], batch_size)
+        stats[table_name]['seconds'] += time.perf_counter() - inicio
+
+    # 3. UPDATE e INSERT de padre a hija, bloque por bloque
+    for table_name in tablas:
+        types, columns, nuevo, plan = planes[table_name]
+        inicio = time.perf_counter()
+
+        actualizadas = insertadas = 0
+        if len(plan['updates']) or len(plan['inserts']) or len(plan['replaces']):
+            for chunk in _iter_source(frames[table_name]):
+                chunk = convert_for_schema(chunk, types, dialect, table_name)
+                actualizadas += update_rows(conn, table_name, _rows_for(chunk, table_name, plan['updates']),
+                                            columns, batch_size)
+                nuevas = _rows_for(chunk, table_name, plan['inserts'])
+                reemplazos = _rows_for(chunk, table_name, plan['replaces'])
+                if len(nuevas) or len(reemplazos):
+                    bulk_insert_dataframe(pd.concat([nuevas[columns], reemplazos[columns]]),
+                                          f"{SCHEMA}.{table_name}", conn, batch_size=batch_size, verbose=False)
+                insertadas += len(nuevas)
+
+        if table_name in PARENTS and len(plan['deletes']):
+            # Fases borradas de pacientes que siguen existiendo
+            padres = pd.Index([key[0] if isinstance(key, tuple) else key for key in plan['deletes']]).unique()
+            parent = PARENTS[table_name][0]
+            if parent in planes:
+                padres = padres.intersection(planes[parent][2].index)
+            touch_parents(conn, table_name, list(padres), batch_size)
+
+        stats[table_name]['seconds'] += time.perf_counter() - inicio
+        stats[table_name].update({
+            'inserts': insertadas, 'updates': actualizadas,
+            'unchanged': len(nuevo) - len(plan['inserts']) - len(plan['updates']) - len(plan['replaces']),
+        })
+
+    # 4. Manifiesto con la marca de agua que dejó esta carga
+    for table_name in tablas:
+        _, columns, nuevo, plan = planes[table_name]
+        s = stats[table_name]
+        # Cada clave del plan existe en la base: una clave sin filas afectadas indica que la base
+        # no es la del manifiesto, que entonces no se guarda (la próxima carga lo reconstruye)
+        if s['updates'] < len(plan['updates']) or s['deletes'] < len(plan['deletes']):
+            if verbose:
+                print(f"[{table_name}]: la base no tenía todas las claves esperadas; "
+                      "el manifiesto se reconstruirá en la próxima carga.")
+        else:
+            manifest.save(table_name, nuevo, columns, read_watermark(conn, table_name))
+
+        if verbose:
+            print(f"✔ {SCHEMA}.{table_name}: {s['inserts']} nuevas, {s['updates']} actualizadas, "
+                  f"{s['deletes']} borradas, {s['replaces']} reemplazadas, {s['unchanged']} sin cambios "
+                  f"({s['seconds']:.2f}s)")
+    return stats
@@ -0,0 +1,121 @@
+# filter_index.py
+"""
+Índice de filtros precalculado por versión de datos.
+
+En lugar de copiar el frame y comparar columnas completas en cada rerun, se
+construye una sola vez por versión:
+- un bitmap (array booleano) por cada valor de ESTADO y de RANGO_DE_EDAD,
+- un índice ordenado de FECHA_DE_RECIBIDO para resolver rangos con búsqueda binaria.
+
+Un FilterSpec se evalúa como intersección de bitmaps + dos searchsorted, y el
+resultado es una selección perezosa de filas (FilteredView), no una copia.
+"""
+
+from datetime import timedelta
+
+import numpy as np
+import pandas as pd
+
+from dataset_schema import SIN_DATO_RANGO
+
+
+def _value_bitmaps(serie, null_label=None):
+    """Un array booleano por valor distinto; los nulos van a `null_label` si se indica."""
+    codes, uniques = pd.factorize(serie, use_na_sentinel=True)
+    bitmaps = {str(value): codes == i for i, value in enumerate(uniques)}
+    if null_label is not None:
+        nulls = codes == -1
+        bitmaps[null_label] = bitmaps[null_label] | nulls if null_label in bitmaps else nulls
+    return bitmaps
+
+
+class FilterIndex:
+    """Bitmaps por valor y fechas ordenadas para un frame concreto (una versión de datos)."""
+
+    def __init__(self, df, version=None):
+        self.version = version
+        self.n_rows = len(df)
+
+        self.estado = _value_bitmaps(df['ESTADO']) if 'ESTADO' in df.columns else None
+        self.rango = (
+            _value_bitmaps(df['RANGO_DE_EDAD'], null_label=SIN_DATO_RANGO)
+            if 'RANGO_DE_EDAD' in df.columns else None
+        )
+
+        # Fechas válidas ordenadas + posición de fila de cada una
+        self.sorted_dates = None
+        self.sorted_rows = None
+        if 'FECHA_DE_RECIBIDO' in df.columns:
+            fechas = pd.to_datetime(df['FECHA_DE_RECIBIDO'], errors='coerce').to_numpy(dtype='datetime64[ns]')
+            validas = np.flatnonzero(~np.isnat(fechas))
+            orden = np.argsort(fechas[validas], kind='stable')
+            self.sorted_rows = validas[orden]
+            self.sorted_dates = fechas[self.sorted_rows]
+
+    def _empty(self):
+        return np.zeros(self.n_rows, dtype=bool)
+
+    def _date_bitmap(self, desde, hasta):
+        """Filas con fecha en [desde, hasta] (días completos) por búsqueda binaria."""
+        inicio = np.datetime64(pd.Timestamp(desde), 'ns')
+        fin = np.datetime64(pd.Timestamp(hasta + timedelta(days=1)), 'ns')
+        lo = np.searchsorted(self.sorted_dates, inicio, side='left')
+        hi = np.searchsorted(self.sorted_dates, fin, side='left')
+
+        bitmap = self._empty()
+        bitmap[self.sorted_rows[lo:hi]] = True
+        return bitmap
+
+    def select(self, spec):
+        """Posiciones (ordenadas) de las filas que cumplen el FilterSpec; None = todas."""
+        if spec.is_empty():
+            return None
+
+        mask = np.ones(self.n_rows, dtype=bool)
+
+        if spec.estado and self.estado is not None:
+            mask &= self.estado.get(spec.estado, self._empty())
+
+        if spec.rangos and self.rango is not None:
+            union = self._empty()
+            for rango in spec.rangos:
+                if rango in self.rango:
+                    union |= self.rango[rango]
+            mask &= union
+
+        if spec.has_date_range and self.sorted_dates is not None:
+            mask &= self._date_bitmap(spec.fecha_desde, spec.fecha_hasta)
+
+        return np.flatnonzero(mask)
+
+
+class FilteredView:
+    """
+    Selección perezosa de filas de un frame compartido (de solo lectura).
+    Las columnas se extraen bajo demanda; to_frame() materializa solo cuando hace falta.
+    """
+
+    def __init__(self, df, rows=None):
+        self.df = df
+        self.rows = rows  # None = todas las filas
+
+    def __len__(self):
+        return len(self.df) if self.rows is None else len(self.rows)
+
+    @property
+    def columns(self):
+        return self.df.columns
+
+    @property
+    def empty(self):
+        return len(self) == 0
+
+    def column(self, name):
+        serie = self.df[name]
+        return serie if self.rows is None else serie.iloc[self.rows]
+
+    def nunique(self, name):
+        return self.column(name).nunique() if name in self.df.columns else 0
+
+    def to_frame(self):
+        return self.df if self.rows is None else self.df.iloc[self.rows]
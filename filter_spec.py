@@ -0,0 +1,87 @@
+# filter_spec.py
+"""
+Especificación de filtros del dashboard.
+
+Los widgets de la barra lateral producen un FilterSpec inmutable que se puede
+compilar de dos formas equivalentes:
+- to_sql(dialect): cláusula WHERE parametrizada sobre el LEFT JOIN P/F (pushdown).
+- to_mask(df):     máscara booleana sobre el DataFrame ya cargado.
+"""
+
+from dataclasses import dataclass
+from datetime import date, timedelta
+from typing import Optional, Tuple
+
+import pandas as pd
+
+from dataset_schema import SIN_DATO_RANGO
+# FECHA_DE_RECIBIDO es DATE en el esquema tipado y NVARCHAR en el original
+from typed_schema import date_sql
+
+
+@dataclass(frozen=True)
+class FilterSpec:
+    """Selección activa. Un campo vacío (None / tupla vacía) significa 'Todos'."""
+
+    estado: Optional[str] = None
+    rangos: Tuple[str, ...] = ()
+    fecha_desde: Optional[date] = None
+    fecha_hasta: Optional[date] = None
+
+    @property
+    def has_date_range(self):
+        return self.fecha_desde is not None and self.fecha_hasta is not None
+
+    def is_empty(self):
+        return not self.estado and not self.rangos and not self.has_date_range
+
+    def to_sql(self, dialect):
+        """Retorna (where, params) para el LEFT JOIN con alias P (pacientes) y F (fases)."""
+        condiciones = []
+        params = []
+
+        if self.estado:
+            condiciones.append("P.ESTADO = ?")
+            params.append(self.estado)
+
+        if self.rangos:
+            marcadores = ", ".join(["?"] * len(self.rangos))
+            # Igual que en memoria: los nulos cuentan como 'Sin Dato'
+            condiciones.append(f"COALESCE(F.RANGO_DE_EDAD, '{SIN_DATO_RANGO}') IN ({marcadores})")
+            params.extend(self.rangos)
+
+        if self.has_date_range:
+            fecha = date_sql("P.FECHA_DE_RECIBIDO", dialect)
+            condiciones.append(f"{fecha} BETWEEN ? AND ?")
+            params.extend([self.fecha_desde.isoformat(), self.fecha_hasta.isoformat()])
+
+        if not condiciones:
+            return "", []
+        return "WHERE " + " AND ".join(condiciones), params
+
+    def to_mask(self, df):
+        """Máscara booleana equivalente a to_sql() sobre el frame procesado."""
+        mask = pd.Series(True, index=df.index)
+
+        if self.estado and 'ESTADO' in df.columns:
+            mask &= df['ESTADO'] == self.estado
+
+        if self.rangos and 'RANGO_DE_EDAD' in df.columns:
+            rango = df['RANGO_DE_EDAD']
+            # Los nulos cuentan como 'Sin Dato' (sin fillna: la columna puede ser categórica)
+            mask &= rango.isin(self.rangos) | (rango.isna() & (SIN_DATO_RANGO in self.rangos))
+
+        if self.has_date_range and 'FECHA_DE_RECIBIDO' in df.columns:
+            fechas = pd.to_datetime(df['FECHA_DE_RECIBIDO'], errors='coerce')
+            # Rango cerrado por días: [desde 00:00, hasta + 1 día); las fechas inválidas quedan fuera
+            desde = pd.Timestamp(self.fecha_desde)
+            hasta = pd.Timestamp(self.fecha_hasta + timedelta(days=1))
+            mask &= (fechas >= desde) & (fechas < hasta)
+
+        return mask
+
+    def apply(self, df):
+        """Filas de df que cumplen la selección (sin copia previa del frame completo)."""
+        if self.is_empty():
+            return df
+        return df[self.to_mask(df)]
@@ -1,39 +1,182 @@
-from azure_connector import get_azure_sql_connection
-from process_excel import load_and_process_excels
+import argparse
+import sys
+
+from azure_connector import get_backend_settings
+from bulk_insert import bulk_insert_dataframe, DEFAULT_BATCH_SIZE, METHODS
+from db_backend import create_pool
+from local_db import create_tables_from_frames
+from etl_runner import StageTimer, read_workbooks, run_parallel_load
+from excel_sync import HashManifest, manifest_target, sync_tables
+from process_excel import DEFAULT_CHUNK_SIZE, iter_workbook_chunks, stream_excels, table_sources, table_templates
+from summary_tables import rebuild_summaries
+from typed_schema import TypeConversionError, convert_for_schema, infer_types_from_chunks, read_column_types
 # Nota: La función insert_dataframe_to_sql DEBE recibir la conexión/cursor.
 
-def insert_dataframe_to_sql(df, table_name, cursor, conn):
-    # Ya no se abre ni se cierra la conexión aquí
-    
-    columns = ", ".join([f"[{col}]" for col in df.columns])
-    placeholders = ", ".join(["?"] * len(df.columns))
+def insert_dataframe_to_sql(df, table_name, cursor, conn, batch_size=DEFAULT_BATCH_SIZE, method='auto', verbose=True):
+    # Ya no se abre ni se cierra la conexión aquí.
+    # El cursor se conserva en la firma por compatibilidad; la carga va por lotes.
+    return bulk_insert_dataframe(df, table_name, conn, batch_size=batch_size, method=method, verbose=verbose)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Carga los Excel de TMZ en la base de datos por lotes.")
+    parser.add_argument("--sqlite", metavar="RUTA",
+                        help="Cargar en una base SQLite local (':memory:' para solo medir) en lugar de Azure SQL.")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE,
+                        help=f"Filas por lote/commit (por defecto {DEFAULT_BATCH_SIZE}).")
+    parser.add_argument("--method", choices=METHODS, default="auto",
+                        help="Método de inserción (auto = fast_executemany en pyodbc, VALUES multi-fila en otros).")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE,
+                        help=f"Filas leídas del Excel por bloque (por defecto {DEFAULT_CHUNK_SIZE}).")
+    parser.add_argument("--full", action="store_true",
+                        help="Vaciar las tablas y recargarlas completas (por defecto solo se envían los cambios).")
+    parser.add_argument("--rebuild-manifest", action="store_true",
+                        help="Ignorar el manifiesto de hashes y comparar contra el contenido actual de la base.")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Procesos de lectura y conexiones de carga en paralelo "
+                             "(1 = lectura en streaming con memoria constante).")
+    parser.add_argument("--confirm", action="store_true",
+                        help="Confirmar la escritura en Azure SQL (--full vacía las tablas). Sin esta opción "
+                             "solo se carga una base SQLite.")
+    parser.add_argument("--typed", action="store_true",
+                        help="Al crear las tablas de SQLite, fechas como DATE y enteros como INTEGER, con índices "
+                             "(esquema tipado; en Azure las tablas se crean con scripts/generate_sql_script.py).")
+    return parser.parse_args()
+
+
+def reset_tables(conn, dialect, frames, typed=False, types=None):
+    """Deja las tablas vacías antes de una carga completa."""
+    if dialect == "sqlite":
+        # La base local se recrea en cada carga (con typed, los tipos son `types` o se infieren de `frames`)
+        create_tables_from_frames(conn, frames, drop_existing=True, typed=typed, types=types)
+    else:
+        # En Azure las tablas ya existen: se vacían respetando la FK (primero la hija)
+        cursor = conn.cursor()
+        cursor.execute("DELETE FROM tmz_data.FasePaciente")
+        cursor.execute("DELETE FROM tmz_data.Pacientes_tmz")
+        conn.commit()
+        cursor.close()
+
+
+def workbook_types(table_names, chunk_size):
+    """Tipos de cada tabla inferidos sobre todas las filas de su libro (lectura por bloques)."""
+    return {table_name: infer_types_from_chunks(iter_workbook_chunks(table_name, chunk_size))
+            for table_name in table_names}
+
+
+def check_workbooks(types, dialect, chunk_size):
+    """
+    Convierte cada bloque de los libros a los tipos de su tabla sin insertarlo:
+    un valor no convertible lanza TypeConversionError antes de vaciar las tablas.
+    """
+    for table_name, table_types in types.items():
+        if all(tipo == 'text' for tipo in table_types.values()):
+            continue
+        for chunk in iter_workbook_chunks(table_name, chunk_size):
+            convert_for_schema(chunk, table_types, dialect, table_name)
+
+
+def full_load(pool, args):
+    """Vacía las tablas y las recarga completas, leyendo los Excel por bloques."""
+    # Filas y segundos acumulados por tabla
+    totales = {}
 
-    sql = f"INSERT INTO {table_name} ({columns}) VALUES ({placeholders})"
+    with pool.connection() as conn:
+        cursor = conn.cursor()
+        templates = table_templates()
+        inferidos = None
+        if pool.dialect == "sqlite":
+            # Esquema tipado: los tipos se infieren sobre todas las filas, no sobre una muestra
+            if args.typed:
+                inferidos = workbook_types(templates, args.chunk_size)
+        else:
+            # Las tablas de Azure conservan sus tipos: los libros se validan antes de vaciarlas
+            check_workbooks({table_name: read_column_types(conn, table_name) for table_name in templates},
+                            pool.dialect, args.chunk_size)
+        reset_tables(conn, pool.dialect, templates, args.typed, inferidos)
+        types = {table_name: read_column_types(conn, table_name) for table_name in templates}
 
-    for _, row in df.iterrows():
-        cursor.execute(sql, tuple(row.values))
+        # Los Excel se leen y se insertan por bloques: nunca hay un libro completo en memoria
+        for table_name, chunk in stream_excels(args.chunk_size):
+            if chunk.empty:
+                continue
+            chunk = convert_for_schema(chunk, types[table_name], pool.dialect, table_name)
+            stats = insert_dataframe_to_sql(chunk, f"tmz_data.{table_name}", cursor, conn,
+                                            args.batch_size, args.method, verbose=False)
+            filas, segundos = totales.get(table_name, (0, 0.0))
+            totales[table_name] = (filas + stats['rows'], segundos + stats['seconds'])
 
-    conn.commit()
-    print(f"✔ Insertado correctamente en {table_name}")
+        cursor.close()
+
+    for table_name, (filas, segundos) in totales.items():
+        print(f"✔ tmz_data.{table_name}: {filas} filas en {segundos:.2f}s")
+
+
+def incremental_load(pool, settings, args, timer):
+    """Compara los Excel con el manifiesto de hashes y envía solo INSERT/UPDATE/DELETE."""
+    if args.workers > 1:
+        with timer.stage("lectura + validación"):
+            df_pacientes, df_fases = read_workbooks(args.workers, args.chunk_size)
+        frames = {"Pacientes_tmz": df_pacientes, "FasePaciente": df_fases}
+    else:
+        # Lectura en streaming: sync_tables recorre los libros por bloques (memoria constante)
+        frames = table_sources(args.chunk_size)
+
+    with timer.stage("sincronización"):
+        with pool.connection() as conn:
+            if pool.dialect == "sqlite":
+                # Primera carga local: las tablas se crean si no existen
+                if args.workers > 1:
+                    create_tables_from_frames(conn, frames, typed=args.typed)
+                else:
+                    # Con typed, los tipos se infieren sobre todas las filas solo si falta alguna tabla
+                    faltan = args.typed and not all(read_column_types(conn, t) for t in frames)
+                    create_tables_from_frames(conn, table_templates(), typed=args.typed,
+                                              types=workbook_types(frames, args.chunk_size) if faltan else None)
+
+            sync_tables(conn, frames, HashManifest(manifest_target(settings)),
+                        batch_size=args.batch_size, rebuild=args.rebuild_manifest)
 
 
 if __name__ == "__main__":
-    df_pacientes, df_fases = load_and_process_excels()
-
-    # --- Apertura de Conexión Única ---
-    conn = get_azure_sql_connection()
-    cursor = conn.cursor()
-    
-    #if not df_pacientes.empty:
-        # Pasa cursor y conn
-        #insert_dataframe_to_sql(df_pacientes, "tmz_data.Pacientes_tmz", cursor, conn)
-
-    #if not df_fases.empty:
-        # Pasa cursor y conn
-        #insert_dataframe_to_sql(df_fases, "tmz_data.FasePaciente", cursor, conn)
-
-    # --- Cierre de Conexión Única ---
-    cursor.close()
-    conn.close()
-    
-    print("\n✔ CARGA COMPLETA")
\ No newline at end of file
+    args = parse_args()
+
+    # --- Conexión a través del pool del backend configurado ---
+    settings = get_backend_settings()
+    if args.sqlite:
+        settings.update({"BACKEND": "sqlite", "SQLITE_PATH": args.sqlite})
+    if settings.get("BACKEND") != "sqlite" and not args.confirm:
+        # La carga en Azure modifica las tablas del dashboard: se ejecuta solo si se pide explícitamente
+        accion = "vacía y recarga" if args.full else "sincroniza"
+        print(f"❌ Esta carga {accion} las tablas de Azure SQL. Repita con --confirm para ejecutarla "
+              "(o use --sqlite RUTA para una base local).")
+        sys.exit(1)
+    pool = create_pool(settings)
+
+    timer = StageTimer()
+    try:
+        if args.full and args.workers > 1:
+            run_parallel_load(pool, lambda conn, frames: reset_tables(conn, pool.dialect, frames, args.typed),
+                              args.workers, args.chunk_size, args.batch_size, args.method, timer)
+        elif args.full:
+            with timer.stage("lectura + carga (streaming)"):
+                full_load(pool, args)
+        else:
+            incremental_load(pool, settings, args, timer)
+    except TypeConversionError as e:
+        # Un valor que no cumple el tipo de su columna no se carga como NULL: se corrige el Excel
+        print(f"❌ {e}")
+        pool.close_all()
+        sys.exit(1)
+
+    # --- Resúmenes materializados para el dashboard (una transacción) ---
+    with timer.stage("resúmenes"):
+        with pool.connection() as conn:
+            filas = rebuild_summaries(conn, pool.dialect)
+    print("✔ Resúmenes: " + ", ".join(f"tmz_data.{tabla} ({n} filas)" for tabla, n in filas.items()))
+
+    # --- Cierre de las conexiones del pool ---
+    pool.close_all()
+
+    print(timer.summary())
+    print("\n✔ CARGA COMPLETA")
@@ -0,0 +1,197 @@
+# kpis.py
+"""
+Indicadores del encabezado del dashboard (pacientes únicos).
+
+Dos caminos que producen los mismos números:
+- KpiEngine / compute_kpis: sobre el DataFrame ya cargado, en una pasada vectorizada
+                           y con memoización por versión de datos + filtros.
+- fetch_kpis(spec):        en la base de datos, con COUNT(DISTINCT CEDULA) y agregados
+                           condicionales; el FilterSpec activo viaja como parámetros.
+
+Criterio común: un paciente cuenta en un indicador si AL MENOS UNA de sus filas
+(paciente + fase) cumple la condición.
+"""
+
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from azure_connector import fetch_data, get_connection_pool
+from data_loader import TEXTO_PENDIENTE, VALORES_VERDADEROS
+from summary_tables import build_summary_kpi_query, summaries_fresh
+
+KPI_SELECT = """
+    SELECT
+        COUNT(DISTINCT P.CEDULA) AS total_pacientes,
+        COUNT(DISTINCT CASE WHEN P.ESTADO = 'REALIZADO' THEN P.CEDULA END) AS realizado_tamizaje,
+        COUNT(DISTINCT CASE
+            WHEN UPPER(LTRIM(RTRIM(F.MUESTRA_ENVIADA_A_ESPAÑA))) IN ({verdaderos}) THEN P.CEDULA
+        END) AS enviados_lab,
+        COUNT(DISTINCT CASE
+            WHEN F.RESULTADOS_A_CORTE_14_OCTUBRE_JOHN IS NOT NULL
+             AND F.RESULTADOS_A_CORTE_14_OCTUBRE_JOHN <> ''
+             AND LOWER(F.RESULTADOS_A_CORTE_14_OCTUBRE_JOHN) NOT LIKE ?
+            THEN P.CEDULA
+        END) AS con_resultados,
+        COUNT(DISTINCT CASE WHEN F.GENERO = 'F' THEN P.CEDULA END) AS genero_f,
+        COUNT(DISTINCT CASE WHEN F.GENERO = 'M' THEN P.CEDULA END) AS genero_m
+    FROM
+        tmz_data.Pacientes_tmz P
+    LEFT JOIN
+        tmz_data.FasePaciente F ON P.CEDULA = F.PACIENTE_CEDULA
+"""
+
+KPI_NAMES = ('total_pacientes', 'realizado_tamizaje', 'enviados_lab',
+             'con_resultados', 'genero_f', 'genero_m')
+
+
+# ==========================================================
+#   CAMINO PANDAS (MOTOR VECTORIZADO)
+# ==========================================================
+KPI_CACHE_SIZE = 64
+
+# Un bit por indicador condicional; total_pacientes es "el paciente aparece"
+FLAG_BITS = {
+    'realizado_tamizaje': 1,
+    'enviados_lab': 2,
+    'con_resultados': 4,
+    'genero_f': 8,
+    'genero_m': 16,
+}
+
+
+def _row_flags(df):
+    """Condiciones de cada fila empaquetadas en un uint8 (se evalúan una sola vez por versión)."""
+    flags = np.zeros(len(df), dtype=np.uint8)
+
+    def marcar(nombre, condicion):
+        flags[np.asarray(condicion, dtype=bool)] |= FLAG_BITS[nombre]
+
+    if 'ESTADO' in df.columns:
+        marcar('realizado_tamizaje', df['ESTADO'] == 'REALIZADO')
+
+    # Enviados a Laboratorio (usa el valor 'SÍ' mapeado en data_loader)
+    if 'ENVIADA_A_LABORATORIO' in df.columns:
+        marcar('enviados_lab', df['ENVIADA_A_LABORATORIO'] == 'SÍ')
+
+    # Con resultados: ni nulo, ni vacío, ni "Pendiente de reporte"
+    if 'RESULTADOS_TMZ' in df.columns:
+        resultados = df['RESULTADOS_TMZ']
+        presentes = resultados.notna().to_numpy()
+        texto = resultados[presentes].astype(str)
+        validos = (texto != '') & ~texto.str.contains(TEXTO_PENDIENTE, case=False, regex=False)
+        con_resultados = np.zeros(len(df), dtype=bool)
+        con_resultados[presentes] = validos.to_numpy(dtype=bool)
+        marcar('con_resultados', con_resultados)
+
+    if 'GENERO' in df.columns:
+        marcar('genero_f', df['GENERO'] == 'F')
+        marcar('genero_m', df['GENERO'] == 'M')
+
+    return flags
+
+
+class KpiEngine:
+    """
+    Indicadores sobre un frame concreto (una versión de datos) en una sola pasada.
+
+    Al construirse factoriza CEDULA y empaqueta las condiciones de cada fila en bits.
+    Para una selección de filas, un único bitwise_or por paciente da la vista
+    deduplicada y cada indicador es un conteo de bits. Los resultados se memorizan
+    por (versión, FilterSpec) en un LRU acotado: un rerun sin cambios de filtros no
+    recalcula nada.
+    """
+
+    def __init__(self, df, version=None, cache_size=KPI_CACHE_SIZE):
+        self.version = version
+        self.cache_size = cache_size
+        self.hits = 0
+        self.misses = 0
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+        if 'CEDULA' in df.columns:
+            self.codes, uniques = pd.factorize(df['CEDULA'], use_na_sentinel=True)
+            self.n_patients = len(uniques)
+        else:
+            self.codes, self.n_patients = np.full(len(df), -1), 0
+        self.flags = _row_flags(df)
+
+    def compute(self, rows=None):
+        """Indicadores de las filas en las posiciones `rows` (None = todas)."""
+        codes, flags = self.codes, self.flags
+        if rows is not None:
+            codes, flags = codes[rows], flags[rows]
+        validas = codes >= 0  # filas sin CEDULA no cuentan como paciente
+        codes, flags = codes[validas], flags[validas]
+
+        # Vista deduplicada: presencia y OR de las condiciones de todas las filas del paciente
+        presente = np.zeros(self.n_patients, dtype=bool)
+        presente[codes] = True
+        por_paciente = np.zeros(self.n_patients, dtype=np.uint8)
+        np.bitwise_or.at(por_paciente, codes, flags)
+
+        kpis = {'total_pacientes': int(np.count_nonzero(presente))}
+        for nombre, bit in FLAG_BITS.items():
+            kpis[nombre] = int(np.count_nonzero(por_paciente & bit))
+        return {name: kpis[name] for name in KPI_NAMES}
+
+    def kpis(self, spec, rows=None):
+        """Como compute(), memorizado por (versión de datos, selección activa)."""
+        key = (self.version, spec)
+        with self._lock:
+            if key in self._cache:
+                self.hits += 1
+                self._cache.move_to_end(key)
+                return dict(self._cache[key])
+            self.misses += 1
+
+        kpis = self.compute(rows)
+        with self._lock:
+            self._cache[key] = kpis
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return dict(kpis)
+
+
+def compute_kpis(df):
+    """Calcula los indicadores sobre el DataFrame procesado (columnas renombradas)."""
+    if df.empty or 'CEDULA' not in df.columns:
+        return dict.fromkeys(KPI_NAMES, 0)
+    return KpiEngine(df).compute()
+
+
+# ==========================================================
+#   CAMINO SQL (PUSHDOWN)
+# ==========================================================
+def build_kpi_query(spec, dialect):
+    """Retorna (sql, params) de la consulta de indicadores para la selección dada (FilterSpec)."""
+    where, where_params = spec.to_sql(dialect)
+    verdaderos = ", ".join(["?"] * len(VALORES_VERDADEROS))
+    sql = KPI_SELECT.format(verdaderos=verdaderos) + where + ";"
+    params = list(VALORES_VERDADEROS) + [f"%{TEXTO_PENDIENTE}%"] + where_params
+    return sql, params
+
+
+def kpis_from_result(df_result):
+    """Convierte la fila única de la consulta en el mismo dict que compute_kpis."""
+    if df_result.empty:
+        return None
+    row = df_result.iloc[0]
+    return {name: int(row[name]) if not pd.isna(row[name]) else 0 for name in KPI_NAMES}
+
+
+def fetch_kpis(spec):
+    """
+    Calcula los indicadores en la base de datos. Retorna None si la consulta falla.
+    Con los resúmenes vigentes se leen de Resumen_Paciente; si no, del LEFT JOIN.
+    """
+    pool = get_connection_pool()
+    if pool is None:
+        return None
+    consulta = build_summary_kpi_query(spec, pool.dialect) if summaries_fresh() else None
+    sql, params = consulta or build_kpi_query(spec, pool.dialect)
+    return kpis_from_result(fetch_data(sql, tuple(params)))
@@ -0,0 +1,119 @@
+# local_db.py
+"""
+Base de datos local (SQLite) que imita el esquema `tmz_data` de Azure SQL.
+
+Permite cargar y consultar los datos sin conexión a Azure: las tablas viven en
+una base adjunta con el alias `tmz_data`, de modo que las mismas sentencias
+(`tmz_data.Pacientes_tmz`, `tmz_data.FasePaciente`) funcionan sin cambios.
+"""
+
+import sqlite3
+
+from excel_sync import PARENTS
+from typed_schema import SQL_TYPES, index_statements, infer_column_types, read_column_types
+
+DEFAULT_SQLITE_PATH = "tmz_local.db"
+SCHEMA = "tmz_data"
+
+# Equivalente local de la columna ROWVERSION de Azure (marca de agua del refresco incremental)
+VERSION_COLUMN = "VERSION_FILA"
+
+
+def get_sqlite_connection(path=DEFAULT_SQLITE_PATH, check_same_thread=True):
+    """
+    Abre una conexión SQLite con el esquema `tmz_data` adjunto.
+    `path=':memory:'` crea una base en memoria compartida (útil para benchmarks).
+    """
+    conn = sqlite3.connect(":memory:", uri=True, check_same_thread=check_same_thread)
+
+    if path == ":memory:":
+        # Memoria compartida: todas las conexiones del proceso ven las mismas tablas
+        conn.execute(f"ATTACH DATABASE 'file:{SCHEMA}_mem?mode=memory&cache=shared' AS {SCHEMA}")
+    else:
+        conn.execute(f"ATTACH DATABASE ? AS {SCHEMA}", (path,))
+
+    return conn
+
+
+def _create_version_triggers(cursor, table_name):
+    """
+    Emula ROWVERSION: cada INSERT o UPDATE asigna a la fila el siguiente valor de
+    VERSION_FILA de la tabla. El índice mantiene barato el MAX() de cada disparo.
+    """
+    next_version = f"(SELECT COALESCE(MAX({VERSION_COLUMN}), 0) + 1 FROM {table_name})"
+
+    cursor.execute(
+        f"CREATE INDEX IF NOT EXISTS {SCHEMA}.IX_{table_name}_{VERSION_COLUMN} ON {table_name} ({VERSION_COLUMN})"
+    )
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS {SCHEMA}.TR_{table_name}_INSERT AFTER INSERT ON {table_name}
+        BEGIN
+            UPDATE {table_name} SET {VERSION_COLUMN} = {next_version} WHERE rowid = NEW.rowid;
+        END
+    """)
+    # El WHEN evita que la propia actualización de VERSION_FILA vuelva a disparar el trigger
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS {SCHEMA}.TR_{table_name}_UPDATE AFTER UPDATE ON {table_name}
+        WHEN NEW.{VERSION_COLUMN} IS OLD.{VERSION_COLUMN}
+        BEGIN
+            UPDATE {table_name} SET {VERSION_COLUMN} = {next_version} WHERE rowid = NEW.rowid;
+        END
+    """)
+
+
+def _create_parent_triggers(cursor, table_name):
+    """
+    Borrar una fila hija (o cambiarla de padre) no deja VERSION_FILA: el trigger
+    actualiza el padre anterior, cuyo VERSION_FILA nuevo lleva al refresco
+    incremental del dashboard a releerlo (igual que excel_sync.touch_parents).
+    """
+    parent, child_col, parent_col = PARENTS[table_name]
+    touch = f"UPDATE {parent} SET [{parent_col}] = [{parent_col}] WHERE [{parent_col}] = OLD.[{child_col}];"
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS {SCHEMA}.TR_{table_name}_DELETE AFTER DELETE ON {table_name}
+        BEGIN
+            {touch}
+        END
+    """)
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS {SCHEMA}.TR_{table_name}_PARENT AFTER UPDATE OF [{child_col}] ON {table_name}
+        WHEN NEW.[{child_col}] IS NOT OLD.[{child_col}]
+        BEGIN
+            {touch}
+        END
+    """)
+
+
+def create_tables_from_frames(conn, frames, drop_existing=False, typed=False, types=None):
+    """
+    Crea las tablas de `tmz_data` a partir de las columnas de cada DataFrame.
+    `frames` es un dict {nombre_tabla: DataFrame}. Todas las columnas se crean
+    como TEXT, igual que el esquema NVARCHAR de Azure, más la columna VERSION_FILA.
+    Con `typed=True` las fechas y enteros que los datos de `frames` confirman se
+    crean como DATE / INTEGER (esquema tipado, ver typed_schema) con sus índices.
+    `types` ({tabla: {columna: tipo}}, p. ej. inferidos leyendo los libros por
+    bloques) reemplaza la inferencia sobre `frames`.
+    """
+    cursor = conn.cursor()
+    for table_name, df in frames.items():
+        if drop_existing:
+            cursor.execute(f"DROP TABLE IF EXISTS {SCHEMA}.{table_name}")
+
+        if types is not None:
+            tipos = {col: types[table_name].get(col, 'text') for col in df.columns}
+        else:
+            tipos = infer_column_types(df) if typed else dict.fromkeys(df.columns, 'text')
+        tipos.pop(VERSION_COLUMN, None)
+        columns = ", ".join([f"[{col}] {SQL_TYPES['sqlite'][tipo]}" for col, tipo in tipos.items()])
+        cursor.execute(
+            f"CREATE TABLE IF NOT EXISTS {SCHEMA}.{table_name} ({columns}, [{VERSION_COLUMN}] INTEGER)"
+        )
+        _create_version_triggers(cursor, table_name)
+        if table_name in PARENTS:
+            _create_parent_triggers(cursor, table_name)
+        # Índices de los filtros y del JOIN (y de las fechas en el esquema tipado)
+        for sentencia in index_statements(table_name, read_column_types(conn, table_name), "sqlite"):
+            cursor.execute(sentencia)
+
+    conn.commit()
+    cursor.close()
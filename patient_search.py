@@ -0,0 +1,378 @@
+# patient_search.py
+"""
+Búsqueda de pacientes por nombre, cédula, observaciones y resultados.
+
+Un índice por versión de datos, construido una vez y consultado en milisegundos
+(sin recorrer las filas con str.contains en cada búsqueda). Cada paciente tiene
+un número (id) y el texto se normaliza (mayúsculas, sin tildes ni puntuación):
+- trigramas de NOMBRE y CEDULA: un término de 3 o más letras se resuelve
+  intersectando las listas de ids de sus trigramas y verificando solo esos
+  candidatos;
+- vocabulario ordenado de palabras del nombre y cédulas: los términos de 1-2
+  letras se buscan por prefijo con búsqueda binaria;
+- índice invertido de palabras de OBSERVACIONES y RESULTADOS_TMZ (de todas las
+  fases del paciente), también por prefijo.
+
+Las listas se guardan como arrays ordenados (claves, inicios, ids), sin un objeto
+de Python por entrada. Cada término de la consulta debe aparecer (Y lógico); los
+resultados se ordenan por la calidad de la coincidencia: cédula, inicio de una
+palabra del nombre, parte del nombre y, por último, observaciones o resultados.
+
+Actualización incremental con el delta del cargador (IncrementalLoader.last_delta):
+los pacientes modificados se marcan como borrados y sus filas nuevas se indexan
+en un segmento aparte; la versión anterior sigue intacta para quien la use.
+Cuando los segmentos y borrados superan COMPACT_RATIO de los pacientes vivos, el
+índice se compacta (se reconstruye desde su propia tabla de pacientes).
+"""
+
+import re
+import time
+import unicodedata
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from azure_connector import run_query
+from versioned_store import VersionedStore
+
+MAX_RESULTS = 50
+COMPACT_RATIO = 0.2
+# Pacientes por bloque al calcular trigramas (acota la memoria de la matriz de bytes)
+TRIGRAM_BLOCK = 200_000
+
+# Calidad de la coincidencia (menor = mejor) -> etiqueta en la interfaz
+RANGO_CEDULA, RANGO_PALABRA, RANGO_NOMBRE, RANGO_TEXTO = range(4)
+SIN_COINCIDENCIA = np.int8(127)
+COINCIDENCIAS = {
+    RANGO_CEDULA: 'Cédula',
+    RANGO_PALABRA: 'Nombre',
+    RANGO_NOMBRE: 'Nombre (parcial)',
+    RANGO_TEXTO: 'Observaciones / resultados',
+}
+
+# Columnas del índice (modo con filtros en la base: se leen solo estas)
+SEARCH_QUERY = """
+    SELECT P.CEDULA, P.NOMBRE, P.ESTADO, P.OBSERVACIONES,
+           F.RESULTADOS_A_CORTE_14_OCTUBRE_JOHN AS RESULTADOS_TMZ
+    FROM tmz_data.Pacientes_tmz P
+    LEFT JOIN tmz_data.FasePaciente F ON P.CEDULA = F.PACIENTE_CEDULA;
+"""
+
+_NO_ALFANUMERICO = r'[^A-Z0-9]+'
+# Separadores de miles dentro de un número: '1.234.567' -> '1234567'
+_SEPARADOR_NUMERO = r'(?<=\d)[.,](?=\d)'
+
+
+# ==========================================================
+#   NORMALIZACIÓN
+# ==========================================================
+def normalize(text):
+    """Mayúsculas sin tildes, palabras separadas por un espacio ('José  Pérez' -> 'JOSE PEREZ')."""
+    texto = unicodedata.normalize('NFKD', str(text)).encode('ascii', 'ignore').decode().upper()
+    return re.sub(_NO_ALFANUMERICO, ' ', re.sub(_SEPARADOR_NUMERO, '', texto)).strip()
+
+
+def normalize_series(serie):
+    """normalize() vectorizado sobre una Serie de texto."""
+    texto = serie.astype(str).str.normalize('NFKD').str.encode('ascii', 'ignore').str.decode('ascii').str.upper()
+    texto = texto.str.replace(_SEPARADOR_NUMERO, '', regex=True)
+    return texto.str.replace(_NO_ALFANUMERICO, ' ', regex=True).str.strip()
+
+
+def _text(df, column):
+    if column not in df.columns:
+        return pd.Series('', index=df.index, dtype=object)
+    serie = df[column].astype(object)
+    return serie.where(serie.notna(), '').astype(str).str.strip()
+
+
+def patient_table(df):
+    """
+    Una fila por CEDULA de df con lo que se indexa y se muestra: CEDULA, NOMBRE,
+    ESTADO y el texto normalizado de nombre, cédula y observaciones/resultados
+    (de todas las filas del paciente, sin repetir).
+    """
+    columnas = ['CEDULA', 'NOMBRE', 'ESTADO', 'NOMBRE_NORM', 'CEDULA_NORM', 'TEXTO_NORM']
+    if df is None or df.empty or 'CEDULA' not in df.columns:
+        return pd.DataFrame(columns=columnas)
+
+    datos = pd.DataFrame({
+        col: _text(df, col) for col in ('CEDULA', 'NOMBRE', 'ESTADO', 'OBSERVACIONES', 'RESULTADOS_TMZ')
+    })
+    datos = datos[datos['CEDULA'] != '']
+
+    # Las observaciones se repiten en cada fase y los resultados entre fases
+    libres = pd.concat([
+        datos[['CEDULA', col]].set_axis(['CEDULA', 'TEXTO'], axis=1)
+        for col in ('OBSERVACIONES', 'RESULTADOS_TMZ')
+    ]).drop_duplicates()
+    libres = libres[libres['TEXTO'] != ''].reset_index(drop=True)
+    # Pocos textos distintos: se normaliza cada uno una vez
+    codigos, unicos = pd.factorize(libres['TEXTO'])
+    libres['TEXTO'] = normalize_series(pd.Series(unicos, dtype=object)).to_numpy(dtype=object)[codigos]
+    # Textos del paciente lado a lado (uno por columna) y unidos sin recorrerlos en Python
+    libres['N'] = libres.groupby('CEDULA', sort=False).cumcount()
+    ancho = libres.pivot(index='CEDULA', columns='N', values='TEXTO')
+    if ancho.empty:  # ningún paciente tiene observaciones ni resultados (p. ej. un delta pequeño)
+        textos = pd.Series(dtype=object)
+    else:
+        textos = ancho[0].str.cat([ancho[n] for n in ancho.columns[1:]], sep=' ', na_rep='')
+
+    pacientes = datos.drop_duplicates('CEDULA')[['CEDULA', 'NOMBRE', 'ESTADO']].reset_index(drop=True)
+    pacientes['NOMBRE_NORM'] = normalize_series(pacientes['NOMBRE'])
+    pacientes['CEDULA_NORM'] = normalize_series(pacientes['CEDULA']).str.replace(' ', '', regex=False)
+    texto = pacientes['CEDULA'].map(textos)
+    pacientes['TEXTO_NORM'] = texto.where(texto.notna(), '').str.strip()
+    return pacientes[columnas]
+
+
+# ==========================================================
+#   LISTAS (clave -> ids) COMO ARRAYS ORDENADOS
+# ==========================================================
+class _Postings:
+    """`keys` ordenadas; los ids de keys[i] son ids[starts[i]:starts[i + 1]] (ordenados)."""
+
+    def __init__(self, keys, starts, ids):
+        self.keys = keys
+        self.starts = starts
+        self.ids = ids
+
+    @classmethod
+    def from_pairs(cls, keys, ids):
+        if len(keys) == 0:
+            return cls(np.asarray(keys)[:0], np.zeros(1, dtype=np.int64), np.array([], dtype=np.int32))
+        orden = np.lexsort((ids, keys))
+        keys, ids = np.asarray(keys)[orden], np.asarray(ids, dtype=np.int32)[orden]
+        # Sin pares repetidos (la misma palabra dos veces en un paciente)
+        nuevos = np.ones(len(keys), dtype=bool)
+        nuevos[1:] = (keys[1:] != keys[:-1]) | (ids[1:] != ids[:-1])
+        keys, ids = keys[nuevos], ids[nuevos]
+        unicas, starts = np.unique(keys, return_index=True)
+        return cls(unicas, np.append(starts, len(keys)), ids)
+
+    def get(self, key):
+        i = np.searchsorted(self.keys, key)
+        if i < len(self.keys) and self.keys[i] == key:
+            return self.ids[self.starts[i]:self.starts[i + 1]]
+        return self.ids[:0]
+
+    def prefix(self, prefijo):
+        """Ids de todas las claves (bytes) que empiezan por `prefijo` (un rango contiguo)."""
+        lo = np.searchsorted(self.keys, prefijo, side='left')
+        hi = np.searchsorted(self.keys, prefijo + b'\xff', side='left')
+        return self.ids[self.starts[lo]:self.starts[hi]]
+
+
+def _as_bytes(textos):
+    # El texto normalizado es ASCII: un array de bytes de ancho fijo (compara y busca en C)
+    return np.array(textos, dtype=bytes) if len(textos) else np.array([], dtype='S1')
+
+
+def _trigram_codes(texto):
+    """Código entero de cada trigrama de un texto ASCII."""
+    b = np.frombuffer(texto.encode(), dtype=np.uint8).astype(np.int32)
+    return (b[:-2] << 16) | (b[1:-1] << 8) | b[2:]
+
+
+def _trigram_pairs(textos_b, ids):
+    """(códigos, ids) de los trigramas de cada texto, calculados sobre la matriz de bytes."""
+    codigos, duenos = [np.array([], dtype=np.int32)], [np.array([], dtype=np.int32)]
+    for inicio in range(0, len(textos_b), TRIGRAM_BLOCK):
+        bloque = textos_b[inicio:inicio + TRIGRAM_BLOCK]
+        ancho = bloque.dtype.itemsize
+        if ancho < 3:
+            continue
+        matriz = bloque.view(np.uint8).reshape(len(bloque), ancho).astype(np.int32)
+        codigo = (matriz[:, :-2] << 16) | (matriz[:, 1:-1] << 8) | matriz[:, 2:]
+        # El relleno es \0: un trigrama es válido si su tercer byte no es relleno
+        validos = matriz[:, 2:] != 0
+        codigos.append(codigo[validos])
+        duenos.append(np.broadcast_to(ids[inicio:inicio + TRIGRAM_BLOCK, None], codigo.shape)[validos])
+    return np.concatenate(codigos), np.concatenate(duenos)
+
+
+def _word_pairs(textos, ids):
+    """(palabras en bytes, ids) de textos normalizados."""
+    palabras = pd.Series(textos, index=ids, dtype=object).str.split().explode().dropna()
+    return _as_bytes(palabras.tolist()), palabras.index.to_numpy(dtype=np.int32)
+
+
+class _Segment:
+    """Trigramas, palabras del nombre/cédula y palabras del texto libre de un grupo de pacientes."""
+
+    def __init__(self, pacientes, offset):
+        ids = np.arange(offset, offset + len(pacientes), dtype=np.int32)
+        nombres = _as_bytes(pacientes['NOMBRE_NORM'].tolist())
+        cedulas = _as_bytes(pacientes['CEDULA_NORM'].tolist())
+
+        codigos_n, ids_n = _trigram_pairs(nombres, ids)
+        codigos_c, ids_c = _trigram_pairs(cedulas, ids)
+        self.trigramas = _Postings.from_pairs(np.concatenate([codigos_n, codigos_c]), np.concatenate([ids_n, ids_c]))
+
+        palabras = pacientes['NOMBRE_NORM'] + ' ' + pacientes['CEDULA_NORM']
+        self.palabras = _Postings.from_pairs(*_word_pairs(palabras.tolist(), ids))
+        self.tokens = _Postings.from_pairs(*_word_pairs(pacientes['TEXTO_NORM'].tolist(), ids))
+        self.size = len(pacientes)
+
+
+# ==========================================================
+#   ÍNDICE
+# ==========================================================
+class PatientSearchIndex:
+    """Índice de búsqueda de una versión de datos (inmutable: apply_delta retorna otro)."""
+
+    def __init__(self, pacientes, segmentos, vivos, version=None):
+        self.pacientes = pacientes      # tabla de patient_table(); el id es la posición
+        self.segmentos = segmentos      # _Segment que cubren los ids en orden
+        self.vivos = vivos              # False = paciente reemplazado o borrado
+        self.version = version
+        # Nombre y cédula normalizados como bytes (con un espacio inicial en el nombre)
+        self._nombres = _as_bytes((' ' + pacientes['NOMBRE_NORM']).tolist())
+        self._cedulas = _as_bytes(pacientes['CEDULA_NORM'].tolist())
+
+    @classmethod
+    def from_frame(cls, df, version=None):
+        return cls.from_patients(patient_table(df), version)
+
+    @classmethod
+    def from_patients(cls, pacientes, version=None):
+        pacientes = pacientes.reset_index(drop=True)
+        return cls(pacientes, [_Segment(pacientes, 0)], np.ones(len(pacientes), dtype=bool), version)
+
+    def __len__(self):
+        return int(self.vivos.sum())
+
+    def apply_delta(self, removed, added, version):
+        """Índice tras reemplazar los pacientes de `removed` por los de `added`."""
+        nuevos = patient_table(added)
+        cambiados = set(nuevos['CEDULA'])
+        if removed is not None and 'CEDULA' in removed.columns:
+            cambiados |= set(_text(removed, 'CEDULA'))
+
+        vivos = self.vivos & ~self.pacientes['CEDULA'].isin(cambiados).to_numpy()
+        pacientes = pd.concat([self.pacientes, nuevos], ignore_index=True)
+        vivos = np.concatenate([vivos, np.ones(len(nuevos), dtype=bool)])
+
+        # Borrados + filas fuera del segmento base: si pesan demasiado se compacta
+        pendientes = int((~vivos).sum()) + len(pacientes) - self.segmentos[0].size
+        if pendientes > COMPACT_RATIO * max(int(vivos.sum()), 1):
+            return PatientSearchIndex.from_patients(pacientes[vivos], version)
+        return PatientSearchIndex(pacientes, self.segmentos + [_Segment(nuevos, len(self.pacientes))], vivos, version)
+
+    # ---------- consulta ----------
+    def _term_ranks(self, termino):
+        """Rango de la coincidencia del término en cada paciente (SIN_COINCIDENCIA si no aparece)."""
+        rangos = np.full(len(self.pacientes), SIN_COINCIDENCIA, dtype=np.int8)
+        t = termino.encode()
+
+        for segmento in self.segmentos:
+            rangos[segmento.tokens.prefix(t)] = RANGO_TEXTO
+
+        if len(t) >= 3:
+            # Intersección de las listas de los trigramas, de la más corta a la más larga
+            candidatos = []
+            for segmento in self.segmentos:
+                listas = sorted((segmento.trigramas.get(c) for c in np.unique(_trigram_codes(termino))), key=len)
+                ids = listas[0]
+                for lista in listas[1:]:
+                    if not len(ids):
+                        break
+                    ids = np.intersect1d(ids, lista, assume_unique=True)
+                candidatos.append(ids)
+        else:
+            candidatos = [segmento.palabras.prefix(t) for segmento in self.segmentos]
+        candidatos = np.unique(np.concatenate(candidatos))
+
+        if len(candidatos):
+            # Verificación solo de los candidatos (los trigramas no garantizan el orden)
+            nombres, cedulas = self._nombres[candidatos], self._cedulas[candidatos]
+            rango = np.select(
+                [
+                    np.char.startswith(cedulas, t),
+                    np.char.find(nombres, b' ' + t) >= 0,
+                    (np.char.find(nombres, t) >= 0) | (np.char.find(cedulas, t) >= 0),
+                ],
+                [RANGO_CEDULA, RANGO_PALABRA, RANGO_NOMBRE],
+                SIN_COINCIDENCIA,
+            ).astype(np.int8)
+            rangos[candidatos] = np.minimum(rangos[candidatos], rango)
+        return rangos
+
+    def search(self, query, limit=MAX_RESULTS):
+        """
+        Pacientes que contienen todos los términos de `query`.
+        Retorna (df, total): hasta `limit` filas (CEDULA, NOMBRE, ESTADO, RANGO) ordenadas.
+        """
+        terminos = set(normalize(query).split())
+        vacio = pd.DataFrame(columns=['CEDULA', 'NOMBRE', 'ESTADO', 'RANGO'])
+        if not terminos:
+            return vacio, 0
+
+        rangos = None
+        for termino in terminos:
+            # Un paciente vale lo que su peor término
+            actual = self._term_ranks(termino)
+            rangos = actual if rangos is None else np.maximum(rangos, actual)
+        rangos[~self.vivos] = SIN_COINCIDENCIA
+
+        ids = np.flatnonzero(rangos != SIN_COINCIDENCIA)
+        if not len(ids):
+            return vacio, 0
+        orden = ids[np.lexsort((self._cedulas[ids], self._nombres[ids], rangos[ids]))][:limit]
+
+        df = self.pacientes.iloc[orden][['CEDULA', 'NOMBRE', 'ESTADO']].reset_index(drop=True)
+        df['RANGO'] = rangos[orden]
+        return df, len(ids)
+
+
+class SearchIndexStore(VersionedStore):
+    """
+    Último índice construido en el proceso. Con el delta del cargador desde la
+    versión guardada se actualiza en lugar de reconstruirse (como RollupStore).
+    """
+
+    def __init__(self):
+        super().__init__(PatientSearchIndex.from_frame)
+
+
+def fetch_search_index():
+    """Índice construido con solo las columnas de búsqueda (modo con filtros en la base de datos)."""
+    return PatientSearchIndex.from_frame(run_query(SEARCH_QUERY))
+
+
+# ==========================================================
+#   INTERFAZ
+# ==========================================================
+def render_patient_search(index, key='busqueda'):
+    """Caja de búsqueda y tabla de pacientes encontrados (en todos los pacientes, sin los filtros)."""
+    st.markdown("### 🔎 Buscar Paciente")
+    query = st.text_input(
+        "Nombre, cédula, observaciones o resultados",
+        key=key,
+        placeholder="Ej.: ramirez, 1015838, confirmado",
+    )
+    if not query.strip():
+        return None
+
+    inicio = time.perf_counter()
+    resultados, total = index.search(query)
+    milisegundos = (time.perf_counter() - inicio) * 1000
+
+    if not total:
+        st.info(f"Ningún paciente coincide con «{query}».")
+        return resultados
+
+    st.dataframe(
+        pd.DataFrame({
+            'Cédula': resultados['CEDULA'],
+            'Nombre': resultados['NOMBRE'],
+            'Estado': resultados['ESTADO'],
+            'Coincidencia': resultados['RANGO'].map(COINCIDENCIAS),
+        }),
+        use_container_width=True,
+        hide_index=True,
+    )
+    mostrados = f" (se muestran {len(resultados)})" if total > len(resultados) else ""
+    st.caption(f"{total:,} pacientes{mostrados} · {milisegundos:.1f} ms · índice de {len(index):,} pacientes")
+    return resultados
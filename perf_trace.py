@@ -0,0 +1,187 @@
+# perf_trace.py
+"""
+Trazas de rendimiento por rerun del dashboard.
+
+Cada rerun abre una traza (start_trace) y las etapas se envuelven con span():
+
+    with span('load_data') as s:
+        df = ...
+        s.set_rows(len(df))
+
+Por etapa se registra la latencia, las filas y la variación de memoria del
+proceso (RSS). Al cerrar la traza (finish_trace) se escribe una línea JSON en el
+logger 'tmz.perf' (a stderr o al archivo de TMZ_PERF_LOG) y se retorna el
+resumen para el panel de depuración de la barra lateral.
+
+Se activa con TMZ_PERF_TRACE=1 o con ?perf=1 en la URL. Sin traza activa,
+span() retorna un contexto vacío compartido: no lee relojes ni memoria.
+La traza vive en un ContextVar, así que los hilos en segundo plano (refresco del
+cargador) y las demás sesiones no escriben en ella.
+"""
+
+import contextvars
+import json
+import logging
+import os
+import time
+
+PERF_TRACE_ENABLED = os.environ.get('TMZ_PERF_TRACE') == '1'
+PERF_LOG_PATH = os.environ.get('TMZ_PERF_LOG')
+
+logger = logging.getLogger('tmz.perf')
+
+_current_trace = contextvars.ContextVar('tmz_perf_trace', default=None)
+
+try:
+    _PAGE_SIZE = os.sysconf('SC_PAGE_SIZE')
+except (AttributeError, ValueError, OSError):
+    _PAGE_SIZE = None
+
+
+def _rss_bytes():
+    """Memoria residente actual del proceso (Linux); None si no se puede leer."""
+    if _PAGE_SIZE is None:
+        return None
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def _configure_logger():
+    """Un handler de una línea por traza, agregado una sola vez."""
+    if logger.handlers:
+        return
+    handler = logging.FileHandler(PERF_LOG_PATH, encoding='utf-8') if PERF_LOG_PATH else logging.StreamHandler()
+    handler.setFormatter(logging.Formatter('%(message)s'))
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+
+class _NoopSpan:
+    """Contexto vacío para cuando no hay traza activa."""
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def set_rows(self, rows):
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+class Span:
+    """Una etapa cronometrada dentro de una traza."""
+    __slots__ = ('trace', 'name', 'depth', 'rows', 'seconds', 'mem_delta_mb', 'error', '_inicio', '_rss')
+
+    def __init__(self, trace, name, rows=None):
+        self.trace = trace
+        self.name = name
+        self.rows = rows
+        self.depth = 0
+        self.seconds = None
+        self.mem_delta_mb = None
+        self.error = None
+
+    def set_rows(self, rows):
+        self.rows = None if rows is None else int(rows)
+
+    def __enter__(self):
+        # Se registra al entrar para que las etapas anidadas queden después de su padre
+        self.depth = self.trace._depth
+        self.trace._depth += 1
+        self.trace.spans.append(self)
+        self._rss = _rss_bytes()
+        self._inicio = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.seconds = time.perf_counter() - self._inicio
+        rss = _rss_bytes()
+        if rss is not None and self._rss is not None:
+            self.mem_delta_mb = (rss - self._rss) / 1e6
+        if exc_type is not None:
+            self.error = exc_type.__name__
+        self.trace._depth -= 1
+        return False
+
+    def to_dict(self):
+        return {
+            'name': self.name,
+            'depth': self.depth,
+            'seconds': None if self.seconds is None else round(self.seconds, 6),
+            'rows': self.rows,
+            'mem_delta_mb': None if self.mem_delta_mb is None else round(self.mem_delta_mb, 3),
+            'error': self.error,
+        }
+
+
+class Trace:
+    """Etapas de un rerun, en el orden en que empezaron."""
+
+    def __init__(self, name='rerun', **context):
+        self.name = name
+        self.context = context
+        self.spans = []
+        self.started_at = time.time()
+        self._depth = 0
+        self._inicio = time.perf_counter()
+        self.seconds = None
+
+    def span(self, name, rows=None):
+        return Span(self, name, rows)
+
+    def to_dict(self):
+        return {
+            'trace': self.name,
+            'started_at': round(self.started_at, 3),
+            'seconds': None if self.seconds is None else round(self.seconds, 6),
+            **self.context,
+            'spans': [s.to_dict() for s in self.spans],
+        }
+
+
+def start_trace(name='rerun', enabled=None, **context):
+    """
+    Abre la traza del rerun actual y la retorna (None si está desactivada).
+    `context` se agrega tal cual al JSON (p. ej. modo de filtros, versión de datos).
+    """
+    if not (PERF_TRACE_ENABLED if enabled is None else enabled):
+        _current_trace.set(None)
+        return None
+    trace = Trace(name, **context)
+    _current_trace.set(trace)
+    return trace
+
+
+def finish_trace(trace):
+    """Cierra la traza, escribe su línea JSON y retorna el resumen como dict (None si no había)."""
+    if trace is None:
+        return None
+    trace.seconds = time.perf_counter() - trace._inicio
+    if _current_trace.get() is trace:
+        _current_trace.set(None)
+
+    resumen = trace.to_dict()
+    _configure_logger()
+    logger.info(json.dumps(resumen, ensure_ascii=False, default=str))
+    return resumen
+
+
+def current_trace():
+    return _current_trace.get()
+
+
+def span(name, rows=None):
+    """Contexto que cronometra una etapa en la traza activa (o no hace nada si no hay)."""
+    trace = _current_trace.get()
+    if trace is None:
+        return NOOP_SPAN
+    return Span(trace, name, rows)
@@ -1,78 +1,207 @@
+import datetime
+
 import pandas as pd
+from openpyxl import load_workbook
+
+# Filas por bloque del lector en streaming
+DEFAULT_CHUNK_SIZE = 5000
+
+# Textos que pd.read_excel interpreta como nulos por defecto (se cargan como '')
+NA_TEXTS = {
+    '', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN', '-nan', '1.#IND',
+    '1.#QNAN', '<NA>', 'N/A', 'NA', 'NULL', 'NaN', 'None', 'n/a', 'nan', 'null',
+}
+
+EXCEL_PACIENTES = 'archivos_excel/pacientes.xlsx'
+EXCEL_FASES = 'archivos_excel/tmz.xlsx'
+
+
+def _clean_name(col):
+    clean = col.upper()
+    clean = clean.replace(' ', '_').replace('/', '_').replace('.', '').replace('É', 'E')
+    clean = clean.replace('__', '_')
+    return clean.strip('_')
+
 
 # --- Función de Utilidad para Normalizar Encabezados ---
 def normalize_columns_and_rename(df, table_name):
     """Normaliza nombres de columna y elimina columnas 'UNNAMED'."""
-    def clean_name(col):
-        clean = col.upper()
-        clean = clean.replace(' ', '_').replace('/', '_').replace('.', '').replace('É', 'E')
-        clean = clean.replace('__', '_')
-        return clean.strip('_')
-
-    original_to_clean = {col: clean_name(col) for col in df.columns}
+    original_to_clean = {col: _clean_name(col) for col in df.columns}
     df.columns = original_to_clean.values()
 
     df = df.drop(df.filter(like='UNNAMED').columns, axis=1)
     return df
 
 
-def load_and_process_excels():
-    """Carga, limpia y tipifica los excels para la inserción SQL. Retorna df_pacientes y df_fases."""
-    
-    # -----------------------------------------------------------
-    # 1. Procesamiento de df_pacientes
-    # -----------------------------------------------------------
-    df_pacientes = pd.read_excel('archivos_excel/pacientes.xlsx', dtype=str)
-    df_pacientes = normalize_columns_and_rename(df_pacientes, 'Pacientes')
-
-    # Corrección 1: Asegurar que TODAS las columnas sean strings y manejar NaN
-    # Reemplazar NaN con cadena vacía ('') y forzar el tipo string
-    df_pacientes = df_pacientes.fillna('')
-    for col in df_pacientes.columns:
-        df_pacientes[col] = df_pacientes[col].astype(str)
-        
-    
-    
-
-
-    # -----------------------------------------------------------
-    # 2. Procesamiento de df_fases
-    # -----------------------------------------------------------
-    df_fases = pd.read_excel('archivos_excel/tmz.xlsx', dtype=str)
-    df_fases = normalize_columns_and_rename(df_fases, 'FasePaciente')
-
-    if 'DOCUMENTO' in df_fases.columns:
-        df_fases = df_fases.rename(columns={'DOCUMENTO': 'PACIENTE_CEDULA'})
-    elif 'CEDULA' in df_fases.columns:
-        df_fases = df_fases.rename(columns={'CEDULA': 'PACIENTE_CEDULA'})
-
-
-    # Corrección 2: Asegurar que TODAS las columnas sean strings y manejar NaN
-    df_fases = df_fases.fillna('')
-    for col in df_fases.columns:
-        df_fases[col] = df_fases[col].astype(str)
-
-    # Ajuste clave para la FK (asumiendo que en el excel tmz.xlsx la cédula se llama 'CEDULA')
-    df_fases = df_fases.rename(columns={'CEDULA': 'PACIENTE_CEDULA'})
+# ==========================================================
+#   LECTOR EN STREAMING (openpyxl read_only)
+# ==========================================================
+def _cell_to_str(value):
+    """Convierte una celda al mismo texto que produce pd.read_excel(dtype=str) + fillna('')."""
+    if value is None:
+        return ''
+    if isinstance(value, bool):
+        return str(value)
+    if isinstance(value, float):
+        # Igual que pandas: los flotantes enteros se leen como int ('12.0' -> '12')
+        return str(int(value)) if value.is_integer() else str(value)
+    if isinstance(value, (int, datetime.datetime, datetime.date, datetime.time)):
+        return str(value)
+    value = str(value)
+    return '' if value in NA_TEXTS else value
+
+
+def _header_names(header):
+    """Encabezados como los deja pandas: 'Unnamed: i' si están vacíos y duplicados como 'X.1'."""
+    names = []
+    seen = {}
+    for i, value in enumerate(header):
+        name = f'Unnamed: {i}' if value is None or str(value) == '' else str(value)
+        if name in seen:
+            seen[name] += 1
+            name = f'{name}.{seen[name]}'
+        else:
+            seen[name] = 0
+        names.append(name)
+    return names
+
+
+def iter_excel_chunks(path, chunk_size=DEFAULT_CHUNK_SIZE, empty_value=''):
+    """
+    Lee la primera hoja de `path` fila a fila (openpyxl en modo read_only) y
+    produce DataFrames de hasta `chunk_size` filas con los encabezados
+    normalizados, sin columnas 'UNNAMED' y todas las celdas como texto (las
+    vacías como `empty_value`; None las deja nulas). La memoria se mantiene en un bloque, sin importar el tamaño
+    del libro. Las filas completamente vacías se omiten, como en pd.read_excel.
+    """
+    # keep_links=False: no se cargan las cachés de vínculos externos (pueden pesar más que la hoja)
+    wb = load_workbook(path, read_only=True, data_only=True, keep_links=False)
+    try:
+        rows = wb.worksheets[0].iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+
+        names = [_clean_name(name) for name in _header_names(header)]
+        keep = [i for i, name in enumerate(names) if 'UNNAMED' not in name]
+        columns = [names[i] for i in keep]
+
+        chunk = []
+        for row in rows:
+            if all(value is None or value == '' for value in row):
+                continue
+            values = [_cell_to_str(row[i]) if i < len(row) else '' for i in keep]
+            if empty_value != '':
+                values = [value if value != '' else empty_value for value in values]
+            chunk.append(values)
+            if len(chunk) >= chunk_size:
+                yield pd.DataFrame(chunk, columns=columns, dtype=str)
+                chunk = []
+        if chunk:
+            yield pd.DataFrame(chunk, columns=columns, dtype=str)
+    finally:
+        wb.close()
+
+
+def _rename_fases(df):
+    # Ajuste clave para la FK: la cédula de tmz.xlsx se llama 'DOCUMENTO' (o 'CEDULA')
+    if 'DOCUMENTO' in df.columns:
+        return df.rename(columns={'DOCUMENTO': 'PACIENTE_CEDULA'})
+    return df.rename(columns={'CEDULA': 'PACIENTE_CEDULA'})
+
+
+def filter_fases_fk(df_fases, cedulas_pacientes_validas):
+    """Fases cuyo PACIENTE_CEDULA existe en los pacientes. Retorna (fases_validas, omitidas)."""
+    validas = df_fases['PACIENTE_CEDULA'].isin(cedulas_pacientes_validas)
+    return df_fases[validas], int((~validas).sum())
+
+
+def report_fk_omitted(omitidas):
+    print(f"[FasePaciente]: Se omitieron {omitidas} filas porque su PACIENTE_CEDULA no existe en el conjunto de pacientes válidos (Error de FK).")
+
+
+def stream_excels(chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Produce (nombre_tabla, bloque) en orden de carga: primero Pacientes_tmz y
+    luego FasePaciente, filtrando las fases cuyo PACIENTE_CEDULA no está en los
+    pacientes (FK). Solo se retiene en memoria el conjunto de cédulas válidas.
+    """
+    cedulas_pacientes_validas = set()
+    for chunk in iter_excel_chunks(EXCEL_PACIENTES, chunk_size):
+        cedulas_pacientes_validas.update(chunk['CEDULA'])
+        yield 'Pacientes_tmz', chunk
 
     # **FILTRO CRÍTICO 2 (FK FIX):** Asegurar que solo se inserten fases con pacientes ya cargados
-    
-    # Obtener la lista de cédulas válidas que se insertarán en Pacientes_tmz
-    cedulas_pacientes_validas = df_pacientes['CEDULA'].unique()
-
-    filas_originales_fases = len(df_fases)
-    
-    # Filtrar df_fases para solo incluir cédulas que estén en la lista de pacientes
-    df_fases = df_fases[
-        df_fases['PACIENTE_CEDULA'].isin(cedulas_pacientes_validas)
-    ]
-
-    print(f"[FasePaciente]: Se omitieron {filas_originales_fases - len(df_fases)} filas porque su PACIENTE_CEDULA no existe en el conjunto de pacientes válidos (Error de FK).")
-
-    
-
-    return df_pacientes, df_fases
-
-
+    omitidas = 0
+    for chunk in iter_excel_chunks(EXCEL_FASES, chunk_size):
+        chunk, n = filter_fases_fk(_rename_fases(chunk), cedulas_pacientes_validas)
+        omitidas += n
+        yield 'FasePaciente', chunk
+
+    report_fk_omitted(omitidas)
+
+
+def iter_workbook_chunks(table_name, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Bloques del libro de una tabla, con los renombramientos de la tabla pero sin el filtro de FK."""
+    path = EXCEL_PACIENTES if table_name == 'Pacientes_tmz' else EXCEL_FASES
+    for chunk in iter_excel_chunks(path, chunk_size):
+        yield _rename_fases(chunk) if table_name == 'FasePaciente' else chunk
+
+
+def read_workbook(table_name, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Libro completo de una tabla (bloques unidos). Es una función de módulo para
+    poder ejecutarse en un pool de procesos (ver etl_runner).
+    """
+    chunks = list(iter_workbook_chunks(table_name, chunk_size))
+    return pd.concat(chunks, ignore_index=True) if chunks else pd.DataFrame()
+
+
+def table_sources(chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    {nombre_tabla: función que produce sus bloques}, para recorrer cada libro las
+    veces que haga falta (excel_sync.sync_tables) sin tenerlo completo en memoria.
+    Las fases se filtran por la FK como en stream_excels(); las cédulas válidas se
+    leen una sola vez.
+    """
+    cedulas_pacientes_validas = set()
+
+    def pacientes():
+        return iter_workbook_chunks('Pacientes_tmz', chunk_size)
+
+    def fases():
+        primera_vez = not cedulas_pacientes_validas
+        if primera_vez:
+            for chunk in pacientes():
+                cedulas_pacientes_validas.update(chunk['CEDULA'])
+        omitidas = 0
+        for chunk in iter_workbook_chunks('FasePaciente', chunk_size):
+            chunk, n = filter_fases_fk(chunk, cedulas_pacientes_validas)
+            omitidas += n
+            yield chunk
+        if primera_vez:
+            report_fk_omitted(omitidas)
+
+    return {'Pacientes_tmz': pacientes, 'FasePaciente': fases}
+
+
+def table_templates():
+    """DataFrames vacíos con las columnas finales de cada tabla (para crear el esquema antes de cargar)."""
+    templates = {}
+    for table_name in ('Pacientes_tmz', 'FasePaciente'):
+        # Solo se lee el encabezado y la primera fila
+        primero = next(iter_workbook_chunks(table_name, chunk_size=1), pd.DataFrame())
+        templates[table_name] = primero.iloc[:0]
+    return templates
+
+
+def load_and_process_excels(chunk_size=DEFAULT_CHUNK_SIZE):
+    """Carga, limpia y tipifica los excels para la inserción SQL. Retorna df_pacientes y df_fases."""
+    bloques = {'Pacientes_tmz': [], 'FasePaciente': []}
+    for table_name, chunk in stream_excels(chunk_size):
+        bloques[table_name].append(chunk)
 
+    def unir(chunks):
+        return pd.concat(chunks, ignore_index=True) if chunks else pd.DataFrame()
 
+    return unir(bloques['Pacientes_tmz']), unir(bloques['FasePaciente'])
@@ -0,0 +1,162 @@
+# query_cache.py
+"""
+Caché de resultados de consultas para fetch_data, acotada por memoria.
+
+- Clave: SQL normalizado (espacios colapsados fuera de los literales, sin ';'
+  final) más los parámetros enlazados; la misma consulta escrita con otra
+  indentación o con tipos numpy en los parámetros comparte la entrada.
+- Cada entrada guarda su tamaño (memoria del DataFrame + SQL). Al superar el
+  presupuesto se descartan las menos usadas (LRU); un resultado más grande que
+  el presupuesto no se guarda.
+- Las entradas vencen a los `ttl` segundos, como el st.cache_data anterior.
+- invalidate() descarta todo o solo lo que lee ciertas tablas. Una consulta que
+  empezó antes de la invalidación no se guarda al terminar (generación).
+- check_stamp() invalida todo si cambia una marca externa (p. ej. la que deja
+  el ETL de otro proceso en la base), consultándola a lo sumo cada N segundos.
+- Contadores de aciertos, fallos, descartes e invalidaciones (stats()).
+
+Los DataFrames se comparten entre sesiones: get() retorna una vista superficial
+(Copy-on-Write), así que modificarla no altera la entrada guardada.
+"""
+
+import re
+import threading
+import time
+from collections import OrderedDict
+
+_ESPACIOS = re.compile(r'\s+')
+
+
+def normalize_sql(query):
+    """SQL con los espacios colapsados fuera de los literales '...' y sin ';' final."""
+    partes = query.strip().rstrip(';').split("'")
+    # Las partes impares están dentro de un literal (un '' escapado deja una parte vacía)
+    return "'".join(p if i % 2 else _ESPACIOS.sub(' ', p) for i, p in enumerate(partes)).strip()
+
+
+def _normalize_param(value):
+    if hasattr(value, 'item'):  # escalares de numpy
+        return value.item()
+    if isinstance(value, list):
+        return tuple(value)
+    return value
+
+
+def cache_key(query, params=None):
+    return normalize_sql(query), tuple(_normalize_param(p) for p in params or ())
+
+
+def _entry_bytes(df, sql):
+    return int(df.memory_usage(deep=True).sum()) + len(sql)
+
+
+class QueryCache:
+    """LRU de resultados por (SQL normalizado, parámetros) con presupuesto de memoria en bytes."""
+
+    def __init__(self, max_bytes, ttl=600):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries = OrderedDict()   # clave -> (df, bytes, guardado_en)
+        self._bytes = 0
+        self._generation = 0
+        self._stamp = None
+        self._stamp_checked = 0.0
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = self.invalidations = 0
+
+    def _drop(self, key):
+        _, nbytes, _ = self._entries.pop(key)
+        self._bytes -= nbytes
+
+    def get(self, key):
+        """Resultado guardado (vista) o None si no está o venció."""
+        with self._lock:
+            entrada = self._entries.get(key)
+            if entrada is not None and time.time() - entrada[2] > self.ttl:
+                self._drop(key)
+                entrada = None
+            if entrada is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entrada[0].copy(deep=False)
+
+    def generation(self):
+        return self._generation
+
+    def put(self, key, df, generation=None):
+        """Guarda el resultado si cabe y no hubo una invalidación desde `generation`."""
+        nbytes = _entry_bytes(df, key[0])
+        with self._lock:
+            if (generation is not None and generation != self._generation) or nbytes > self.max_bytes:
+                return False
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (df, nbytes, time.time())
+            self._bytes += nbytes
+            while self._bytes > self.max_bytes:
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+            return True
+
+    def get_or_run(self, query, params, run):
+        """Resultado de la caché o de run(query, params), que se guarda (los errores no)."""
+        key = cache_key(query, params)
+        df = self.get(key)
+        if df is not None:
+            return df
+        generation = self.generation()
+        df = run(query, params)
+        self.put(key, df, generation)
+        return df.copy(deep=False)
+
+    def invalidate(self, tables=None):
+        """
+        Descarta todas las entradas o solo las que leen alguna de `tables`
+        (nombre con o sin esquema). Retorna cuántas se descartaron.
+        """
+        with self._lock:
+            self._generation += 1
+            self.invalidations += 1
+            if tables is None:
+                claves = list(self._entries)
+            else:
+                nombres = [t.split('.')[-1].lower() for t in tables]
+                claves = [k for k in self._entries if any(n in k[0].lower() for n in nombres)]
+            for key in claves:
+                self._drop(key)
+            return len(claves)
+
+    def check_stamp(self, read_stamp, every):
+        """
+        Invalida todo si read_stamp() cambió desde la última verificación (a lo sumo
+        una cada `every` segundos). Si la marca no se puede leer, no se invalida.
+        """
+        ahora = time.time()
+        if ahora - self._stamp_checked < every:
+            return False
+        self._stamp_checked = ahora
+        try:
+            stamp = read_stamp()
+        except Exception:
+            return False
+        anterior, self._stamp = self._stamp, stamp
+        if anterior is not None and stamp != anterior:
+            self.invalidate()
+            return True
+        return False
+
+    def stats(self):
+        with self._lock:
+            consultas = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / consultas if consultas else None,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+            }
@@ -0,0 +1,49 @@
+"""
+Benchmark de los métodos de inserción de `bulk_insert` contra SQLite local.
+
+Uso (desde la raíz del repositorio):
+    python scripts/benchmark_bulk_insert.py --repeat 10 --batch-size 1000
+"""
+import argparse
+import os
+import sys
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bulk_insert import bulk_insert_dataframe, METHODS
+from local_db import get_sqlite_connection, create_tables_from_frames
+from process_excel import normalize_columns_and_rename
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compara los métodos de inserción por lotes en SQLite.")
+    parser.add_argument("--repeat", type=int, default=1, help="Veces que se replica tmz.xlsx para simular volumen.")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    args = parser.parse_args()
+
+    # Se usa tmz.xlsx completo (sin el filtro de FK) para tener volumen suficiente
+    df_fases = pd.read_excel('archivos_excel/tmz.xlsx', dtype=str)
+    df_fases = normalize_columns_and_rename(df_fases, 'FasePaciente').fillna('')
+    df_fases = pd.concat([df_fases] * args.repeat, ignore_index=True)
+
+    print(f"\n== BENCHMARK: {len(df_fases)} filas x {len(df_fases.columns)} columnas ==\n")
+
+    resultados = []
+    for method in [m for m in METHODS if m != 'auto']:
+        conn = get_sqlite_connection(':memory:')
+        create_tables_from_frames(conn, {'FasePaciente': df_fases}, drop_existing=True)
+        stats = bulk_insert_dataframe(df_fases, 'tmz_data.FasePaciente', conn,
+                                      batch_size=args.batch_size, method=method)
+        resultados.append(stats)
+        conn.close()
+
+    print("\n" + "=" * 50)
+    for stats in resultados:
+        print(f"{stats['method']:<12} {stats['seconds']:>8.3f}s {stats['rows_per_sec']:>12,.0f} filas/s")
+    print("=" * 50)
+
+
+if __name__ == '__main__':
+    main()
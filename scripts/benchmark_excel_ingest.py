@@ -0,0 +1,94 @@
+"""
+Benchmark de la lectura de Excel: pd.read_excel(dtype=str) + fillna + astype
+(camino anterior) contra el lector en streaming de `process_excel` (openpyxl read_only).
+
+Mide tiempo y pico de memoria (tracemalloc) sobre los archivos de `archivos_excel`
+y sobre un libro sintético de `--rows` filas generado a partir de tmz.xlsx.
+
+Uso (desde la raíz del repositorio):
+    python scripts/benchmark_excel_ingest.py --rows 100000 --chunk-size 5000
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import pandas as pd
+from openpyxl import Workbook, load_workbook
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from process_excel import DEFAULT_CHUNK_SIZE, iter_excel_chunks, normalize_columns_and_rename
+
+
+def lectura_completa(path):
+    """Camino anterior: libro completo en memoria y conversión columna por columna."""
+    df = normalize_columns_and_rename(pd.read_excel(path, dtype=str), 'bench')
+    df = df.fillna('')
+    for col in df.columns:
+        df[col] = df[col].astype(str)
+    return len(df)
+
+
+def lectura_streaming(path, chunk_size):
+    """Lector por bloques: cada bloque se descarta tras usarse (como en la carga a la base)."""
+    return sum(len(chunk) for chunk in iter_excel_chunks(path, chunk_size))
+
+
+def medir(funcion, *args):
+    """Tiempo en una pasada sin trazas y pico de memoria en otra (tracemalloc distorsiona el tiempo)."""
+    inicio = time.perf_counter()
+    filas = funcion(*args)
+    segundos = time.perf_counter() - inicio
+
+    tracemalloc.start()
+    funcion(*args)
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return filas, segundos, pico / 1e6
+
+
+def generar_libro(origen, filas, destino):
+    """Libro sintético de `filas` filas repitiendo las de `origen` (escritura en streaming)."""
+    wb_origen = load_workbook(origen, read_only=True, data_only=True)
+    filas_origen = list(wb_origen.worksheets[0].iter_rows(values_only=True))
+    wb_origen.close()
+    header, datos = filas_origen[0], filas_origen[1:]
+
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet()
+    ws.append(header)
+    for i in range(filas):
+        ws.append(datos[i % len(datos)])
+    wb.save(destino)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compara la lectura completa de Excel con el lector en streaming.")
+    parser.add_argument("--rows", type=int, default=20000, help="Filas del libro sintético (0 para omitirlo).")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    args = parser.parse_args()
+
+    libros = ['archivos_excel/pacientes.xlsx', 'archivos_excel/tmz.xlsx']
+    tmp_dir = tempfile.mkdtemp()
+    if args.rows:
+        sintetico = os.path.join(tmp_dir, f'sintetico_{args.rows}.xlsx')
+        print(f"Generando libro sintético de {args.rows} filas...")
+        generar_libro('archivos_excel/tmz.xlsx', args.rows, sintetico)
+        libros.append(sintetico)
+
+    print("\n" + "=" * 78)
+    print(f"{'libro':<28} {'método':<10} {'filas':>9} {'segundos':>9} {'pico MB':>9}")
+    print("=" * 78)
+    for path in libros:
+        for nombre, funcion, extra in (('completa', lectura_completa, ()),
+                                       ('streaming', lectura_streaming, (args.chunk_size,))):
+            filas, segundos, pico = medir(funcion, path, *extra)
+            print(f"{os.path.basename(path):<28} {nombre:<10} {filas:>9} {segundos:>9.2f} {pico:>9.1f}")
+    print("=" * 78)
+
+
+if __name__ == '__main__':
+    main()
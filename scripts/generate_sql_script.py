@@ -1,8 +1,16 @@
 from azure_connector import get_azure_sql_connection
+from bulk_insert import bulk_insert_dataframe, DEFAULT_BATCH_SIZE
+from typed_schema import convert_for_schema, index_statements, infer_column_types, read_column_types
 import pandas as pd
 import os
 import io
 
+# Nombre de cada tabla en el esquema del dashboard (para sus índices)
+TABLE_KEYS = {'Pacientes': 'Pacientes_tmz'}
+
+# TMZ_COLUMNSTORE_INDEX=1: un índice columnstore no agrupado en lugar de los índices por columna
+COLUMNSTORE = os.environ.get('TMZ_COLUMNSTORE_INDEX') == '1'
+
 # --- Función de Utilidad para Normalizar Encabezados ---
 def normalize_columns_and_rename(df, table_name):
     """Limpia los nombres de columna y retorna el DataFrame con los nuevos nombres."""
@@ -47,8 +55,12 @@ def map_pandas_to_sql(dtype):
     # Usamos NVARCHAR(255) para strings por defecto, excepto para fechas específicas.
     return 'NVARCHAR(255)' 
 
-def generate_create_table_sql(df, table_name):
-    """Genera la sentencia CREATE TABLE SQL a partir del DataFrame limpio."""
+def generate_create_table_sql(df, table_name, columnstore=False):
+    """
+    Genera la sentencia CREATE TABLE SQL a partir del DataFrame limpio, con sus índices.
+    Las columnas de fecha y los contadores que los datos confirman se crean como DATE / INT.
+    """
+    tipos = infer_column_types(df)
     sql = f"-- Tabla generada a partir del archivo {table_name}.xlsx\n"
     sql += f"DROP TABLE IF EXISTS {table_name};\n"
     sql += "GO\n\n"
@@ -71,7 +83,13 @@ def generate_create_table_sql(df, table_name):
         if col_name == 'CEDULA':
             sql_def = f"    [{col_name}] NVARCHAR(50) NOT NULL UNIQUE"
         
-        # NOMBRES DE COLUMNAS DE FECHA (Mantenidas como String)
+        # FECHAS Y ENTEROS CONFIRMADOS POR LOS DATOS (seriales de Excel o texto ISO -> DATE)
+        elif tipos.get(col_name) == 'date' and col_name != 'FASE_ORDEN':
+            sql_def = f"    [{col_name}] DATE NULL"
+        elif tipos.get(col_name) == 'int' and col_name != 'FASE_ORDEN':
+            sql_def = f"    [{col_name}] INT NULL"
+
+        # NOMBRES DE COLUMNAS DE FECHA CON VALORES NO CONVERTIBLES (Mantenidas como String)
         elif 'FECHA' in col_name or 'MES' in col_name:
              sql_def = f"    [{col_name}] NVARCHAR(50) NULL"
         
@@ -93,15 +111,36 @@ def generate_create_table_sql(df, table_name):
             
         col_definitions.append(sql_def)
 
+    # 3. Columna de versión de fila: marca de agua del refresco incremental del dashboard
+    col_definitions.append("    [VERSION_FILA] ROWVERSION")
+
     sql += ",\n".join(col_definitions)
     sql += "\n);\n"
     
-    # 3. Adición de Clave Foránea (para FasePaciente)
+    # 4. Adición de Clave Foránea (para FasePaciente)
     if table_name == 'FasePaciente':
         sql += "\nALTER TABLE FasePaciente ADD CONSTRAINT FK_PacienteFase \n"
         sql += "FOREIGN KEY (PACIENTE_CEDULA) REFERENCES Pacientes(CEDULA);\n"
         
     sql += "GO\n"
+
+    # 4b. Borrar una fase (o cambiarla de paciente) no deja VERSION_FILA: se renueva la del paciente
+    #     anterior para que el refresco incremental del dashboard lo vuelva a leer
+    if table_name == 'FasePaciente':
+        sql += "\nCREATE TRIGGER TR_FasePaciente_TocarPaciente ON FasePaciente AFTER DELETE, UPDATE AS\n"
+        sql += "BEGIN\n"
+        sql += "    SET NOCOUNT ON;\n"
+        sql += "    IF NOT EXISTS (SELECT 1 FROM inserted) OR UPDATE(PACIENTE_CEDULA)\n"
+        sql += "        UPDATE P SET P.CEDULA = P.CEDULA\n"
+        sql += "        FROM Pacientes P JOIN deleted d ON P.CEDULA = d.PACIENTE_CEDULA;\n"
+        sql += "END;\n"
+        sql += "GO\n"
+
+    # 5. Índices de los filtros del dashboard (ESTADO, fechas) y del JOIN (PACIENTE_CEDULA)
+    indices = index_statements(TABLE_KEYS.get(table_name, table_name), tipos, 'mssql',
+                               qualified_name=table_name, columnstore=columnstore)
+    for sentencia in indices:
+        sql += f"\n{sentencia};\nGO\n"
     
     return sql
 
@@ -115,7 +154,7 @@ def main():
         df_pacientes = normalize_columns_and_rename(df_pacientes, 'Pacientes')
         
        
-        sql_pacientes = generate_create_table_sql(df_pacientes, 'Pacientes')
+        sql_pacientes = generate_create_table_sql(df_pacientes, 'Pacientes', COLUMNSTORE)
         
         print("--- Estructura de df_pacientes (Limpio) ---")
         print(df_pacientes.info())
@@ -137,7 +176,7 @@ def main():
         # Ajuste clave para Clave Foránea
         df_fases = df_fases.rename(columns={'CEDULA': 'PACIENTE_CEDULA'})
         
-        sql_fases = generate_create_table_sql(df_fases, 'FasePaciente')
+        sql_fases = generate_create_table_sql(df_fases, 'FasePaciente', COLUMNSTORE)
 
         print("--- Estructura de df_fases (Limpio) ---")
         print(df_fases.info())
@@ -164,36 +203,29 @@ def main():
 
 
 
-def insert_dataframe_to_sql(df, table_name):
+def insert_dataframe_to_sql(df, table_name, batch_size=DEFAULT_BATCH_SIZE):
     """
-    Inserta un DataFrame en Azure SQL usando pyodbc.
+    Inserta un DataFrame en Azure SQL usando pyodbc, en lotes de `batch_size` filas.
     """
     conn = get_azure_sql_connection()
     if conn is None:
         print("❌ No hay conexión a Azure SQL.")
         return
 
-    cursor = conn.cursor()
-
-    # Columnas
-    columns = ", ".join([f"[{col}]" for col in df.columns])
-    placeholders = ", ".join(["?"] * len(df.columns))
-
-    sql = f"INSERT INTO {table_name} ({columns}) VALUES ({placeholders})"
-
     try:
-        for _, row in df.iterrows():
-            cursor.execute(sql, tuple(row.values))
+        # Texto del Excel convertido a los tipos de la tabla (DATE / INT en el esquema tipado)
+        types = read_column_types(conn, table_name.split('.')[-1])
+        # Un valor que no cumple el tipo detiene la inserción (no se carga como NULL)
+        df = convert_for_schema(df, types, 'mssql', table_name)
 
-        conn.commit()
+        # Inserción por lotes (fast_executemany + commit por lote)
+        bulk_insert_dataframe(df, table_name, conn, batch_size=batch_size)
         print(f"✔ Datos insertados correctamente en {table_name}")
 
     except Exception as e:
-        conn.rollback()
         print(f"❌ Error insertando datos en {table_name}: {e}")
 
     finally:
-        cursor.close()
         conn.close()
 
 
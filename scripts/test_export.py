@@ -0,0 +1,79 @@
+"""
+Valida la exportación por bloques (data_export): el resultado de los datos
+diferidos de st.download_button pasa por la conversión de Streamlit y, leído de
+vuelta, tiene las mismas filas que la selección, en CSV, Parquet y XLSX.
+
+Uso (desde la raíz del repositorio):
+    python scripts/test_export.py
+"""
+import io
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+from openpyxl import load_workbook
+from streamlit.runtime.download_data_util import convert_data_to_bytes_and_infer_mime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from data_export import FORMATS, available_formats, deferred_export, iter_view_chunks
+from dataset_schema import apply_compact_dtypes
+from filter_index import FilteredView
+
+
+def frame_de_prueba(filas=2500):
+    """Frame con los tipos del dashboard: texto, categorías, fechas con nulos y enteros con nulos."""
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame({
+        'CEDULA': [f"{10_000_000 + i}" for i in range(filas)],
+        'NOMBRE': rng.choice(['JOSÉ PÉREZ', 'MARÍA LÓPEZ', 'ANA RUIZ'], filas),
+        'ESTADO': rng.choice(['PENDIENTE', 'REALIZADO', 'PROGRAMADO'], filas),
+        'FECHA_TOMA_MUESTRA': pd.to_datetime('2025-08-01') + pd.to_timedelta(rng.integers(0, 90, filas), unit='D'),
+        'EDAD': rng.integers(18, 95, filas).astype(float),
+    })
+    df.loc[df.index % 11 == 0, 'FECHA_TOMA_MUESTRA'] = pd.NaT
+    df.loc[df.index % 13 == 0, 'EDAD'] = np.nan
+    df, _ = apply_compact_dtypes(df)
+    return df
+
+
+def leer(data, extension):
+    if extension == 'csv':
+        return pd.read_csv(io.BytesIO(data), dtype=str, keep_default_na=False, encoding='utf-8-sig')
+    if extension == 'parquet':
+        return pd.read_parquet(io.BytesIO(data))
+    hoja = load_workbook(io.BytesIO(data), read_only=True).worksheets[0]
+    filas = list(hoja.iter_rows(values_only=True))
+    return pd.DataFrame(filas[1:], columns=filas[0])
+
+
+if __name__ == '__main__':
+    print("\n== VALIDANDO EXPORTACIÓN ==")
+
+    df = frame_de_prueba()
+    # Selección desordenada y más grande que un bloque
+    view = FilteredView(df, np.arange(len(df))[::-3].copy())
+    esperado = view.to_frame()['CEDULA'].astype(str).tolist()
+
+    fallos = 0
+    for formato in available_formats():
+        extension, mime = FORMATS[formato]
+        datos = deferred_export(lambda: iter_view_chunks(view, chunk_size=400), extension)()
+        try:
+            data, _ = convert_data_to_bytes_and_infer_mime(datos, unsupported_error=TypeError(type(datos)))
+        except TypeError as e:
+            fallos += 1
+            print(f"❌ {formato}: Streamlit no acepta el resultado ({e})")
+            continue
+
+        leido = leer(data, extension)
+        obtenido = leido['CEDULA'].astype(str).tolist()
+        if obtenido == esperado and list(leido.columns) == list(df.columns):
+            print(f"✔ {formato}: {len(leido)} filas, {len(data):,} bytes")
+        else:
+            fallos += 1
+            print(f"❌ {formato}: {len(obtenido)} filas leídas de {len(esperado)}")
+
+    print("\n✔ Exportación consistente" if fallos == 0 else f"\n❌ {fallos} formatos con diferencias")
+    sys.exit(1 if fallos else 0)
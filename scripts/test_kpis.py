@@ -0,0 +1,79 @@
+"""
+Valida que los KPIs calculados en SQL (kpis.build_kpi_query) coincidan con el
+camino pandas (kpis.compute_kpis) sobre una base SQLite local cargada con los Excel.
+
+Uso (desde la raíz del repositorio):
+    python scripts/test_kpis.py
+"""
+import datetime
+import os
+import sys
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bulk_insert import bulk_insert_dataframe
+from data_loader import FULL_QUERY, post_process
+from filter_spec import FilterSpec
+from kpis import build_kpi_query, compute_kpis, kpis_from_result
+from local_db import get_sqlite_connection, create_tables_from_frames
+from process_excel import normalize_columns_and_rename
+
+
+def cargar_base_local():
+    """SQLite en memoria con pacientes.xlsx más un paciente por cada cédula de tmz.xlsx."""
+    df_pacientes = normalize_columns_and_rename(pd.read_excel('archivos_excel/pacientes.xlsx', dtype=str), 'Pacientes')
+    df_fases = normalize_columns_and_rename(pd.read_excel('archivos_excel/tmz.xlsx', dtype=str), 'FasePaciente')
+    df_fases = df_fases.rename(columns={'DOCUMENTO': 'PACIENTE_CEDULA'})
+
+    # Pacientes sintéticos para que el LEFT JOIN tenga volumen: se copian
+    # ESTADO/MES/FECHA de los pacientes reales de forma cíclica
+    nuevas = pd.Series(df_fases['PACIENTE_CEDULA'].dropna().unique())
+    nuevas = nuevas[~nuevas.isin(df_pacientes['CEDULA'])].reset_index(drop=True)
+    plantilla = df_pacientes.iloc[nuevas.index % len(df_pacientes)].reset_index(drop=True)
+    plantilla['CEDULA'] = nuevas
+    plantilla.loc[plantilla.index % 7 == 0, 'ESTADO'] = 'PENDIENTE'
+    df_pacientes = pd.concat([df_pacientes, plantilla], ignore_index=True)
+
+    conn = get_sqlite_connection(':memory:')
+    create_tables_from_frames(conn, {'Pacientes_tmz': df_pacientes, 'FasePaciente': df_fases}, drop_existing=True)
+    bulk_insert_dataframe(df_pacientes, 'tmz_data.Pacientes_tmz', conn, verbose=False)
+    bulk_insert_dataframe(df_fases, 'tmz_data.FasePaciente', conn, verbose=False)
+    return conn
+
+
+CASOS = {
+    'sin filtros': FilterSpec(),
+    'estado REALIZADO': FilterSpec(estado='REALIZADO'),
+    'estado PENDIENTE': FilterSpec(estado='PENDIENTE'),
+    'rangos 60-69 / Sin Dato': FilterSpec(rangos=('De 60 a 69 años', 'Sin Dato')),
+    'rango de fechas': FilterSpec(fecha_desde=datetime.date(2025, 8, 5), fecha_hasta=datetime.date(2025, 10, 10)),
+    'combinado': FilterSpec(estado='REALIZADO', rangos=('De 70 a 79 años', 'De 80 a 89 años'),
+                            fecha_desde=datetime.date(2025, 8, 1), fecha_hasta=datetime.date(2025, 11, 30)),
+}
+
+
+if __name__ == '__main__':
+    print("\n== VALIDANDO KPIs: SQL vs PANDAS ==")
+
+    conn = cargar_base_local()
+    df_full = post_process(pd.read_sql(FULL_QUERY, conn))
+    print(f"Filas del LEFT JOIN: {len(df_full)}")
+
+    fallos = 0
+    for nombre, spec in CASOS.items():
+        esperado = compute_kpis(spec.apply(df_full))
+
+        sql, params = build_kpi_query(spec, 'sqlite')
+        obtenido = kpis_from_result(pd.read_sql(sql, conn, params=params))
+
+        if obtenido == esperado:
+            print(f"✔ {nombre}: {esperado}")
+        else:
+            fallos += 1
+            print(f"❌ {nombre}:\n   pandas: {esperado}\n   sql:    {obtenido}")
+
+    conn.close()
+    print("\n✔ KPIs consistentes" if fallos == 0 else f"\n❌ {fallos} casos con diferencias")
+    sys.exit(1 if fallos else 0)
@@ -0,0 +1,51 @@
+# shared_dataset.py
+"""
+Dataset procesado compartido, de solo lectura, por todas las sesiones del proceso.
+
+IncrementalLoader publica cada versión del frame como un SharedDataset: una sola
+copia por proceso, con el texto en arrays de Arrow y las columnas de baja
+cardinalidad como categorías (ver dataset_schema). Las sesiones no reciben el
+frame publicado sino una vista superficial (`frame`): comparte los buffers y
+cuesta O(columnas), no O(filas). Con Copy-on-Write, si una sesión modifica su
+vista solo se copia lo que toca; el dataset y las demás sesiones no cambian.
+
+Una recarga publica otro SharedDataset con la versión siguiente; el anterior se
+libera cuando ninguna sesión ni índice lo referencia. La memoria del dataset no
+crece con las sesiones: por sesión solo quedan los filtros y sus resultados.
+Con el almacén compartido (shared_store) el frame apunta a un archivo mapeado:
+sus páginas son comunes a todos los procesos del servidor.
+"""
+
+import time
+
+import pandas as pd
+
+from dataset_schema import memory_mb
+
+# En pandas 3 Copy-on-Write siempre está activo; antes es opcional y sin él una
+# vista superficial modificada en el lugar alteraría el dataset compartido.
+if int(pd.__version__.split('.')[0]) < 3:
+    pd.set_option('mode.copy_on_write', True)
+
+
+class SharedDataset:
+    """Versión inmutable del dataset: (frame, versión) más su tamaño en memoria."""
+
+    __slots__ = ('_data', 'version', 'published_at', 'memory_mb')
+
+    def __init__(self, data, version):
+        object.__setattr__(self, '_data', data)
+        object.__setattr__(self, 'version', version)
+        object.__setattr__(self, 'published_at', time.time())
+        object.__setattr__(self, 'memory_mb', float(memory_mb(data)) if data is not None else 0.0)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("SharedDataset es inmutable: una recarga publica una versión nueva")
+
+    @property
+    def frame(self):
+        """Vista superficial del frame (None si todavía no hay datos)."""
+        return None if self._data is None else self._data.copy(deep=False)
+
+    def __len__(self):
+        return 0 if self._data is None else len(self._data)
@@ -0,0 +1,216 @@
+# shared_store.py
+"""
+Dataset compartido entre procesos (varios servidores de Streamlit detrás de un balanceador).
+
+Sin esto cada proceso consulta la base y guarda su propia copia del frame. Con
+TMZ_SHARED_DIR (un directorio local común a los procesos) uno solo de ellos, el
+líder, consulta la base y publica cada versión como un archivo Arrow IPC sin
+comprimir; los demás (seguidores) lo mapean en memoria de solo lectura: las
+páginas del archivo las comparte el sistema operativo y el frame de pandas
+apunta a ellas (solo se copian los códigos de las categorías).
+
+Estructura en disco:
+    <TMZ_SHARED_DIR>/
+        CURRENT                        -> nombre de la versión vigente
+        dataset_<fecha>_<v>.arrow      -> frame de esa versión (Arrow IPC)
+        dataset_<fecha>_<v>.json       -> manifest: versión, filas, marca de agua, delta
+        leader.lock                    -> bloqueo (flock) del proceso líder
+        REFRESH                        -> pedido de resincronización de un seguidor
+
+- Líder: el primer proceso que toma el bloqueo de leader.lock; lo conserva
+  mientras vive. Si muere, el sistema libera el bloqueo y el siguiente seguidor
+  que lo intenta (cada SHARED_POLL_SECONDS) pasa a ser líder.
+- Cambio atómico de versión: el archivo y su manifest se escriben completos y
+  luego se reemplaza CURRENT (os.replace); un lector ve la versión anterior o la
+  nueva, nunca una a medias. Las versiones antiguas se borran; quien todavía
+  las tenga mapeadas las sigue leyendo (en Linux el archivo vive hasta que se
+  cierra el último mapeo).
+- El manifest de una recarga incremental lleva las cédulas modificadas: el
+  seguidor arma el mismo delta que el líder (para RollupStore y demás) sin
+  comparar los frames.
+
+Requiere pyarrow y fcntl (POSIX); si falta alguno el almacén queda desactivado
+y cada proceso carga sus datos como antes.
+"""
+
+import json
+import os
+import time
+from datetime import datetime
+
+from snapshot_cache import decode_watermark, encode_watermark
+
+try:
+    import pyarrow as pa
+except ImportError:  # pyarrow es opcional: sin él no hay almacén compartido
+    pa = None
+
+try:
+    import fcntl
+except ImportError:  # Windows: sin bloqueo de archivos no hay elección de líder
+    fcntl = None
+
+SHARED_DIR = os.environ.get('TMZ_SHARED_DIR')
+# Cada cuánto un seguidor busca una versión nueva (y si el líder sigue vivo)
+SHARED_POLL_SECONDS = 5
+# Espera máxima del seguidor por la primera versión antes de cargar los datos por su cuenta
+SHARED_WAIT_SECONDS = 60
+KEEP_VERSIONS = 3
+
+
+class SharedStore:
+    """Publica (líder) y mapea (seguidores) las versiones del dataset en `base_dir`."""
+
+    def __init__(self, base_dir=SHARED_DIR, keep_versions=KEEP_VERSIONS):
+        self.base_dir = base_dir
+        self.keep_versions = keep_versions
+        self._lock_file = None
+
+    @property
+    def enabled(self):
+        return bool(self.base_dir) and pa is not None and fcntl is not None
+
+    @property
+    def is_leader(self):
+        return self._lock_file is not None
+
+    def _path(self, name):
+        return os.path.join(self.base_dir, name)
+
+    def try_lead(self):
+        """Toma el bloqueo de líder si está libre (sin esperar). Retorna True si este proceso es el líder."""
+        if self._lock_file is None and self.enabled:
+            os.makedirs(self.base_dir, exist_ok=True)
+            lock_file = open(self._path('leader.lock'), 'a+', encoding='utf-8')
+            try:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                lock_file.close()
+                return False
+            lock_file.seek(0)
+            lock_file.truncate()
+            lock_file.write(f"{os.getpid()}\n")
+            lock_file.flush()
+            self._lock_file = lock_file
+        return self.is_leader
+
+    def release_lead(self):
+        if self._lock_file is not None:
+            self._lock_file.close()  # cerrar el archivo libera el flock
+            self._lock_file = None
+
+    # ------------------------------------------------------
+    #   Versión vigente
+    # ------------------------------------------------------
+    def current_name(self):
+        """Nombre de la versión vigente (o None si todavía no se publicó ninguna)."""
+        try:
+            with open(self._path('CURRENT'), encoding='utf-8') as f:
+                return f.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def info(self, name=None):
+        """Manifest de la versión `name` (por defecto la vigente) o None."""
+        name = name or self.current_name()
+        if name is None:
+            return None
+        try:
+            with open(self._path(f"{name}.json"), encoding='utf-8') as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def _prune(self, current):
+        nombres = sorted(
+            name[:-len('.arrow')] for name in os.listdir(self.base_dir)
+            if name.startswith('dataset_') and name.endswith('.arrow')
+        )
+        for name in nombres[:-self.keep_versions]:
+            if name != current:
+                for extension in ('.arrow', '.json'):
+                    try:
+                        os.remove(self._path(name + extension))
+                    except OSError:
+                        pass
+
+    # ------------------------------------------------------
+    #   Publicación (líder) y lectura (todos)
+    # ------------------------------------------------------
+    def publish(self, df, version, watermark=None, raw_columns=None, changed=None, previous=None):
+        """
+        Escribe df como una versión nueva y la publica de forma atómica (archivo CURRENT).
+        `changed` son las cédulas reemplazadas respecto de la versión `previous`
+        (recarga incremental). Retorna el manifest.
+        """
+        os.makedirs(self.base_dir, exist_ok=True)
+        name = f"dataset_{datetime.now():%Y%m%dT%H%M%S_%f}_{version}"
+
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        tmp_path = self._path(f"{name}.arrow.tmp")
+        # Sin compresión: los buffers del archivo se usan tal cual al mapearlo
+        with pa.OSFile(tmp_path, 'wb') as sink, pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+        os.replace(tmp_path, self._path(f"{name}.arrow"))
+
+        manifest = {
+            'name': name,
+            'version': version,
+            'created_at': time.time(),
+            'rows': len(df),
+            'bytes': os.path.getsize(self._path(f"{name}.arrow")),
+            'watermark': encode_watermark(watermark),
+            'raw_columns': raw_columns,
+            'delta': {'from': previous, 'cedulas': [str(c) for c in changed]} if changed is not None else None,
+            'pid': os.getpid(),
+        }
+        with open(self._path(f"{name}.json"), 'w', encoding='utf-8') as f:
+            json.dump(manifest, f)
+
+        # Publicación atómica: los lectores ven la versión anterior o la nueva, nunca una a medias
+        tmp_pointer = self._path('CURRENT.tmp')
+        with open(tmp_pointer, 'w', encoding='utf-8') as f:
+            f.write(name)
+        os.replace(tmp_pointer, self._path('CURRENT'))
+
+        self._prune(current=name)
+        return manifest
+
+    def read(self, name=None):
+        """
+        Mapea (solo lectura) la versión `name` o la vigente. Retorna (df, manifest)
+        o (None, None) si no hay ninguna publicada.
+        """
+        for _ in range(2):
+            name = name or self.current_name()
+            manifest = self.info(name)
+            if manifest is None:
+                return None, None
+            try:
+                source = pa.memory_map(self._path(f"{name}.arrow"), 'r')
+            except FileNotFoundError:
+                # Se borró entre leer CURRENT y abrirla (hubo otra publicación): se lee la nueva
+                name = None
+                continue
+            df = pa.ipc.open_file(source).read_all().to_pandas()
+            return df, dict(manifest, watermark=decode_watermark(manifest['watermark']))
+        return None, None
+
+    # ------------------------------------------------------
+    #   Resincronización pedida por un seguidor
+    # ------------------------------------------------------
+    def request_refresh(self):
+        os.makedirs(self.base_dir, exist_ok=True)
+        with open(self._path('REFRESH'), 'w', encoding='utf-8') as f:
+            f.write(f"{time.time()}\n")
+
+    def refresh_requested(self):
+        return os.path.exists(self._path('REFRESH'))
+
+    def take_refresh_request(self):
+        """True (y borra el pedido) si algún seguidor pidió una resincronización completa."""
+        try:
+            os.remove(self._path('REFRESH'))
+            return True
+        except FileNotFoundError:
+            return False
@@ -1,10 +1,106 @@
 import streamlit as st
 import pandas as pd
 
+from azure_connector import get_connection_pool, run_query
+from filter_index import FilterIndex, FilteredView
+from filter_spec import SIN_DATO_RANGO, FilterSpec
+from perf_trace import span
+from summary_tables import SUMMARY_OPTIONS_QUERIES, summaries_fresh
+from typed_schema import date_sql
+
 # ==========================================================
-#   FUNCIÓN PRINCIPAL: SIDEBAR DE FILTROS
+#   OPCIONES DE LOS WIDGETS (SELECT DISTINCT CACHEADOS)
+# ==========================================================
+ESTADOS_QUERY = """
+    SELECT DISTINCT COALESCE(ESTADO, 'PENDIENTE') AS VALOR
+    FROM tmz_data.Pacientes_tmz;
+"""
+
+RANGOS_QUERY = f"""
+    SELECT DISTINCT COALESCE(F.RANGO_DE_EDAD, '{SIN_DATO_RANGO}') AS VALOR
+    FROM tmz_data.Pacientes_tmz P
+    LEFT JOIN tmz_data.FasePaciente F ON P.CEDULA = F.PACIENTE_CEDULA;
+"""
+
+FECHAS_QUERY = """
+    SELECT MIN({fecha}) AS FECHA_MIN, MAX({fecha}) AS FECHA_MAX
+    FROM tmz_data.Pacientes_tmz;
+"""
+
+
+def _to_date(value):
+    """Normaliza el resultado de MIN/MAX (date, datetime o texto ISO según el motor)."""
+    fecha = pd.to_datetime(value, errors='coerce')
+    return None if pd.isna(fecha) else fecha.date()
+
+
+@st.cache_data(ttl=600)
+def fetch_filter_options():
+    """
+    Opciones de los filtros consultadas en la base de datos (sin recorrer el frame):
+    de Resumen_Conteos si los resúmenes están vigentes, si no de las tablas base.
+    Retorna None si la base no está disponible.
+    """
+    pool = get_connection_pool()
+    if pool is None:
+        return None
+    try:
+        if summaries_fresh():
+            consultas = SUMMARY_OPTIONS_QUERIES
+        else:
+            fecha = date_sql('FECHA_DE_RECIBIDO', pool.dialect)
+            consultas = {'estados': ESTADOS_QUERY, 'rangos': RANGOS_QUERY, 'fechas': FECHAS_QUERY.format(fecha=fecha)}
+        estados = run_query(consultas['estados'])['VALOR'].astype(str).tolist()
+        rangos = run_query(consultas['rangos'])['VALOR'].astype(str).tolist()
+        fechas = run_query(consultas['fechas'])
+    except Exception:
+        return None
+
+    return {
+        'estados': sorted(estados),
+        'rangos': sorted(r for r in rangos if r != 'Todos'),
+        'fecha_min': _to_date(fechas['FECHA_MIN'].iloc[0]),
+        'fecha_max': _to_date(fechas['FECHA_MAX'].iloc[0]),
+    }
+
+
+def filter_options_from_frame(df_data):
+    """Mismas opciones calculadas sobre el DataFrame (respaldo si no hay base de datos)."""
+    opciones = {'estados': [], 'rangos': [], 'fecha_min': None, 'fecha_max': None}
+
+    if 'ESTADO' in df_data.columns:
+        # astype(object): la columna puede ser categórica y 'PENDIENTE' no ser una de sus categorías
+        opciones['estados'] = sorted(df_data['ESTADO'].astype(object).fillna("PENDIENTE").astype(str).unique())
+
+    if 'RANGO_DE_EDAD' in df_data.columns:
+        rangos = df_data['RANGO_DE_EDAD'].astype(object).fillna(SIN_DATO_RANGO).unique().tolist()
+        opciones['rangos'] = sorted(r for r in rangos if r != 'Todos')
+
+    if 'FECHA_DE_RECIBIDO' in df_data.columns:
+        fechas = pd.to_datetime(df_data['FECHA_DE_RECIBIDO'], errors="coerce").dropna()
+        if not fechas.empty:
+            opciones['fecha_min'] = fechas.min().date()
+            opciones['fecha_max'] = fechas.max().date()
+
+    return opciones
+
+
+def get_filter_options(df_data=None):
+    """Opciones desde la base de datos; si no está disponible, desde df_data."""
+    opciones = fetch_filter_options()
+    if opciones is None and df_data is not None:
+        opciones = filter_options_from_frame(df_data)
+    return opciones
+
+
+# ==========================================================
+#   WIDGETS: PRODUCEN UN FilterSpec
 # ==========================================================
-def render_sidebar_filters(df_data):
+def render_filter_widgets(opciones):
+    """Dibuja los filtros de la barra lateral y retorna la selección como FilterSpec."""
+    if opciones is None:
+        opciones = {'estados': [], 'rangos': [], 'fecha_min': None, 'fecha_max': None}
+
 
     # ------------------------------------------------------
     #   CSS – Limpio, sin colores extra
@@ -52,21 +148,18 @@ def render_sidebar_filters(df_data):
     # ------------------------------------------------------
     st.sidebar.markdown("<div class='sidebar-title'>🔍 Filtros</div>", unsafe_allow_html=True)
 
-    df_filtered = df_data.copy()
+    estado = None
+    rangos = ()
+    fecha_desde = fecha_hasta = None
 
     # ======================================================
     # 1️⃣  FILTRO POR ESTADO
     # ======================================================
     st.sidebar.markdown("<div class='filter-label'>Estado</div>", unsafe_allow_html=True)
 
-    if 'ESTADO' in df_filtered.columns:
+    if opciones['estados']:
 
-        estados = ['Todos'] + sorted(
-            df_filtered['ESTADO']
-            .fillna("PENDIENTE")
-            .astype(str)
-            .unique()
-        )
+        estados = ['Todos'] + opciones['estados']
 
         sel_estado = st.sidebar.selectbox(
             "",
@@ -75,24 +168,19 @@ def render_sidebar_filters(df_data):
         )
 
         if sel_estado != "Todos":
-            df_filtered = df_filtered[df_filtered["ESTADO"] == sel_estado]
+            estado = sel_estado
 
     # ======================================================
     # 2️⃣  RANGO DE EDAD
     # ======================================================
     st.sidebar.markdown("<div class='filter-label'>Rango de Edad</div>", unsafe_allow_html=True) 
 
-    if 'RANGO_DE_EDAD' in df_filtered.columns:
+    if opciones['rangos']:
         
-        # 1. Preparación de datos: Asegurar que los nulos se traten como 'Sin Dato'
-        df_filtered['RANGO_DE_EDAD'] = df_filtered['RANGO_DE_EDAD'].fillna('Sin Dato')
+        # 1. Opciones: 'Todos' al inicio de los rangos únicos (los nulos llegan como 'Sin Dato')
+        options_con_todos = ['Todos'] + opciones['rangos']
         
-        # 2. Definir Opciones: Incluir 'Todos' al inicio de la lista de rangos únicos
-        # Usamos list comprehension para que 'Todos' no se añada si ya está en el DF.
-        unique_rangos = [r for r in df_filtered['RANGO_DE_EDAD'].unique().tolist() if r != 'Todos']
-        options_con_todos = ['Todos'] + sorted(unique_rangos)
-        
-        # 3. Widget: Unificar el multiselect para usar la etiqueta 'Todos' por defecto
+        # 2. Widget: Unificar el multiselect para usar la etiqueta 'Todos' por defecto
         selected_rangos = st.sidebar.multiselect(
             "**Rango de Edad**", # Este título es interno, el visible es el de filter-label
             options=options_con_todos,
@@ -100,57 +188,66 @@ def render_sidebar_filters(df_data):
             label_visibility="collapsed" # Ocultar el título interno del multiselect
         )
         
-        # 4. Aplicar Filtro: Si 'Todos' está seleccionado, no filtra (pasa); si no, filtra.
-        if 'Todos' in selected_rangos:
-            # No se aplica filtro, se usa el df_filtered completo hasta este punto.
-            pass 
-        else:
-            # Aplicamos filtro solo con los rangos seleccionados
-            df_filtered = df_filtered[df_filtered['RANGO_DE_EDAD'].isin(selected_rangos)]
+        # 3. Si 'Todos' está seleccionado, no filtra; si no, filtra por los rangos elegidos.
+        if 'Todos' not in selected_rangos:
+            rangos = tuple(selected_rangos)
 
     # ======================================================
     # 3️⃣  FECHA DE MUESTRA (SLIDER – SIN CAMBIAR NADA)
     # ======================================================
     st.sidebar.markdown("<div class='filter-label'>Fecha de Muestra</div>", unsafe_allow_html=True)
 
-    fecha_col = "FECHA_DE_RECIBIDO"
-
-    if fecha_col in df_filtered.columns:
+    min_dt = opciones['fecha_min']
+    max_dt = opciones['fecha_max']
 
-        df_filtered[fecha_col] = pd.to_datetime(df_filtered[fecha_col], errors="coerce")
-        fechas_validas = df_filtered.dropna(subset=[fecha_col])
+    if min_dt is not None and max_dt is not None:
 
-        if not fechas_validas.empty:
+        if min_dt != max_dt:
 
-            min_dt = fechas_validas[fecha_col].min().date()
-            max_dt = fechas_validas[fecha_col].max().date()
+            fecha_desde, fecha_hasta = st.sidebar.slider(
+                "",
+                min_value=min_dt,
+                max_value=max_dt,
+                value=(min_dt, max_dt),
+                format="YYYY/MM/DD",
+                label_visibility="collapsed"
+            )
 
-            if min_dt != max_dt:
-
-                fecha_range = st.sidebar.slider(
-                    "",
-                    min_value=min_dt,
-                    max_value=max_dt,
-                    value=(min_dt, max_dt),
-                    format="YYYY/MM/DD",
-                    label_visibility="collapsed"
-                )
+        else:
+            st.sidebar.info(f"Solo existe una fecha: {min_dt}")
 
-                df_filtered = df_filtered[
-                    (df_filtered[fecha_col].dt.date >= fecha_range[0]) &
-                    (df_filtered[fecha_col].dt.date <= fecha_range[1])
-                ]
+    else:
+        st.sidebar.warning("No hay fechas válidas disponibles")
 
-            else:
-                st.sidebar.info(f"Solo existe una fecha: {min_dt}")
+    return FilterSpec(estado=estado, rangos=rangos, fecha_desde=fecha_desde, fecha_hasta=fecha_hasta)
 
-        else:
-            st.sidebar.warning("No hay fechas válidas disponibles")
 
+def render_filtered_metric(n_pacientes):
     # ======================================================
     # 4️⃣  MÉTRICA FINAL
     # ======================================================
+    # El conteo llega calculado (índice en memoria o COUNT DISTINCT en la base)
     st.sidebar.markdown("---")
-    st.sidebar.metric("Pacientes Filtrados", df_filtered['CEDULA'].nunique())
+    st.sidebar.metric("Pacientes Filtrados", n_pacientes)
+
 
-    return df_filtered
+# ==========================================================
+#   FUNCIÓN PRINCIPAL: SIDEBAR DE FILTROS
+# ==========================================================
+def render_sidebar_filters(df_data, filter_index=None):
+    """
+    Dibuja los filtros y los aplica en memoria sobre df_data usando el índice
+    precalculado (FilterIndex) de esa versión de datos; sin índice, se construye uno.
+    Retorna (view, spec): las filas seleccionadas como FilteredView (sin copia)
+    y la selección activa (FilterSpec).
+    """
+    with span('filtros.widgets'):
+        spec = render_filter_widgets(get_filter_options(df_data))
+    with span('filtros.seleccion') as s:
+        if filter_index is None or filter_index.n_rows != len(df_data):
+            filter_index = FilterIndex(df_data)
+        view = FilteredView(df_data, filter_index.select(spec))
+        s.set_rows(len(view))
+    with span('filtros.metrica'):
+        render_filtered_metric(view.nunique('CEDULA'))
+    return view, spec
@@ -0,0 +1,165 @@
+# snapshot_cache.py
+"""
+Snapshot en disco (Parquet) del dataset ya procesado.
+
+Evita que un arranque en frío (reinicio del servidor) pague la consulta completa
+a Azure SQL y la conversión de fechas: el frame procesado se guarda como un
+snapshot versionado, particionado por MES_PROGRAMACION, y al arrancar se lee
+con memory mapping mientras la base se consulta en segundo plano.
+
+Estructura en disco:
+    <SNAPSHOT_DIR>/
+        CURRENT                      -> nombre del snapshot vigente
+        snapshot_<fecha>_<n>/
+            manifest.json            -> filas, columnas, tamaño, marca de agua
+            MES_PROGRAMACION=ENERO/part-0.parquet
+            ...
+"""
+
+import json
+import os
+import shutil
+import time
+from datetime import datetime
+
+PARTITION_COLUMN = 'MES_PROGRAMACION'
+DEFAULT_SNAPSHOT_DIR = os.environ.get('TMZ_SNAPSHOT_DIR', '.snapshots')
+KEEP_VERSIONS = 2
+
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+except ImportError:  # pyarrow es opcional: sin él no hay snapshot en disco
+    pa = None
+
+
+def encode_watermark(watermark):
+    """La marca de agua puede traer bytes (ROWVERSION): se guarda como hex en el JSON."""
+    if watermark is None:
+        return None
+    return [{'hex': value.hex()} if isinstance(value, (bytes, bytearray)) else value for value in watermark]
+
+
+def decode_watermark(encoded):
+    if encoded is None:
+        return None
+    return tuple(bytes.fromhex(value['hex']) if isinstance(value, dict) else value for value in encoded)
+
+
+def _dir_size(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        total += sum(os.path.getsize(os.path.join(root, name)) for name in files)
+    return total
+
+
+class SnapshotStore:
+    """Escribe y lee snapshots versionados del dataset en `base_dir`."""
+
+    def __init__(self, base_dir=DEFAULT_SNAPSHOT_DIR, keep_versions=KEEP_VERSIONS):
+        self.base_dir = base_dir
+        self.keep_versions = keep_versions
+
+    @property
+    def enabled(self):
+        return pa is not None
+
+    def _current_name(self):
+        try:
+            with open(os.path.join(self.base_dir, 'CURRENT'), encoding='utf-8') as f:
+                return f.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def _prune(self, current):
+        """Borra los snapshots antiguos, conservando los `keep_versions` más recientes."""
+        snapshots = sorted(
+            name for name in os.listdir(self.base_dir) if name.startswith('snapshot_')
+        )
+        for name in snapshots[:-self.keep_versions]:
+            if name != current:
+                shutil.rmtree(os.path.join(self.base_dir, name), ignore_errors=True)
+
+    def write(self, df, watermark=None, data_version=None, raw_columns=None):
+        """Guarda df como un snapshot nuevo y lo publica de forma atómica (archivo CURRENT)."""
+        if not self.enabled:
+            return None
+
+        os.makedirs(self.base_dir, exist_ok=True)
+        name = f"snapshot_{datetime.now():%Y%m%dT%H%M%S_%f}_{data_version or 0}"
+        path = os.path.join(self.base_dir, name)
+
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        partitioning = [PARTITION_COLUMN] if PARTITION_COLUMN in df.columns else None
+        ds.write_dataset(
+            table, path, format='parquet',
+            partitioning=partitioning, partitioning_flavor='hive' if partitioning else None,
+            existing_data_behavior='overwrite_or_ignore',
+        )
+
+        manifest = {
+            'name': name,
+            'created_at': time.time(),
+            'rows': len(df),
+            'columns': list(df.columns),
+            'dtypes': {col: str(dtype) for col, dtype in df.dtypes.items()},
+            'watermark': encode_watermark(watermark),
+            'raw_columns': raw_columns,
+            'data_version': data_version,
+            'bytes': _dir_size(path),
+        }
+        with open(os.path.join(path, 'manifest.json'), 'w', encoding='utf-8') as f:
+            json.dump(manifest, f)
+
+        # Publicación atómica: los lectores ven el snapshot anterior o el nuevo, nunca uno a medias
+        tmp_pointer = os.path.join(self.base_dir, 'CURRENT.tmp')
+        with open(tmp_pointer, 'w', encoding='utf-8') as f:
+            f.write(name)
+        os.replace(tmp_pointer, os.path.join(self.base_dir, 'CURRENT'))
+
+        self._prune(current=name)
+        return manifest
+
+    def info(self):
+        """Manifest del snapshot vigente (o None si no hay)."""
+        name = self._current_name()
+        if name is None:
+            return None
+        try:
+            with open(os.path.join(self.base_dir, name, 'manifest.json'), encoding='utf-8') as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def read(self):
+        """
+        Lee el snapshot vigente con memory mapping.
+        Retorna (df, manifest) o (None, None) si no hay snapshot legible.
+        """
+        if not self.enabled:
+            return None, None
+        manifest = self.info()
+        if manifest is None:
+            return None, None
+
+        path = os.path.join(self.base_dir, manifest['name'])
+        table = pq.read_table(
+            path, memory_map=True, partitioning='hive',
+            # manifest.json no es Parquet: solo se leen los archivos de datos
+            ignore_prefixes=['manifest'],
+        )
+        df = table.to_pandas()
+
+        # La columna de partición vuelve como categoría y al final: se restaura el esquema original
+        if PARTITION_COLUMN in df.columns:
+            df[PARTITION_COLUMN] = df[PARTITION_COLUMN].astype(str)
+        df = df[manifest['columns']]
+
+        # Parquet no tiene resolución de segundos: las fechas vuelven en ms y se restauran
+        for col, dtype in manifest['dtypes'].items():
+            if dtype.startswith('datetime64') and str(df[col].dtype) != dtype:
+                df[col] = df[col].astype(dtype)
+
+        manifest = dict(manifest, watermark=decode_watermark(manifest['watermark']))
+        return df, manifest
@@ -0,0 +1,314 @@
+# summary_tables.py
+"""
+Tablas resumen materializadas en tmz_data, reconstruidas al final del ETL.
+
+- Resumen_Paciente:   una fila por paciente (por fila de Pacientes_tmz) con las
+                      condiciones de sus fases ya evaluadas; responde los KPIs de
+                      cualquier selección por estado y fechas sin el LEFT JOIN.
+- Resumen_UltimaFase: la fase más reciente de cada paciente (por FECHA_TOMA_MUESTRA)
+                      y su número de fases.
+- Resumen_Conteos:    pacientes y registros por ESTADO, MES_DE_TOMA, DEPARTAMENTO y
+                      RANGO_DE_EDAD, con el rango de FECHA_DE_RECIBIDO; da las
+                      opciones de los filtros.
+- Resumen_Estado:     marca de agua (MAX(VERSION_FILA)) y filas de las tablas base
+                      con las que se construyeron los resúmenes.
+
+Se reconstruyen completas en una sola transacción (DELETE + INSERT ... SELECT):
+quien lee nunca ve una mezcla de resúmenes viejos y nuevos. El dashboard los usa
+mientras la marca de agua y las filas de las tablas base coincidan con las
+guardadas; si no, vuelve a las consultas sobre las tablas base.
+
+Las columnas de fecha de los resúmenes tienen el tipo de la columna base (DATE
+en el esquema tipado, texto en el original); si el esquema base cambió, la
+reconstrucción vuelve a crear las tablas resumen.
+"""
+
+import streamlit as st
+
+from azure_connector import run_query
+from data_loader import TEXTO_PENDIENTE, VALORES_VERDADEROS
+from dataset_schema import SIN_DATO_RANGO
+from typed_schema import date_sql, is_typed, read_column_types, read_schema
+
+SCHEMA = 'tmz_data'
+
+TEXT_TYPE = {'mssql': 'NVARCHAR(255)', 'sqlite': 'TEXT'}
+INT_TYPE = {'mssql': 'INT', 'sqlite': 'INTEGER'}
+DATE_TYPE = {'mssql': 'DATE', 'sqlite': 'DATE'}
+# ROWVERSION de Azure (8 bytes) / entero de los triggers de SQLite
+WATERMARK_TYPE = {'mssql': 'BINARY(8)', 'sqlite': 'INTEGER'}
+NUMBER_EXPR = {
+    'mssql': "TRY_CAST(NULLIF({col}, '') AS float)",
+    'sqlite': "CAST(NULLIF({col}, '') AS REAL)",
+}
+
+# tabla -> columnas (nombre, tipo lógico: 'text' | 'int' | 'watermark'); ver DATE_SOURCES
+SUMMARY_TABLES = {
+    'Resumen_Paciente': [
+        ('CEDULA', 'text'), ('ESTADO', 'text'), ('FECHA_DE_RECIBIDO', 'text'), ('MES_DE_TOMA', 'text'),
+        ('N_FASES', 'int'), ('ENVIADO_LAB', 'int'), ('CON_RESULTADOS', 'int'),
+        ('GENERO_F', 'int'), ('GENERO_M', 'int'),
+    ],
+    'Resumen_UltimaFase': [
+        ('PACIENTE_CEDULA', 'text'), ('FECHA_TOMA_MUESTRA', 'text'), ('RANGO_DE_EDAD', 'text'),
+        ('DEPARTAMENTO', 'text'), ('EPS', 'text'), ('RESULTADO', 'text'), ('MUESTRA_ENVIADA', 'text'),
+        ('N_FASES', 'int'),
+    ],
+    'Resumen_Conteos': [
+        ('ESTADO', 'text'), ('MES_DE_TOMA', 'text'), ('DEPARTAMENTO', 'text'), ('RANGO_DE_EDAD', 'text'),
+        ('FECHA_MIN', 'text'), ('FECHA_MAX', 'text'), ('PACIENTES', 'int'), ('REGISTROS', 'int'),
+    ],
+    'Resumen_Estado': [
+        ('ACTUALIZADO', 'text'), ('WM_PACIENTES', 'watermark'), ('WM_FASES', 'watermark'),
+        ('N_PACIENTES', 'int'), ('N_FASES', 'int'),
+    ],
+}
+
+# Columnas de fecha de los resúmenes -> columna base de la que toman el tipo
+DATE_SOURCES = {
+    'FECHA_DE_RECIBIDO': ('Pacientes_tmz', 'FECHA_DE_RECIBIDO'),
+    'FECHA_MIN': ('Pacientes_tmz', 'FECHA_DE_RECIBIDO'),
+    'FECHA_MAX': ('Pacientes_tmz', 'FECHA_DE_RECIBIDO'),
+    'FECHA_TOMA_MUESTRA': ('FasePaciente', 'FECHA_TOMA_MUESTRA'),
+}
+
+# Estado actual de las tablas base (se compara con Resumen_Estado)
+BASE_STATE_QUERY = """
+    SELECT
+        {wm_pacientes} AS WM_PACIENTES,
+        {wm_fases} AS WM_FASES,
+        (SELECT COUNT(*) FROM tmz_data.Pacientes_tmz) AS N_PACIENTES,
+        (SELECT COUNT(*) FROM tmz_data.FasePaciente) AS N_FASES
+"""
+WATERMARKS = {
+    'WM_PACIENTES': "(SELECT MAX(VERSION_FILA) FROM tmz_data.Pacientes_tmz)",
+    'WM_FASES': "(SELECT MAX(VERSION_FILA) FROM tmz_data.FasePaciente)",
+}
+
+_VERDADEROS = ", ".join(f"'{v}'" for v in VALORES_VERDADEROS)
+
+INSERT_PACIENTE = f"""
+    INSERT INTO tmz_data.Resumen_Paciente
+        (CEDULA, ESTADO, FECHA_DE_RECIBIDO, MES_DE_TOMA, N_FASES, ENVIADO_LAB, CON_RESULTADOS, GENERO_F, GENERO_M)
+    SELECT
+        P.CEDULA, P.ESTADO, P.FECHA_DE_RECIBIDO, P.MES_DE_TOMA,
+        COUNT(F.PACIENTE_CEDULA),
+        MAX(CASE WHEN UPPER(LTRIM(RTRIM(F.MUESTRA_ENVIADA_A_ESPAÑA))) IN ({_VERDADEROS}) THEN 1 ELSE 0 END),
+        MAX(CASE
+            WHEN F.RESULTADOS_A_CORTE_14_OCTUBRE_JOHN IS NOT NULL
+             AND F.RESULTADOS_A_CORTE_14_OCTUBRE_JOHN <> ''
+             AND LOWER(F.RESULTADOS_A_CORTE_14_OCTUBRE_JOHN) NOT LIKE '%{TEXTO_PENDIENTE}%'
+            THEN 1 ELSE 0 END),
+        MAX(CASE WHEN F.GENERO = 'F' THEN 1 ELSE 0 END),
+        MAX(CASE WHEN F.GENERO = 'M' THEN 1 ELSE 0 END)
+    FROM tmz_data.Pacientes_tmz P
+    LEFT JOIN tmz_data.FasePaciente F ON P.CEDULA = F.PACIENTE_CEDULA
+    GROUP BY P.CEDULA, P.ESTADO, P.FECHA_DE_RECIBIDO, P.MES_DE_TOMA;
+"""
+
+INSERT_ULTIMA_FASE = """
+    INSERT INTO tmz_data.Resumen_UltimaFase
+        (PACIENTE_CEDULA, FECHA_TOMA_MUESTRA, RANGO_DE_EDAD, DEPARTAMENTO, EPS, RESULTADO, MUESTRA_ENVIADA, N_FASES)
+    SELECT PACIENTE_CEDULA, FECHA_TOMA_MUESTRA, RANGO_DE_EDAD, DEPARTAMENTO, EPS, RESULTADO, MUESTRA_ENVIADA, N_FASES
+    FROM (
+        SELECT
+            F.PACIENTE_CEDULA, F.FECHA_TOMA_MUESTRA, F.RANGO_DE_EDAD, F.DEPARTAMENTO, F.EPS,
+            F.RESULTADOS_A_CORTE_14_OCTUBRE_JOHN AS RESULTADO,
+            F.MUESTRA_ENVIADA_A_ESPAÑA AS MUESTRA_ENVIADA,
+            ROW_NUMBER() OVER (PARTITION BY F.PACIENTE_CEDULA ORDER BY {toma} DESC) AS ORDEN,
+            COUNT(*) OVER (PARTITION BY F.PACIENTE_CEDULA) AS N_FASES
+        FROM tmz_data.FasePaciente F
+    ) X
+    WHERE ORDEN = 1;
+"""
+
+INSERT_CONTEOS = f"""
+    INSERT INTO tmz_data.Resumen_Conteos
+        (ESTADO, MES_DE_TOMA, DEPARTAMENTO, RANGO_DE_EDAD, FECHA_MIN, FECHA_MAX, PACIENTES, REGISTROS)
+    SELECT
+        COALESCE(P.ESTADO, 'PENDIENTE'), P.MES_DE_TOMA, F.DEPARTAMENTO,
+        COALESCE(F.RANGO_DE_EDAD, '{SIN_DATO_RANGO}'),
+        MIN({{fecha}}), MAX({{fecha}}),
+        COUNT(DISTINCT P.CEDULA), COUNT(*)
+    FROM tmz_data.Pacientes_tmz P
+    LEFT JOIN tmz_data.FasePaciente F ON P.CEDULA = F.PACIENTE_CEDULA
+    GROUP BY COALESCE(P.ESTADO, 'PENDIENTE'), P.MES_DE_TOMA, F.DEPARTAMENTO, COALESCE(F.RANGO_DE_EDAD, '{SIN_DATO_RANGO}');
+"""
+
+INSERT_ESTADO = """
+    INSERT INTO tmz_data.Resumen_Estado (ACTUALIZADO, WM_PACIENTES, WM_FASES, N_PACIENTES, N_FASES)
+    SELECT {ahora}, WM_PACIENTES, WM_FASES, N_PACIENTES, N_FASES FROM ({estado}) B;
+"""
+
+NOW_EXPR = {'mssql': "CONVERT(NVARCHAR(19), SYSUTCDATETIME(), 120)", 'sqlite': "datetime('now')"}
+
+# KPIs desde Resumen_Paciente: el alias P permite reutilizar el WHERE de FilterSpec.to_sql
+SUMMARY_KPI_QUERY = """
+    SELECT
+        COUNT(DISTINCT P.CEDULA) AS total_pacientes,
+        COUNT(DISTINCT CASE WHEN P.ESTADO = 'REALIZADO' THEN P.CEDULA END) AS realizado_tamizaje,
+        COUNT(DISTINCT CASE WHEN P.ENVIADO_LAB = 1 THEN P.CEDULA END) AS enviados_lab,
+        COUNT(DISTINCT CASE WHEN P.CON_RESULTADOS = 1 THEN P.CEDULA END) AS con_resultados,
+        COUNT(DISTINCT CASE WHEN P.GENERO_F = 1 THEN P.CEDULA END) AS genero_f,
+        COUNT(DISTINCT CASE WHEN P.GENERO_M = 1 THEN P.CEDULA END) AS genero_m
+    FROM tmz_data.Resumen_Paciente P
+"""
+
+SUMMARY_OPTIONS_QUERIES = {
+    'estados': "SELECT DISTINCT ESTADO AS VALOR FROM tmz_data.Resumen_Conteos;",
+    'rangos': "SELECT DISTINCT RANGO_DE_EDAD AS VALOR FROM tmz_data.Resumen_Conteos;",
+    'fechas': "SELECT MIN(FECHA_MIN) AS FECHA_MIN, MAX(FECHA_MAX) AS FECHA_MAX FROM tmz_data.Resumen_Conteos;",
+}
+
+STATE_QUERY = "SELECT WM_PACIENTES, WM_FASES, N_PACIENTES, N_FASES, ACTUALIZADO FROM tmz_data.Resumen_Estado;"
+
+
+# ==========================================================
+#   ETL: RECONSTRUCCIÓN
+# ==========================================================
+def _column_type(tipo, dialect):
+    return {'text': TEXT_TYPE, 'int': INT_TYPE, 'date': DATE_TYPE, 'watermark': WATERMARK_TYPE}[tipo][dialect]
+
+
+def summary_columns(columns, types):
+    """Columnas de una tabla resumen con las fechas como 'date' si la columna base es DATE."""
+    return [(col, 'date' if col in DATE_SOURCES and is_typed(*DATE_SOURCES[col], types=types) else tipo)
+            for col, tipo in columns]
+
+
+def _outdated(conn, table_name, columns):
+    """¿La tabla resumen existe con fechas de otro tipo que el de las tablas base?"""
+    actuales = read_column_types(conn, table_name)
+    return bool(actuales) and any((actuales.get(col) == 'date') != (tipo == 'date')
+                                  for col, tipo in columns if col in DATE_SOURCES)
+
+
+def _create_statement(table_name, columns, dialect):
+    definicion = ", ".join(f"[{col}] {_column_type(tipo, dialect)}" for col, tipo in columns)
+    if dialect == 'mssql':
+        return (f"IF OBJECT_ID('{SCHEMA}.{table_name}', 'U') IS NULL "
+                f"CREATE TABLE {SCHEMA}.{table_name} ({definicion})")
+    return f"CREATE TABLE IF NOT EXISTS {SCHEMA}.{table_name} ({definicion})"
+
+
+def _has_watermark(conn):
+    cursor = conn.cursor()
+    try:
+        cursor.execute(f"SELECT MAX(VERSION_FILA) FROM {SCHEMA}.Pacientes_tmz")
+        cursor.fetchall()
+        return True
+    except Exception:
+        conn.rollback()
+        return False
+    finally:
+        cursor.close()
+
+
+def base_state_query(with_watermark=True):
+    """Consulta del estado de las tablas base (sin marca de agua si las tablas no tienen VERSION_FILA)."""
+    valores = WATERMARKS if with_watermark else dict.fromkeys(WATERMARKS, "NULL")
+    return BASE_STATE_QUERY.format(wm_pacientes=valores['WM_PACIENTES'], wm_fases=valores['WM_FASES'])
+
+
+def rebuild_summaries(conn, dialect):
+    """
+    Reconstruye todas las tablas resumen en una transacción. Retorna las filas
+    de cada tabla resumen. Ante un error se revierte y los resúmenes anteriores
+    quedan intactos (y desactualizados: el dashboard usará las tablas base).
+    """
+    types = read_schema(conn)
+    cursor = conn.cursor()
+    try:
+        for table_name, columns in SUMMARY_TABLES.items():
+            columns = summary_columns(columns, types)
+            if _outdated(conn, table_name, columns):
+                cursor.execute(f"DROP TABLE {SCHEMA}.{table_name}")
+            cursor.execute(_create_statement(table_name, columns, dialect))
+        conn.commit()
+
+        estado = base_state_query(_has_watermark(conn))
+        fecha = date_sql('P.FECHA_DE_RECIBIDO', dialect, types=types)
+        # La fase más reciente: por la fecha si es DATE, si no por el serial de Excel como número
+        toma = 'F.FECHA_TOMA_MUESTRA'
+        if not is_typed('FasePaciente', 'FECHA_TOMA_MUESTRA', types=types):
+            toma = NUMBER_EXPR[dialect].format(col=toma)
+        sentencias = [
+            INSERT_PACIENTE,
+            INSERT_ULTIMA_FASE.format(toma=toma),
+            INSERT_CONTEOS.format(fecha=fecha),
+            INSERT_ESTADO.format(ahora=NOW_EXPR[dialect], estado=estado),
+        ]
+
+        for table_name in SUMMARY_TABLES:
+            cursor.execute(f"DELETE FROM {SCHEMA}.{table_name}")
+        for sentencia in sentencias:
+            cursor.execute(sentencia)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+    filas = {}
+    cursor = conn.cursor()
+    for table_name in SUMMARY_TABLES:
+        cursor.execute(f"SELECT COUNT(*) FROM {SCHEMA}.{table_name}")
+        filas[table_name] = cursor.fetchone()[0]
+    cursor.close()
+    return filas
+
+
+# ==========================================================
+#   DASHBOARD: LECTURA CON RESPALDO
+# ==========================================================
+def _normalize(value):
+    """Valores comparables entre consultas (ROWVERSION llega como bytes; enteros como numpy)."""
+    if value is None or value != value:  # None o NaN
+        return None
+    if isinstance(value, (bytes, bytearray)):
+        return bytes(value).hex()
+    return value.item() if hasattr(value, 'item') else value
+
+
+def summaries_state():
+    """
+    Retorna (vigentes, actualizado): si los resúmenes corresponden al contenido
+    actual de las tablas base y cuándo se construyeron. (False, None) si no existen.
+    """
+    try:
+        guardado = run_query(STATE_QUERY)
+    except Exception:
+        return False, None
+    if guardado.empty:
+        return False, None
+    guardado = guardado.iloc[0]
+
+    try:
+        # Resúmenes construidos sin marca de agua: se comparan solo las filas
+        actual = run_query(base_state_query(_normalize(guardado['WM_PACIENTES']) is not None)).iloc[0]
+    except Exception:
+        return False, guardado['ACTUALIZADO']
+
+    vigentes = all(
+        _normalize(guardado[col]) == _normalize(actual[col])
+        for col in ('WM_PACIENTES', 'WM_FASES', 'N_PACIENTES', 'N_FASES')
+    )
+    return vigentes, guardado['ACTUALIZADO']
+
+
+@st.cache_data(ttl=60)
+def summaries_fresh():
+    """Como summaries_state()[0], cacheado un minuto (se consulta en cada lectura de resúmenes)."""
+    return summaries_state()[0]
+
+
+def build_summary_kpi_query(spec, dialect):
+    """
+    (sql, params) de los KPIs sobre Resumen_Paciente, o None si la selección filtra
+    por rango de edad (columna de las fases: se responde con las tablas base).
+    """
+    if spec.rangos:
+        return None
+    where, params = spec.to_sql(dialect)
+    return SUMMARY_KPI_QUERY + where + ";", params
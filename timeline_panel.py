@@ -0,0 +1,267 @@
+# timeline_panel.py
+"""
+Panel de línea de tiempo: pacientes por FECHA_DE_RECIBIDO y muestras por
+FECHA_TOMA_MUESTRA, por día, semana o mes.
+
+Los gráficos no recorren el frame: leen rollups diarios por celda
+(día, ESTADO, RANGO_DE_EDAD) calculados una vez por versión de datos. Con una
+recarga incremental del cargador, el rollup se actualiza restando la contribución
+anterior de los pacientes modificados y sumando la nueva (los pacientes se
+reemplazan completos, así que las cuentas son exactas). El tamaño del rollup
+depende de los días y las categorías, no de las filas: dibujar cuesta lo mismo
+con 1k que con 1M de filas.
+
+- Pacientes recibidos: pacientes distintos (la fecha es del paciente). Un paciente
+  puede tener fases en varios rangos de edad: su celda de RANGO es el conjunto de
+  sus rangos ('De 60 a 69 años|Sin Dato'), así cada paciente cuenta una sola vez
+  por día y la selección de varios rangos suma las celdas que tocan alguno.
+- Muestras tomadas: filas de FasePaciente (aditivas en cualquier agrupación).
+
+Estado y rangos del filtro se aplican al rollup; el rango de fechas se marca
+sobre el gráfico para no perder el contexto de la serie completa.
+Si una serie tiene más de MAX_POINTS puntos se agrupa en bloques de varios días.
+"""
+
+import math
+from datetime import timedelta
+
+import numpy as np
+import pandas as pd
+import plotly.express as px
+import streamlit as st
+
+from azure_connector import run_query
+from dataset_schema import SIN_DATO_RANGO
+from typed_schema import date_sql, toma_day_sql
+from versioned_store import VersionedStore
+
+# Separador de los rangos de un paciente en la celda RANGO de las series de pacientes distintos
+SEPARADOR_RANGOS = '|'
+SIN_ESTADO = ''
+
+# columna -> (título, medida, cuenta pacientes distintos)
+TIMELINE_SERIES = {
+    'FECHA_DE_RECIBIDO': ('Pacientes por fecha de recibido', 'Pacientes', True),
+    'FECHA_TOMA_MUESTRA': ('Muestras por fecha de toma', 'Muestras', False),
+}
+
+GRANULARIDADES = ('Día', 'Semana', 'Mes')
+MAX_POINTS = 366
+
+ROLLUP_INDEX = ['DIA', 'ESTADO', 'RANGO']
+
+ROLLUP_QUERY = """
+    SELECT {dia} AS DIA, COALESCE(P.ESTADO, '') AS ESTADO, {rango} AS RANGO, COUNT(*) AS N
+    FROM tmz_data.Pacientes_tmz P
+    LEFT JOIN tmz_data.FasePaciente F ON P.CEDULA = F.PACIENTE_CEDULA
+    WHERE {dia} IS NOT NULL
+    GROUP BY {dia}, COALESCE(P.ESTADO, ''), {rango};
+"""
+
+# Pacientes distintos: cada paciente (por día y estado) con el conjunto de sus rangos
+DISTINCT_ROLLUP_QUERY = """
+    SELECT DIA, ESTADO, RANGO, COUNT(*) AS N
+    FROM (
+        SELECT DIA, ESTADO, CEDULA, {agregar_rangos} AS RANGO
+        FROM (
+            SELECT DISTINCT {dia} AS DIA, COALESCE(P.ESTADO, '') AS ESTADO, P.CEDULA, {rango} AS RANGO
+            FROM tmz_data.Pacientes_tmz P
+            LEFT JOIN tmz_data.FasePaciente F ON P.CEDULA = F.PACIENTE_CEDULA
+            WHERE {dia} IS NOT NULL
+        ) celdas
+        GROUP BY DIA, ESTADO, CEDULA
+    ) pacientes
+    GROUP BY DIA, ESTADO, RANGO;
+"""
+
+# Unión de los rangos de un paciente (el orden se normaliza al leer el resultado)
+AGREGAR_RANGOS = {
+    'sqlite': f"GROUP_CONCAT(RANGO, '{SEPARADOR_RANGOS}')",
+    'mssql': f"STRING_AGG(RANGO, '{SEPARADOR_RANGOS}')",
+}
+
+
+# ==========================================================
+#   ROLLUPS
+# ==========================================================
+def _days(serie):
+    """Fecha normalizada a día (texto, categoría o datetime); inválidas -> NaT."""
+    if not pd.api.types.is_datetime64_any_dtype(serie):
+        serie = pd.to_datetime(serie.astype(object), errors='coerce')
+    return serie.dt.normalize()
+
+
+def contributions(df, column, distinct):
+    """
+    Cuentas por celda (DIA, ESTADO, RANGO) de las filas de df para una serie.
+    Con `distinct`, pacientes distintos: RANGO es el conjunto de rangos del paciente.
+    """
+    if df is None or df.empty or column not in df.columns or 'CEDULA' not in df.columns:
+        return pd.Series(dtype='int64', index=pd.MultiIndex.from_arrays([[], [], []], names=ROLLUP_INDEX))
+
+    estado = df['ESTADO'].astype(object) if 'ESTADO' in df.columns else pd.Series(None, index=df.index)
+    rango = df['RANGO_DE_EDAD'].astype(object) if 'RANGO_DE_EDAD' in df.columns else pd.Series(None, index=df.index)
+    celdas = pd.DataFrame({
+        'DIA': _days(df[column]),
+        'ESTADO': estado.where(estado.notna(), SIN_ESTADO).astype(str),
+        'RANGO': rango.where(rango.notna(), SIN_DATO_RANGO).astype(str),
+        'CEDULA': df['CEDULA'].astype(object),
+    }).dropna(subset=['DIA'])
+
+    if not distinct:
+        return celdas.groupby(ROLLUP_INDEX).size()
+
+    # Conjunto de rangos de cada paciente como máscara de bits (RANGO_DE_EDAD tiene pocos valores):
+    # la unión es una suma sobre filas sin duplicados y el texto se arma una vez por máscara distinta
+    unicas = celdas.drop_duplicates()
+    nombres = sorted(unicas['RANGO'].unique())
+    bits = np.left_shift(1, pd.Categorical(unicas['RANGO'], categories=nombres).codes.astype('int64'))
+    mascaras = unicas.assign(RANGO=bits).groupby(['DIA', 'ESTADO', 'CEDULA'], sort=False)['RANGO'].sum()
+    etiquetas = {
+        int(m): SEPARADOR_RANGOS.join(n for i, n in enumerate(nombres) if int(m) >> i & 1)
+        for m in mascaras.unique()
+    }
+    return mascaras.map(etiquetas).reset_index().groupby(ROLLUP_INDEX).size()
+
+
+def _canonical_ranges(rangos):
+    """Conjunto de rangos con los nombres ordenados (la base no garantiza el orden de la unión)."""
+    return rangos.map(lambda texto: SEPARADOR_RANGOS.join(sorted(set(texto.split(SEPARADOR_RANGOS)))))
+
+
+def _combine(base, restar, sumar):
+    total = base.sub(restar, fill_value=0).add(sumar, fill_value=0)
+    return total[total > 0].astype('int64')
+
+
+class TimelineRollups:
+    """Rollups diarios de una versión de datos (inmutables: apply_delta retorna otros)."""
+
+    def __init__(self, rollups, version=None):
+        self.rollups = rollups   # columna -> Serie de cuentas indexada por (DIA, ESTADO, RANGO)
+        self.version = version
+
+    @classmethod
+    def from_frame(cls, df, version=None):
+        return cls({
+            column: contributions(df, column, distinct)
+            for column, (_, _, distinct) in TIMELINE_SERIES.items()
+        }, version)
+
+    def apply_delta(self, removed, added, version):
+        """Rollups tras reemplazar las filas `removed` de los pacientes modificados por `added`."""
+        return TimelineRollups({
+            column: _combine(self.rollups[column], contributions(removed, column, distinct),
+                             contributions(added, column, distinct))
+            for column, (_, _, distinct) in TIMELINE_SERIES.items()
+        }, version)
+
+    def series(self, column, spec, granularidad='Día'):
+        """
+        Serie (fecha, n) de la columna con el estado y los rangos del FilterSpec.
+        Retorna (df_serie, etiqueta del periodo efectivo tras el muestreo).
+        """
+        rollup = self.rollups.get(column)
+        if rollup is None or rollup.empty:
+            return pd.DataFrame({'FECHA': pd.Series(dtype='datetime64[ns]'), 'N': pd.Series(dtype='int64')}), granularidad
+
+        celdas = rollup.reset_index(name='N')
+        distinct = TIMELINE_SERIES[column][2]
+        if spec.estado:
+            celdas = celdas[celdas['ESTADO'] == spec.estado]
+        if spec.rangos and distinct:
+            # Cada paciente está en una sola celda: la de sus rangos; cuenta si alguno está elegido
+            elegidos = set(spec.rangos)
+            tocan = [c for c in celdas['RANGO'].unique() if elegidos.intersection(c.split(SEPARADOR_RANGOS))]
+            celdas = celdas[celdas['RANGO'].isin(tocan)]
+        elif spec.rangos:
+            celdas = celdas[celdas['RANGO'].isin(spec.rangos)]
+
+        diaria = celdas.groupby('DIA')['N'].sum()
+        return _resample(diaria, granularidad)
+
+
+def _resample(diaria, granularidad):
+    """Agrega la serie diaria al periodo pedido; si quedan más de MAX_POINTS puntos, en bloques de días."""
+    if diaria.empty:
+        return pd.DataFrame({'FECHA': diaria.index, 'N': diaria.values}), granularidad
+
+    dias = diaria.index
+    if granularidad == 'Semana':
+        periodo = dias.to_period('W').start_time
+    elif granularidad == 'Mes':
+        periodo = dias.to_period('M').start_time
+    else:
+        periodo = dias
+    serie = diaria.groupby(periodo).sum()
+
+    etiqueta = granularidad
+    if len(serie) > MAX_POINTS:
+        # Bloques de k días desde la primera fecha: como mucho MAX_POINTS puntos
+        tramo = (serie.index.max() - serie.index.min()).days + 1
+        k = math.ceil(tramo / MAX_POINTS)
+        bloque = serie.index.min() + pd.to_timedelta((serie.index - serie.index.min()).days // k * k, unit='D')
+        serie = serie.groupby(bloque).sum()
+        etiqueta = f"{k} días"
+
+    return pd.DataFrame({'FECHA': serie.index, 'N': serie.values}), etiqueta
+
+
+def fetch_rollups(dialect):
+    """Los mismos rollups calculados en la base (modo con filtros en la base de datos)."""
+    dias = {
+        'FECHA_DE_RECIBIDO': date_sql('P.FECHA_DE_RECIBIDO', dialect),
+        'FECHA_TOMA_MUESTRA': toma_day_sql('F.FECHA_TOMA_MUESTRA', dialect),
+    }
+    rango = f"COALESCE(F.RANGO_DE_EDAD, '{SIN_DATO_RANGO}')"
+
+    rollups = {}
+    for column, (_, _, distinct) in TIMELINE_SERIES.items():
+        if distinct:
+            celdas = run_query(DISTINCT_ROLLUP_QUERY.format(dia=dias[column], rango=rango,
+                                                            agregar_rangos=AGREGAR_RANGOS[dialect]))
+            celdas['RANGO'] = _canonical_ranges(celdas['RANGO'].astype(str))
+        else:
+            celdas = run_query(ROLLUP_QUERY.format(dia=dias[column], rango=rango))
+        celdas['DIA'] = pd.to_datetime(celdas['DIA'], errors='coerce')
+        celdas = celdas[celdas['DIA'] >= pd.Timestamp('1900-01-01')]
+        # Tras normalizar el orden de los rangos dos filas pueden ser la misma celda
+        rollups[column] = celdas.groupby(ROLLUP_INDEX)['N'].sum().astype('int64')
+    return TimelineRollups(rollups)
+
+
+class RollupStore(VersionedStore):
+    """
+    Último rollup calculado en el proceso. Con el delta del cargador
+    (IncrementalLoader.last_delta) desde la versión guardada, se actualiza en lugar
+    de recalcularse; si no, se reconstruye desde el frame.
+    """
+
+    def __init__(self):
+        super().__init__(TimelineRollups.from_frame)
+
+
+# ==========================================================
+#   INTERFAZ
+# ==========================================================
+def render_timeline_panel(rollups, spec, key='linea_tiempo'):
+    """Gráficos de la línea de tiempo para la selección activa."""
+    st.markdown("### 📈 Línea de Tiempo")
+    granularidad = st.radio("Agrupar por", GRANULARIDADES, horizontal=True, key=f"{key}_granularidad")
+
+    columnas = st.columns(len(TIMELINE_SERIES))
+    for col, (column, (titulo, medida, _)) in zip(columnas, TIMELINE_SERIES.items()):
+        df_serie, etiqueta = rollups.series(column, spec, granularidad)
+        with col:
+            if df_serie.empty:
+                st.info(f"Sin fechas válidas en {column}.")
+                continue
+
+            fig = px.bar(df_serie, x='FECHA', y='N', title=titulo, labels={'FECHA': etiqueta, 'N': medida})
+            if spec.has_date_range:
+                fig.add_vrect(x0=spec.fecha_desde, x1=spec.fecha_hasta + timedelta(days=1),
+                              fillcolor='gray', opacity=0.12, line_width=0)
+            fig.update_layout(margin=dict(l=10, r=10, t=40, b=10), height=320)
+            st.plotly_chart(fig, use_container_width=True)
+            if etiqueta != granularidad:
+                st.caption(f"Serie agrupada en bloques de {etiqueta} (más de {MAX_POINTS} puntos).")
@@ -0,0 +1,272 @@
+# typed_schema.py
+"""
+Esquema tipado de tmz_data: fechas como DATE y contadores como INT, con índices.
+
+El esquema original guarda todo como NVARCHAR: FECHA_TOMA_MUESTRA es un número
+serial de Excel en texto y FECHA_DE_RECIBIDO un texto con hora, así que cada
+filtro por fecha convierte la columna fila por fila (TRY_CONVERT / date()) y no
+puede usar un índice. Con el esquema tipado la conversión se hace una vez, en el
+ETL, y los filtros comparan la columna directamente (búsqueda en el índice).
+
+- infer_column_types(df) / infer_types_from_chunks(chunks): tipo lógico ('date' |
+  'int' | 'text') de cada columna. El nombre propone el tipo (FECHA* -> date,
+  INT_COLUMNS -> int) y todas las filas lo confirman: basta un valor no
+  convertible para dejar la columna como texto.
+- convert_for_schema(df, types, dialect): valores del Excel (texto) convertidos
+  a los tipos de la tabla destino, leídos del catálogo con read_column_types().
+  Un valor no vacío que no cumple el tipo detiene la carga (TypeConversionError):
+  nunca se carga como NULL. Contra una tabla del esquema original no cambia nada.
+- index_statements(): índices no agrupados sobre las columnas de los filtros y
+  del JOIN (o un índice columnstore en Azure SQL).
+- La app registra los tipos de la base conectada (register_schema) para que las
+  expresiones SQL de fechas (date_sql / toma_day_sql) sean las del esquema real;
+  tras migrar el esquema hay que reiniciar la app.
+"""
+
+import numpy as np
+import pandas as pd
+
+SCHEMA = 'tmz_data'
+
+SQL_TYPES = {
+    'mssql': {'date': 'DATE', 'int': 'INT', 'text': 'NVARCHAR(255)'},
+    'sqlite': {'date': 'DATE', 'int': 'INTEGER', 'text': 'TEXT'},
+}
+
+# Columnas numéricas conocidas (las de fecha se reconocen por el nombre)
+INT_COLUMNS = ('EDAD', 'MES_DE_TOMA', 'ORDEN_X_MES', 'FASE_ORDEN')
+
+# Columnas gestionadas por la base (no se convierten ni se infieren)
+IGNORED_COLUMNS = ('VERSION_FILA',)
+
+# Índices no agrupados por tabla (además de uno por cada columna DATE)
+INDEXED_COLUMNS = {
+    'Pacientes_tmz': ('ESTADO',),
+    'FasePaciente': ('PACIENTE_CEDULA',),
+}
+# Columnas del índice columnstore (sin NVARCHAR(MAX) ni ROWVERSION, que no admite)
+COLUMNSTORE_COLUMNS = {
+    'Pacientes_tmz': ('CEDULA', 'ESTADO', 'FECHA_DE_RECIBIDO', 'MES_DE_TOMA'),
+    'FasePaciente': ('PACIENTE_CEDULA', 'FECHA_TOMA_MUESTRA', 'GENERO', 'EDAD', 'RANGO_DE_EDAD',
+                     'DEPARTAMENTO', 'CIUDAD', 'EPS'),
+}
+
+# Rango de seriales de Excel válidos (1900-01-01 a 9999-12-31)
+EXCEL_SERIAL_RANGE = (1, 2958465)
+EXCEL_ORIGIN = '1899-12-30'
+# Fechas escritas a mano en el Excel: día primero ('25/8/2025')
+DAY_FIRST_FORMAT = '%d/%m/%Y'
+
+
+class TypeConversionError(ValueError):
+    """Un valor no vacío no se puede convertir al tipo de la columna destino."""
+
+
+# ==========================================================
+#   CONVERSIÓN DE VALORES
+# ==========================================================
+def _texts(serie):
+    """Valores como texto sin espacios; vacíos y nulos como NaN."""
+    texto = serie.astype(object).where(serie.notna(), None).astype(str).str.strip()
+    return texto.where(serie.notna() & (texto != ''), np.nan)
+
+
+def parse_dates(serie):
+    """
+    Fechas (datetime64, a día) desde seriales de Excel ('45878'), texto ISO
+    ('2025-08-04 00:00:00'), texto con el día primero ('25/8/2025') u objetos
+    date/datetime. Lo no convertible queda NaT.
+    """
+    if pd.api.types.is_datetime64_any_dtype(serie):
+        return serie.dt.normalize()
+    texto = _texts(serie)
+    numeros = pd.to_numeric(texto, errors='coerce')
+    es_serial = numeros.between(*EXCEL_SERIAL_RANGE)
+
+    fechas = pd.to_datetime(texto.where(~es_serial), errors='coerce', format='ISO8601')
+    dia_primero = fechas.isna() & texto.notna() & ~es_serial
+    if dia_primero.any():
+        fechas = fechas.where(~dia_primero, pd.to_datetime(
+            texto.where(dia_primero), errors='coerce', format=DAY_FIRST_FORMAT))
+    seriales = pd.to_datetime(numeros.where(es_serial), unit='D', origin=EXCEL_ORIGIN, errors='coerce')
+    return fechas.where(~es_serial, seriales).dt.normalize()
+
+
+def parse_ints(serie):
+    """Enteros (Int64) desde texto; lo no entero (o no numérico) queda nulo."""
+    numeros = pd.to_numeric(_texts(serie), errors='coerce')
+    enteros = numeros.where(numeros == np.floor(numeros))
+    return enteros.astype('Int64')
+
+
+PARSERS = {'date': parse_dates, 'int': parse_ints}
+
+
+def _candidate(column):
+    if 'FECHA' in column:
+        return 'date'
+    if column in INT_COLUMNS:
+        return 'int'
+    return None
+
+
+def infer_types_from_chunks(chunks):
+    """
+    {columna: 'date' | 'int' | 'text'} sobre todas las filas de un libro leído por
+    bloques (en memoria solo hay un bloque). Un tipo se confirma si todos los
+    valores no vacíos lo cumplen; una columna sin datos queda como texto.
+    """
+    candidatos, con_datos = {}, set()
+    for chunk in chunks:
+        for col in chunk.columns:
+            if col in IGNORED_COLUMNS:
+                continue
+            tipo = candidatos.setdefault(col, _candidate(col))
+            if tipo is None:
+                continue
+            presentes = _texts(chunk[col]).notna()
+            if presentes.any():
+                con_datos.add(col)
+                if PARSERS[tipo](chunk[col])[presentes].isna().any():
+                    candidatos[col] = None
+    return {col: tipo if tipo and col in con_datos else 'text' for col, tipo in candidatos.items()}
+
+
+def infer_column_types(df):
+    """infer_types_from_chunks() de un DataFrame completo."""
+    return infer_types_from_chunks([df])
+
+
+def convert_for_schema(df, types, dialect, table_name=None):
+    """
+    Convierte las columnas tipadas de la tabla destino. Un valor no vacío que no
+    cumple el tipo lanza TypeConversionError (no se carga como NULL).
+    Las fechas van como date en Azure y como texto ISO en SQLite (sin adaptadores).
+    """
+    tipadas = [col for col in df.columns if types.get(col, 'text') != 'text']
+    if not tipadas:
+        return df
+
+    df = df.copy(deep=False)
+    for col in tipadas:
+        convertidos = PARSERS[types[col]](df[col])
+        perdidos = _texts(df[col])[convertidos.isna()].dropna()
+        if len(perdidos):
+            etiqueta = {'date': 'fechas', 'int': 'enteros'}[types[col]]
+            ejemplos = ", ".join(repr(v) for v in perdidos.unique()[:3])
+            raise TypeConversionError(
+                f"[{table_name or 'tabla'}]: {len(perdidos)} valores de {col} no son {etiqueta} "
+                f"(p. ej. {ejemplos}). Corrija el Excel o cree la columna como texto."
+            )
+
+        if types[col] == 'date':
+            valores = convertidos.dt.date if dialect == 'mssql' else convertidos.dt.strftime('%Y-%m-%d')
+        else:
+            valores = convertidos.astype(object)
+        df[col] = valores.astype(object).where(convertidos.notna(), None)
+    return df
+
+
+# ==========================================================
+#   CATÁLOGO E ÍNDICES
+# ==========================================================
+MSSQL_COLUMNS_QUERY = """
+    SELECT COLUMN_NAME, DATA_TYPE FROM INFORMATION_SCHEMA.COLUMNS
+    WHERE TABLE_SCHEMA = ? AND TABLE_NAME = ?
+"""
+
+
+def _logical_type(sql_type):
+    sql_type = (sql_type or '').lower()
+    if sql_type.startswith('date') or sql_type.startswith('smalldatetime'):
+        return 'date'
+    if sql_type in ('int', 'integer', 'bigint', 'smallint', 'tinyint'):
+        return 'int'
+    return 'text'
+
+
+def connection_dialect(conn):
+    return 'sqlite' if type(conn).__module__.split('.')[0] == 'sqlite3' else 'mssql'
+
+
+def read_column_types(conn, table_name):
+    """Tipos lógicos de las columnas de tmz_data.<table_name> según el catálogo ({} si no existe)."""
+    cursor = conn.cursor()
+    try:
+        if connection_dialect(conn) == 'sqlite':
+            cursor.execute(f"PRAGMA {SCHEMA}.table_info('{table_name}')")
+            filas = [(row[1], row[2]) for row in cursor.fetchall()]
+        else:
+            cursor.execute(MSSQL_COLUMNS_QUERY, (SCHEMA, table_name))
+            filas = [tuple(row) for row in cursor.fetchall()]
+    finally:
+        cursor.close()
+    return {col: _logical_type(tipo) for col, tipo in filas if col not in IGNORED_COLUMNS}
+
+
+def index_statements(table_name, types, dialect, qualified_name=None, columnstore=False):
+    """
+    CREATE INDEX de la tabla: ESTADO / PACIENTE_CEDULA y las columnas DATE, o en
+    Azure (columnstore=True) un índice columnstore no agrupado sobre las columnas
+    del dashboard. `qualified_name` es el nombre con el que se crea la tabla.
+    """
+    nombre = qualified_name or f"{SCHEMA}.{table_name}"
+    if columnstore and dialect == 'mssql':
+        columnas = [col for col in COLUMNSTORE_COLUMNS.get(table_name, ()) if col in types]
+        return [f"CREATE NONCLUSTERED COLUMNSTORE INDEX NCCI_{table_name} ON {nombre} "
+                f"({', '.join(f'[{col}]' for col in columnas)})"] if columnas else []
+
+    columnas = [col for col in INDEXED_COLUMNS.get(table_name, ()) if col in types]
+    columnas += [col for col, tipo in types.items() if tipo == 'date']
+    if dialect == 'mssql':
+        return [f"CREATE NONCLUSTERED INDEX IX_{table_name}_{col} ON {nombre} ([{col}])" for col in columnas]
+    # En SQLite el índice se crea en el esquema de la tabla y se nombra sin él
+    esquema, _, tabla = nombre.rpartition('.')
+    prefijo = f"{esquema}." if esquema else ""
+    return [f"CREATE INDEX IF NOT EXISTS {prefijo}IX_{table_name}_{col} ON {tabla} ([{col}])" for col in columnas]
+
+
+# ==========================================================
+#   EXPRESIONES SQL SEGÚN EL ESQUEMA DE LA BASE CONECTADA
+# ==========================================================
+# Tipos registrados de la base del dashboard: {tabla: {columna: tipo}} (vacío = esquema original)
+_SCHEMA_TYPES = {}
+
+# Fecha de un texto (FECHA_DE_RECIBIDO en el esquema original)
+DATE_EXPR = {
+    'mssql': "TRY_CONVERT(date, {col})",
+    'sqlite': "date({col})",
+}
+# Día de un número serial de Excel guardado como texto (FECHA_TOMA_MUESTRA en el esquema original)
+SERIAL_DAY_EXPR = {
+    'mssql': "CAST(DATEADD(day, FLOOR(TRY_CONVERT(float, NULLIF({col}, ''))), '1899-12-30') AS date)",
+    'sqlite': "date('1899-12-30', '+' || CAST(CAST(NULLIF({col}, '') AS REAL) AS INTEGER) || ' days')",
+}
+
+
+def register_schema(types):
+    """Registra los tipos de la base conectada ({tabla: {columna: tipo}})."""
+    _SCHEMA_TYPES.clear()
+    _SCHEMA_TYPES.update(types)
+
+
+def read_schema(conn):
+    return {table_name: read_column_types(conn, table_name) for table_name in ('Pacientes_tmz', 'FasePaciente')}
+
+
+def is_typed(table_name, column, tipo='date', types=None):
+    """¿La columna tiene ese tipo en `types` (por defecto, el esquema registrado)?"""
+    types = _SCHEMA_TYPES if types is None else types
+    return types.get(table_name, {}).get(column) == tipo
+
+
+def date_sql(col_ref, dialect, table_name='Pacientes_tmz', column='FECHA_DE_RECIBIDO', types=None):
+    """Fecha de recibido como DATE: la columna misma si es DATE (admite índice), si no convertida."""
+    return col_ref if is_typed(table_name, column, types=types) else DATE_EXPR[dialect].format(col=col_ref)
+
+
+def toma_day_sql(col_ref, dialect, types=None):
+    """Día de FECHA_TOMA_MUESTRA: la columna si es DATE, si no desde el serial de Excel."""
+    if is_typed('FasePaciente', 'FECHA_TOMA_MUESTRA', types=types):
+        return col_ref
+    return SERIAL_DAY_EXPR[dialect].format(col=col_ref)
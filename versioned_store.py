@@ -0,0 +1,38 @@
+# versioned_store.py
+"""
+Última versión de una estructura derivada del dataset (rollups de la línea de
+tiempo, índice de búsqueda), una por proceso.
+
+La estructura guardada se actualiza con el delta del cargador
+(IncrementalLoader.last_delta) cuando va de su versión a la pedida; si no, se
+reconstruye desde el frame. La estructura debe tener `version` y
+`apply_delta(removed, added, version)`, que retorna una nueva sin modificar la
+anterior (quien la esté leyendo la sigue viendo intacta).
+"""
+
+import threading
+
+
+class VersionedStore:
+    """Guarda lo que retorna `build(df, version)` y lo actualiza con los deltas del cargador."""
+
+    def __init__(self, build):
+        self.build = build
+        self.current = None
+        self.last_mode = None          # 'incremental' o 'completo'
+        self._lock = threading.Lock()
+
+    def get(self, df, version, delta=None):
+        with self._lock:
+            actual = self.current
+            if actual is not None and actual.version == version:
+                return actual
+
+            if (actual is not None and delta is not None
+                    and delta['from_version'] == actual.version and delta['to_version'] == version):
+                self.current = actual.apply_delta(delta['removed'], delta['added'], version)
+                self.last_mode = 'incremental'
+            else:
+                self.current = self.build(df, version)
+                self.last_mode = 'completo'
+            return self.current